@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+In-memory BM25 index for content search
+Incremental inserts, heap-based top-k retrieval and source (ACT/QUIP) faceting
+"""
+
+import heapq
+import math
+import re
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'by', 'for', 'from', 'in', 'is', 'it', 'me', 'of',
+    'on', 'or', 'show', 'the', 'to', 'with', 'find', 'list', 'about', 'related'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall((text or '').lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    BM25 over title, tags and description.
+
+    Documents can be added at any time: postings, document frequencies and the
+    average length are updated in place, and length norms are recomputed lazily on
+    the next search. Each queried term keeps its postings sorted by BM25 impact
+    (rebuilt after inserts), and top-k retrieval walks those lists with the
+    threshold algorithm, so a query reads only the head of each posting list.
+    """
+
+    FIELD_WEIGHTS = {'title': 2.0, 'tags': 1.5, 'description': 1.0}
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, field_weights: Optional[Dict[str, float]] = None):
+        self.k1 = k1
+        self.b = b
+        self.field_weights = field_weights or self.FIELD_WEIGHTS
+        self.items: List[Dict[str, Any]] = []
+        self.sources: List[str] = []
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._lengths: List[float] = []
+        self._total_length = 0.0
+        self._norms: List[float] = []
+        self._impact_cache: Dict[str, Tuple[int, List[Tuple[float, int]]]] = {}
+        self._source_ids: Dict[str, Set[int]] = {}
+
+    def add(self, item: Dict[str, Any], source: str = 'ACT') -> int:
+        """Index one item and return its doc id"""
+        doc_id = len(self.items)
+        source = source.upper()
+        self.items.append(item)
+        self.sources.append(source)
+        self._source_ids.setdefault(source, set()).add(doc_id)
+
+        # Field-weighted term frequencies
+        weighted_tf: Dict[str, float] = {}
+        length = 0.0
+        for field, weight in self.field_weights.items():
+            value = item.get(field)
+            if isinstance(value, list):
+                value = ' '.join(value)
+            for token in tokenize(value):
+                weighted_tf[token] = weighted_tf.get(token, 0.0) + weight
+                length += weight
+
+        for token, tf in weighted_tf.items():
+            self._postings.setdefault(token, {})[doc_id] = tf
+        self._lengths.append(length)
+        self._total_length += length
+        return doc_id
+
+    def __len__(self):
+        return len(self.items)
+
+    def _ensure_norms(self):
+        """Recompute k1 * (1 - b + b * dl / avgdl) per doc after inserts"""
+        if len(self._norms) == len(self._lengths):
+            return
+        avgdl = self._total_length / len(self._lengths) if self._lengths else 1.0
+        avgdl = avgdl or 1.0
+        k1, b = self.k1, self.b
+        self._norms = [k1 * (1 - b + b * length / avgdl) for length in self._lengths]
+
+    def idf(self, term: str) -> float:
+        df = len(self._postings.get(term, ()))
+        n = len(self.items)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _impacts(self, term: str) -> List[Tuple[float, int]]:
+        """(impact, doc_id) for a term, highest first; cached until the next insert"""
+        cached = self._impact_cache.get(term)
+        if cached is not None and cached[0] == len(self.items):
+            return cached[1]
+        k1, norms = self.k1, self._norms
+        impacts = sorted(((tf * (k1 + 1) / (tf + norms[doc_id]), doc_id)
+                          for doc_id, tf in self._postings[term].items()), reverse=True)
+        self._impact_cache[term] = (len(self.items), impacts)
+        return impacts
+
+    def _score(self, doc_id: int, weighted_terms: List[Tuple[float, str]]) -> float:
+        """Full BM25 score of one document"""
+        k1, norm = self.k1, self._norms[doc_id]
+        score = 0.0
+        for idf, term in weighted_terms:
+            tf = self._postings[term].get(doc_id)
+            if tf:
+                score += idf * tf * (k1 + 1) / (tf + norm)
+        return score
+
+    def search(self, query: str, k: int = 5, source: Optional[str] = None,
+               candidates: Optional[Set[int]] = None) -> List[Tuple[float, int]]:
+        """
+        Top-k (score, doc_id) pairs, best first.
+
+        source restricts results to one facet value (e.g. "ACT" or "QUIP");
+        candidates restricts them to a precomputed id set.
+        """
+        terms = [t for t in dict.fromkeys(tokenize(query)) if t in self._postings]
+        if not terms or k <= 0:
+            return []
+        self._ensure_norms()
+
+        allowed = candidates
+        if source:
+            source_ids = self._source_ids.get(source.upper(), set())
+            allowed = source_ids if allowed is None else allowed & source_ids
+            if not allowed:
+                return []
+
+        weighted_terms = [(self.idf(t), t) for t in terms]
+        lists = [self._impacts(t) for _, t in weighted_terms]
+        cursors = [0] * len(lists)
+        frontier = [weighted_terms[j][0] * lists[j][0][0] for j in range(len(lists))]
+        seen: Set[int] = set()
+        heap: List[Tuple[float, int]] = []
+
+        # Threshold algorithm: read each impact list in order and score every new
+        # document fully; stop once the k-th best beats any unseen document's bound
+        while True:
+            progressed = False
+            for j, impacts in enumerate(lists):
+                position = cursors[j]
+                if position >= len(impacts):
+                    frontier[j] = 0.0
+                    continue
+                progressed = True
+                impact, doc_id = impacts[position]
+                cursors[j] = position + 1
+                frontier[j] = weighted_terms[j][0] * impact
+                if doc_id in seen or (allowed is not None and doc_id not in allowed):
+                    continue
+                seen.add(doc_id)
+                entry = (self._score(doc_id, weighted_terms), doc_id)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+            if not progressed or (len(heap) >= k and heap[0][0] >= sum(frontier)):
+                break
+
+        return sorted(heap, reverse=True)
+
+    def facet_counts(self, query: str) -> Dict[str, int]:
+        """Number of matching documents per source"""
+        matched: Set[int] = set()
+        for term in set(tokenize(query)):
+            matched.update(self._postings.get(term, ()))
+        counts: Dict[str, int] = {}
+        for doc_id in matched:
+            counts[self.sources[doc_id]] = counts.get(self.sources[doc_id], 0) + 1
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self.items),
+            "terms": len(self._postings),
+            "avg_length": round(self._total_length / len(self.items), 2) if self.items else 0.0
+        }
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Indexed content catalog for ACT courses and Consensus demos
+Tag/source inverted indexes plus sorted numeric columns for range filters
+"""
+
+import bisect
+import json
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Set, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Numeric (and ISO date) fields that support range filters and ordering
+RANGE_FIELDS = ('enrollments', 'view_count', 'completion_rate', 'duration', 'created_date')
+
+MONTHS = {m: i for i, m in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], 1)}
+
+
+@dataclass(frozen=True)
+class RangeFilter:
+    field: str
+    low: Any = None
+    high: Any = None
+    include_low: bool = True
+    include_high: bool = True
+
+
+class ContentCatalog:
+    """
+    In-memory catalog of content items.
+
+    Each item is a dict like the ACT_COURSES / CONSENSUS_DEMOS entries, tagged with
+    a source ("ACT" or "CONSENSUS"). Tags are indexed case-insensitively, and every
+    RANGE_FIELDS column is kept as parallel sorted value/id arrays, rebuilt lazily after
+    writes, so range filters cost two bisects instead of a scan.
+    """
+
+    def __init__(self):
+        self.items: List[Dict[str, Any]] = []
+        self.sources: List[str] = []
+        self._tag_index: Dict[str, Set[int]] = {}
+        self._source_index: Dict[str, Set[int]] = {}
+        self._columns: Dict[str, tuple] = {}
+        self._dirty = False
+
+    @classmethod
+    def from_jsonl(cls, path: str, default_source: str = 'ACT') -> 'ContentCatalog':
+        """Load a catalog from a JSONL file, one item per line"""
+        catalog = cls()
+        catalog.load_jsonl(path, default_source)
+        return catalog
+
+    def load_jsonl(self, path: str, default_source: str = 'ACT') -> int:
+        """Append items from a JSONL file; an item's "source" key overrides default_source"""
+        count = 0
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                self.add(item, item.pop('source', default_source))
+                count += 1
+        logger.info(f"Loaded {count} catalog items from {path}")
+        return count
+
+    def add(self, item: Dict[str, Any], source: str) -> int:
+        """Add one item and return its id"""
+        item_id = len(self.items)
+        source = source.upper()
+        self.items.append(item)
+        self.sources.append(source)
+        self._source_index.setdefault(source, set()).add(item_id)
+        for tag in item.get('tags', []):
+            self._tag_index.setdefault(tag.lower(), set()).add(item_id)
+        self._dirty = True
+        return item_id
+
+    def add_many(self, items: Iterable[Dict[str, Any]], source: str):
+        for item in items:
+            self.add(item, source)
+
+    def _ensure_columns(self):
+        """Rebuild sorted range columns after writes"""
+        if not self._dirty:
+            return
+        self._columns = {}
+        for field in RANGE_FIELDS:
+            values = [item.get(field) for item in self.items]
+            ids = sorted((i for i, v in enumerate(values) if v is not None), key=values.__getitem__)
+            self._columns[field] = ([values[i] for i in ids], ids)
+        self._dirty = False
+
+    def ids_for_tag(self, tag: str) -> Set[int]:
+        return self._tag_index.get(tag.lower(), set())
+
+    def ids_for_source(self, source: str) -> Set[int]:
+        return self._source_index.get(source.upper(), set())
+
+    def range_ids(self, flt: RangeFilter) -> Set[int]:
+        """Ids whose field falls inside the filter's bounds"""
+        self._ensure_columns()
+        values, ids = self._columns.get(flt.field, ([], []))
+        start = 0
+        end = len(values)
+        if flt.low is not None:
+            start = (bisect.bisect_left if flt.include_low else bisect.bisect_right)(values, flt.low)
+        if flt.high is not None:
+            end = (bisect.bisect_right if flt.include_high else bisect.bisect_left)(values, flt.high)
+        return set(ids[start:end])
+
+    def max_value(self, field: str) -> Any:
+        self._ensure_columns()
+        values = self._columns.get(field, ([], []))[0]
+        return values[-1] if values else None
+
+    def query(self, source: Optional[str] = None, tag: Optional[str] = None,
+              filters: Optional[List[RangeFilter]] = None, order_by: Optional[str] = None,
+              descending: bool = True, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Items matching every given constraint (see query_ids)"""
+        return [self.items[i] for i in self.query_ids(source, tag, filters, order_by, descending, limit)]
+
+    def query_ids(self, source: Optional[str] = None, tag: Optional[str] = None,
+                  filters: Optional[List[RangeFilter]] = None, order_by: Optional[str] = None,
+                  descending: bool = True, limit: Optional[int] = None) -> List[int]:
+        """
+        Ids of items matching every given constraint.
+
+        Candidate sets are intersected smallest first. Without order_by, results keep
+        insertion order; with it, the sorted column is walked so a limit stops early.
+        """
+        candidate_sets = []
+        if source:
+            candidate_sets.append(self.ids_for_source(source))
+        if tag:
+            candidate_sets.append(self.ids_for_tag(tag))
+        for flt in filters or []:
+            candidate_sets.append(self.range_ids(flt))
+
+        if candidate_sets:
+            candidate_sets.sort(key=len)
+            matched = set(candidate_sets[0])
+            for ids in candidate_sets[1:]:
+                matched &= ids
+                if not matched:
+                    break
+        else:
+            matched = set(range(len(self.items)))
+
+        if order_by:
+            self._ensure_columns()
+            ordered = self._columns.get(order_by, ([], []))[1]
+            ordered_ids = []
+            for item_id in (reversed(ordered) if descending else ordered):
+                if item_id in matched:
+                    ordered_ids.append(item_id)
+                    if limit is not None and len(ordered_ids) >= limit:
+                        break
+        else:
+            ordered_ids = sorted(matched)[:limit] if limit is not None else sorted(matched)
+        return ordered_ids
+
+    def __len__(self):
+        return len(self.items)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "items": len(self.items),
+            "tags": len(self._tag_index),
+            "sources": {source: len(ids) for source, ids in self._source_index.items()}
+        }
+
+
+def _parse_date(month: str, day: str, year: Optional[str], default_year: int) -> str:
+    return f"{int(year) if year else default_year:04d}-{MONTHS[month[:3].lower()]:02d}-{int(day):02d}"
+
+
+def parse_range_filters(text: str, default_year: int) -> List[RangeFilter]:
+    """
+    Range filters from utterances like "enrollment > 2500", "view count > 8000",
+    "completion rate > 77%", "duration < 20 minutes", "created between Jan 1 and
+    Mar 31" and "created in Q1 2024". Dates without a year use default_year.
+    """
+    filters = []
+    comparisons = [
+        (r'enrollments?', 'enrollments'),
+        (r'view\s*count', 'view_count'),
+        (r'completion\s*rate', 'completion_rate'),
+        (r'duration', 'duration'),
+    ]
+    for label, field in comparisons:
+        match = re.search(label + r'\s*(>=|<=|>|<)\s*([\d,]+(?:\.\d+)?)', text, re.IGNORECASE)
+        if not match:
+            continue
+        op, value = match.group(1), float(match.group(2).replace(',', ''))
+        if op.startswith('>'):
+            filters.append(RangeFilter(field, low=value, include_low=(op == '>=')))
+        else:
+            filters.append(RangeFilter(field, high=value, include_high=(op == '<=')))
+
+    month = r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?'
+    match = re.search(r'between\s+' + month + r'\s+(\d{1,2})(?:,?\s+(\d{4}))?\s+and\s+'
+                      + month + r'\s+(\d{1,2})(?:,?\s+(\d{4}))?', text, re.IGNORECASE)
+    if match:
+        filters.append(RangeFilter(
+            'created_date',
+            low=_parse_date(match.group(1), match.group(2), match.group(3), default_year),
+            high=_parse_date(match.group(4), match.group(5), match.group(6), default_year)
+        ))
+    else:
+        match = re.search(r'\bQ([1-4])(?:\s+(\d{4}))?', text, re.IGNORECASE)
+        if match and re.search(r'created', text, re.IGNORECASE):
+            quarter = int(match.group(1))
+            year = int(match.group(2)) if match.group(2) else default_year
+            end_month = quarter * 3
+            end_day = 30 if end_month in (6, 9) else 31
+            filters.append(RangeFilter(
+                'created_date',
+                low=f"{year:04d}-{end_month - 2:02d}-01",
+                high=f"{year:04d}-{end_month:02d}-{end_day:02d}"
+            ))
+    return filters
+
+
+def parse_ranking(text: str) -> Optional[tuple]:
+    """(field, n) for "top N ... by enrollment|view count", else None"""
+    match = re.search(r'top\s+(\d+).*?\bby\s+(enrollments?|view\s*count|completion\s*rate)', text, re.IGNORECASE)
+    if not match:
+        return None
+    label = match.group(2).lower()
+    if label.startswith('enrollment'):
+        field = 'enrollments'
+    elif label.startswith('view'):
+        field = 'view_count'
+    else:
+        field = 'completion_rate'
+    return field, int(match.group(1))
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Aho-Corasick gazetteer for product, OU, country and segment mentions
+One automaton over every alias; a single pass over the text yields all entities
+"""
+
+import logging
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+NORMALIZER_CLS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'force-app', 'main', 'default',
+                              'classes', 'ANAgentNamingNormalizer.cls')
+
+# Apex alias maps and the entity type each one feeds
+APEX_MAPS = {
+    'PRODUCT_FAMILY_MAP': 'product',
+    'OU_ALIAS_MAP': 'ou',
+    'COUNTRY_ALIAS_MAP': 'country',
+    'SEGMENT_ALIAS_MAP': 'segment',
+}
+
+# Aliases this short only match when written in capitals ("US", "CA", "ENT"), never "us" or "can"
+SHORT_ALIAS_LEN = 3
+
+_ENTRY = re.compile(r"'((?:[^'\\]|\\.)*)'\s*=>\s*'((?:[^'\\]|\\.)*)'")
+
+
+def _fold(alias: str) -> str:
+    return re.sub(r'\s+', ' ', alias.strip().lower())
+
+
+def load_apex_maps(path: str = NORMALIZER_CLS) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    (alias, canonical) pairs per entity type from ANAgentNamingNormalizer.cls.
+
+    Returns an empty dict if the class is not shipped alongside the server.
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            source = f.read()
+    except OSError:
+        logger.warning(f"Naming normalizer not found at {path}; gazetteer uses router aliases only")
+        return {}
+
+    maps = {}
+    for map_name, entity_type in APEX_MAPS.items():
+        block = re.search(map_name + r'\s*=\s*new\s+Map<String,\s*String>\s*\{(.*?)\};', source, re.S)
+        if not block:
+            continue
+        body = re.sub(r'//[^\n]*', '', block.group(1))
+        pairs = _ENTRY.findall(body)
+        # Canonical names are aliases of themselves ("SMB - AMER SMB", "South Asia - India")
+        pairs += [(canonical, canonical) for canonical in dict.fromkeys(c for _, c in pairs)]
+        maps[entity_type] = pairs
+    return maps
+
+
+@dataclass(frozen=True)
+class Entity:
+    """One recognised mention: alias is the registered spelling, value the canonical name"""
+    type: str
+    alias: str
+    value: str
+    start: int
+    end: int
+    text: str
+
+
+class Gazetteer:
+    """
+    Aho-Corasick automaton over case-folded aliases of several entity types.
+
+    Aliases are added, then build() compiles goto/fail/output tables once. find()
+    walks the text a single time (runs of whitespace count as one space, so
+    "AMER   ACC" still matches), keeps mentions that sit on word boundaries, and
+    resolves overlaps leftmost-longest across all types: "Marketing Cloud
+    Engagement" is one product, and "South Asia - India" is an OU rather than a
+    country. Scan cost depends on the text, not on the number of aliases.
+    """
+
+    def __init__(self):
+        # alias key -> entity type -> (alias spelling, canonical value, case sensitive)
+        self._aliases: Dict[str, Dict[str, Tuple[str, str, bool]]] = {}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[str]] = [[]]
+        self._built = False
+
+    def add(self, entity_type: str, alias: str, value: str, case_sensitive: Optional[bool] = None,
+            replace: bool = True):
+        """
+        Register alias -> value for an entity type.
+
+        case_sensitive defaults to True for aliases of SHORT_ALIAS_LEN characters
+        or fewer. With replace=False an existing alias of the same type is kept.
+        """
+        key = _fold(alias)
+        if not key:
+            return
+        if case_sensitive is None:
+            case_sensitive = len(key) <= SHORT_ALIAS_LEN
+        by_type = self._aliases.setdefault(key, {})
+        existing = by_type.get(entity_type)
+        if existing and not replace:
+            return
+        if existing and existing[1] == value:
+            # Keep the first spelling of an alias ("CA" over a later "ca"), but take the new case rule
+            by_type[entity_type] = (existing[0], value, case_sensitive)
+        else:
+            by_type[entity_type] = (alias.strip(), value, case_sensitive)
+        self._built = False
+
+    def add_many(self, entity_type: str, pairs: Iterable[Tuple[str, str]], **kwargs):
+        for alias, value in pairs:
+            self.add(entity_type, alias, value, **kwargs)
+
+    def lookup(self, alias: str) -> Dict[str, Tuple[str, str, bool]]:
+        """Registered entries for an exact alias, by entity type"""
+        return dict(self._aliases.get(_fold(alias), {}))
+
+    def rename(self, entity_type: str, old_value: str, new_value: str):
+        """Point every alias of one canonical value at another"""
+        for by_type in self._aliases.values():
+            entry = by_type.get(entity_type)
+            if entry and entry[1] == old_value:
+                by_type[entity_type] = (entry[0], new_value, entry[2])
+
+    def entries(self, types: Optional[Iterable[str]] = None) -> List[Tuple[str, str, str]]:
+        """(entity type, alias spelling, canonical value) for every registered alias"""
+        wanted = set(types) if types is not None else None
+        return [(entity_type, alias, value)
+                for by_type in self._aliases.values()
+                for entity_type, (alias, value, _) in by_type.items()
+                if wanted is None or entity_type in wanted]
+
+    def values(self, entity_type: str) -> List[str]:
+        return sorted({by_type[entity_type][1] for by_type in self._aliases.values() if entity_type in by_type})
+
+    def build(self) -> 'Gazetteer':
+        """Compile the automaton; find() calls this lazily after any add()"""
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[str]] = [[]]
+        for key in self._aliases:
+            state = 0
+            for ch in key:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                state = nxt
+            out[state].append(key)
+
+        # Breadth-first fail links; each state inherits the outputs of its fail state
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0) if goto[f].get(ch, 0) != nxt else 0
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._goto, self._fail, self._out = goto, fail, out
+        self._built = True
+        return self
+
+    def _scan(self, text: str) -> List[Tuple[int, int, str]]:
+        """Every (start, end, alias key) occurrence, in one pass over the text"""
+        goto, fail, out = self._goto, self._fail, self._out
+        positions: List[int] = []  # original index of each folded character consumed
+        hits = []
+        state = 0
+        previous_space = False
+        for i, ch in enumerate(text):
+            # Per-character folding keeps indexes aligned with the original text
+            ch = ch.lower()
+            if ch.isspace():
+                if previous_space:
+                    continue
+                ch, previous_space = ' ', True
+            else:
+                previous_space = False
+            positions.append(i)
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for key in out[state]:
+                hits.append((positions[-len(key)], i + 1, key))
+        return hits
+
+    def find(self, text: str, types: Optional[Iterable[str]] = None) -> List[Entity]:
+        """
+        Non-overlapping entity mentions in text order, leftmost-longest.
+
+        A span that carries several types (e.g. an alias registered as both OU
+        and product) yields one Entity per type; types restricts the output.
+        """
+        if not text:
+            return []
+        if not self._built:
+            self.build()
+        wanted = set(types) if types is not None else None
+
+        candidates = []
+        for start, end, key in self._scan(text):
+            if (start > 0 and text[start - 1].isalnum()) or (end < len(text) and text[end].isalnum()):
+                continue
+            surface = text[start:end]
+            entries = [(entity_type, alias, value) for entity_type, (alias, value, case_sensitive)
+                       in self._aliases[key].items()
+                       if not case_sensitive or surface == surface.upper()]
+            if entries:
+                candidates.append((start, end, surface, entries))
+
+        entities = []
+        covered = 0
+        for start, end, surface, entries in sorted(candidates, key=lambda c: (c[0], c[0] - c[1])):
+            if start < covered:
+                continue
+            covered = end
+            for entity_type, alias, value in entries:
+                if wanted is None or entity_type in wanted:
+                    entities.append(Entity(entity_type, alias, value, start, end, surface))
+        return entities
+
+    def first(self, text: str, entity_type: str) -> Optional[Entity]:
+        """Leftmost mention of one entity type, or None"""
+        for entity in self.find(text):
+            if entity.type == entity_type:
+                return entity
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        if not self._built:
+            self.build()
+        counts: Dict[str, int] = {}
+        for by_type in self._aliases.values():
+            for entity_type in by_type:
+                counts[entity_type] = counts.get(entity_type, 0) + 1
+        return {'aliases': len(self._aliases), 'states': len(self._goto), **counts}
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Typo-tolerant entity resolution for the router
+SymSpell-style deletion index over the OU, product and country vocabularies
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from entity_gazetteer import Entity, Gazetteer
+
+logger = logging.getLogger(__name__)
+
+MAX_EDITS = 2
+MAX_WORDS = 4
+# Only this many leading characters are expanded into deletions (SymSpell's prefix length)
+PREFIX_LENGTH = 7
+
+# Words that never start or end a fuzzy mention ("in AMER AC" is tried as "AMER AC")
+STOPWORDS = {
+    'a', 'all', 'an', 'and', 'are', 'as', 'at', 'by', 'for', 'from', 'have', 'in', 'is', 'me',
+    'my', 'no', 'not', 'of', 'on', 'or', 'show', 'the', 'to', 'who', 'with', 'without'
+}
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9&+]+')
+
+
+def _tokens(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def max_edits(term: str) -> int:
+    """Edit budget for a folded term: none under 5 characters, 1 under 9, else MAX_EDITS"""
+    length = len(term.replace(' ', ''))
+    if length < 5:
+        return 0
+    return 1 if length < 9 else MAX_EDITS
+
+
+def _deletes(term: str, distance: int) -> Set[str]:
+    """term with every combination of up to distance characters removed"""
+    variants = {term}
+    frontier = {term}
+    for _ in range(distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        variants |= frontier
+    return variants
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance (adjacent transpositions cost 1).
+
+    Returns limit + 1 as soon as the distance is known to exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+@dataclass(frozen=True)
+class Suggestion:
+    """A vocabulary term within the edit budget of a query"""
+    term: str
+    distance: int
+    entries: Tuple[Tuple[str, str, str], ...]  # (entity type, alias spelling, canonical value)
+
+
+class FuzzyResolver:
+    """
+    Edit-distance lookups against a fixed vocabulary without scanning it.
+
+    Every term's leading PREFIX_LENGTH characters are indexed under all of their
+    deletions up to the term's edit budget. A query generates the same deletions
+    of its own prefix, and any term within budget shares at least one, so only
+    those few candidates are checked with a real edit distance. Terms shorter
+    than five characters ("UK", "ANZ") are never matched fuzzily, and single
+    words need six, so "stack" does not become Slack.
+    """
+
+    def __init__(self):
+        self._terms: Dict[str, List[Tuple[str, str, str]]] = {}
+        self._deletes: Dict[str, Set[str]] = {}
+        self._max_words = 1
+        self._max_length = 0
+
+    @classmethod
+    def from_gazetteer(cls, gazetteer: Gazetteer, types: Iterable[str] = ('ou', 'product', 'country')) -> 'FuzzyResolver':
+        resolver = cls()
+        for entity_type, alias, value in gazetteer.entries(types):
+            resolver.add(entity_type, alias, value)
+        return resolver
+
+    def add(self, entity_type: str, alias: str, value: str):
+        term = ' '.join(_tokens(alias))
+        budget = max_edits(term)
+        if not budget:
+            return
+        entries = self._terms.setdefault(term, [])
+        if any(e[0] == entity_type for e in entries):
+            return
+        entries.append((entity_type, alias, value))
+        for variant in _deletes(term[:PREFIX_LENGTH], budget):
+            self._deletes.setdefault(variant, set()).add(term)
+        self._max_words = min(MAX_WORDS, max(self._max_words, term.count(' ') + 1))
+        self._max_length = max(self._max_length, len(term))
+
+    def lookup(self, query: str, types: Optional[Iterable[str]] = None) -> Optional[Suggestion]:
+        """Closest vocabulary term for a query, or None if nothing is within budget"""
+        query = ' '.join(_tokens(query))
+        budget = max_edits(query)
+        if not budget or (' ' not in query and len(query) < 6) or len(query) > self._max_length + budget:
+            return None
+        wanted = set(types) if types is not None else None
+
+        candidates: Set[str] = set()
+        for variant in _deletes(query[:PREFIX_LENGTH], budget):
+            candidates |= self._deletes.get(variant, set())
+
+        best = None
+        for term in candidates:
+            limit = min(budget, max_edits(term))
+            distance = edit_distance(query, term, limit)
+            if distance > limit:
+                continue
+            entries = tuple(e for e in self._terms[term] if wanted is None or e[0] in wanted)
+            if not entries:
+                continue
+            # Closest first, then the term sharing the longest prefix, then alphabetical
+            prefix = next((i for i, (x, y) in enumerate(zip(query, term)) if x != y), min(len(query), len(term)))
+            rank = (distance, -prefix, term)
+            if best is None or rank < best[0]:
+                best = (rank, Suggestion(term, distance, entries))
+        return best[1] if best else None
+
+    def find(self, text: str, types: Optional[Iterable[str]] = None,
+             skip: Iterable[Tuple[int, int]] = ()) -> List[Entity]:
+        """
+        Fuzzy mentions in text order, one per type for each matched span.
+
+        Word n-grams up to the longest vocabulary term are looked up, except those
+        overlapping a skip span (exact gazetteer hits) or starting/ending on a
+        stopword. Overlaps keep the closest match, then the longest span.
+        """
+        words = [(m.start(), m.end(), m.group(0)) for m in TOKEN_PATTERN.finditer(text.lower())]
+        skip = list(skip)
+        matches = []
+        for i in range(len(words)):
+            if words[i][2] in STOPWORDS:
+                continue
+            for j in range(i, min(i + self._max_words, len(words))):
+                if words[j][2] in STOPWORDS:
+                    continue
+                start, end = words[i][0], words[j][1]
+                if any(start < s_end and s_start < end for s_start, s_end in skip):
+                    break
+                suggestion = self.lookup(' '.join(w for _, _, w in words[i:j + 1]), types)
+                if suggestion:
+                    matches.append((suggestion.distance, start - end, start, end, suggestion))
+
+        entities = []
+        taken: List[Tuple[int, int]] = []
+        for _, _, start, end, suggestion in sorted(matches, key=lambda m: m[:3]):
+            if any(start < t_end and t_start < end for t_start, t_end in taken):
+                continue
+            taken.append((start, end))
+            for entity_type, alias, value in suggestion.entries:
+                entities.append(Entity(entity_type, alias, value, start, end, text[start:end]))
+                logger.info(f"Fuzzy {entity_type} match: '{text[start:end]}' -> '{alias}' (distance {suggestion.distance})")
+        return sorted(entities, key=lambda e: e.start)
+
+    def stats(self) -> Dict[str, int]:
+        return {'terms': len(self._terms), 'deletes': len(self._deletes)}
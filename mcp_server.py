@@ -9,11 +9,13 @@ import logging
 import re
 import os
 import argparse
-import requests
 from typing import Dict, Any, Optional, List
 from dataclasses import dataclass
-from flask import Flask, request, jsonify
-from dotenv import load_dotenv
+from schema_registry import SchemaRegistry
+from session_store import SessionStore
+
+# Flask, requests and dotenv are imported where they are used, so the router
+# (and `--test`) loads with the standard library only
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -32,7 +34,10 @@ class OpenPipeRequest:
 class OpenPipeRouter:
     """Router for Open Pipe Analysis requests"""
     
-    def __init__(self):
+    def __init__(self, sessions: Optional[SessionStore] = None):
+        # Last routed args per conversation, for follow-ups that omit the OU
+        self.sessions = sessions
+        
         # Stage mapping patterns
         self.stage_patterns = {
             r'post\s+stage\s+(\d+)': lambda m: int(m.group(1)),
@@ -77,13 +82,13 @@ class OpenPipeRouter:
                 return extractor(match)
         return None
 
-    def extract_timeframe(self, text: str) -> str:
+    def extract_timeframe(self, text: str, default: Optional[str] = "CURRENT") -> Optional[str]:
         """Extract timeframe from text"""
         text_lower = text.lower()
         for pattern, timeframe in self.timeframe_patterns.items():
             if re.search(pattern, text_lower):
                 return timeframe
-        return "CURRENT"  # Default
+        return default
 
     def extract_ou_name(self, text: str) -> Optional[str]:
         """Extract OU name from text"""
@@ -128,7 +133,7 @@ class OpenPipeRouter:
             r'filter\s+to\s+([^,]+(?:,\s*[^,]+)*)',
             r'products?\s*:\s*([^,]+(?:,\s*[^,]+)*)',
             r'include\s+([^,]+(?:,\s*[^,]+)*)',
-            r'([A-Za-z\s]+(?:\s+Cloud)?)\s+and\s+([A-Za-z\s]+(?:\s+Cloud)?)',
+            r'\b(\w+\s+Cloud)\s+and\s+(\w+\s+Cloud)\b',
         ]
         
         for pattern in product_patterns:
@@ -141,6 +146,9 @@ class OpenPipeRouter:
                     products = match.group(1).strip()
                 # Clean up and normalize
                 products = re.sub(r'\s+', ' ', products)
+                # "Data Cloud and Sales Cloud only." -> "Data Cloud, Sales Cloud"
+                products = re.sub(r'(?:\s+only)?[\s.;!?]*$', '', products, flags=re.IGNORECASE)
+                products = re.sub(r'\s+and\s+', ', ', products, flags=re.IGNORECASE)
                 return products
         
         # Special case for "Data Cloud and Sales Cloud only"
@@ -149,7 +157,7 @@ class OpenPipeRouter:
         
         return None
 
-    def extract_limit(self, text: str) -> int:
+    def extract_limit(self, text: str, default: Optional[int] = 10) -> Optional[int]:
         """Extract limit from text"""
         # Look for limit patterns
         limit_patterns = [
@@ -164,7 +172,7 @@ class OpenPipeRouter:
             if match:
                 limit = int(match.group(1))
                 return min(limit, 50)  # Cap at 50
-        return 10  # Default
+        return default
 
     def is_valid_request(self, text: str) -> bool:
         """Check if request is valid for open pipe analysis"""
@@ -200,8 +208,14 @@ class OpenPipeRouter:
                 return True
         return False
 
-    def route_request(self, text: str) -> Dict[str, Any]:
-        """Route natural language request to structured parameters"""
+    def route_request(self, text: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Route natural language request to structured parameters.
+        
+        With a session_id, a turn that names no OU is a follow-up: it keeps the
+        previous turn's args and overrides only what it states ("show top 15").
+        A turn that names an OU starts over.
+        """
         
         # Check if request is valid
         if not self.is_valid_request(text):
@@ -215,27 +229,33 @@ class OpenPipeRouter:
                 "error": "Unsupported filter syntax. Provide minStage, productListCsv, ouName, country, timeframe, limitN only."
             }
         
-        # Extract parameters
-        ou_name = self.extract_ou_name(text)
-        if not ou_name:
+        # Extract parameters stated in this turn
+        stated = {
+            "ouName": self.extract_ou_name(text),
+            "country": self.extract_country(text),
+            "minStage": self.extract_min_stage(text),
+            "productListCsv": self.extract_products(text),
+            "timeFrame": self.extract_timeframe(text, default=None),
+            "limitN": self.extract_limit(text, default=None),
+        }
+        previous = self.sessions.get(session_id) if self.sessions is not None and session_id else None
+        if previous is not None and not stated["ouName"]:
+            # Follow-up: merge this turn's args over the previous turn's
+            stated = {**previous.args, **{k: v for k, v in stated.items() if v is not None}}
+        
+        if not stated["ouName"]:
             return {
                 "error": "Operating Unit (ouName) is required. Please specify an OU like 'AMER ACC' or 'EMEA ENTR'."
             }
         
-        country = self.extract_country(text)
-        min_stage = self.extract_min_stage(text)
-        products = self.extract_products(text)
-        timeframe = self.extract_timeframe(text)
-        limit = self.extract_limit(text)
-        
         # Build request
         request = OpenPipeRequest(
-            ouName=ou_name,
-            country=country,
-            minStage=min_stage,
-            productListCsv=products,
-            timeFrame=timeframe,
-            limitN=limit
+            ouName=stated["ouName"],
+            country=stated.get("country"),
+            minStage=stated.get("minStage"),
+            productListCsv=stated.get("productListCsv"),
+            timeFrame=stated.get("timeFrame") or "CURRENT",
+            limitN=stated.get("limitN") or 10
         )
         
         # Convert to dict, removing None values
@@ -252,6 +272,9 @@ class OpenPipeRouter:
         if request.productListCsv:
             args["productListCsv"] = request.productListCsv
         
+        if self.sessions is not None and session_id:
+            self.sessions.put(session_id, "open_pipe_analyze", args)
+        
         return {
             "tool": "open_pipe_analyze",
             "args": args
@@ -260,16 +283,23 @@ class OpenPipeRouter:
 class MCPServer:
     """MCP Server for Open Pipe Analysis"""
     
-    def __init__(self, dry_run: bool = True, sf_base_url: str = None, sf_access_token: str = None):
-        self.router = OpenPipeRouter()
+    def __init__(self, dry_run: bool = True, sf_base_url: str = None, sf_access_token: str = None,
+                 sessions: Optional[SessionStore] = None):
+        # Conversations are keyed by the sessionId sent with /route
+        self.sessions = sessions or SessionStore()
+        self.router = OpenPipeRouter(sessions=self.sessions)
+        # Compiled open_pipe_analyze.schema.json; checked before any Salesforce call
+        self.schemas = SchemaRegistry()
         self.dry_run = dry_run
         self.sf_base_url = sf_base_url
         self.sf_access_token = sf_access_token
+        from flask import Flask
         self.app = Flask(__name__)
         self._setup_routes()
     
     def _setup_routes(self):
         """Setup Flask routes"""
+        from flask import request, jsonify
         
         @self.app.route('/health', methods=['GET'])
         def health():
@@ -277,7 +307,8 @@ class MCPServer:
                 "status": "healthy",
                 "service": "open-pipe-mcp",
                 "dry_run": self.dry_run,
-                "sf_configured": bool(self.sf_base_url and self.sf_access_token)
+                "sf_configured": bool(self.sf_base_url and self.sf_access_token),
+                "sessions": self.sessions.stats()
             })
         
         @self.app.route('/analyze', methods=['POST'])
@@ -287,12 +318,11 @@ class MCPServer:
                 if not data:
                     return jsonify({"error": "No JSON data provided"}), 400
                 
-                # Extract parameters
-                ou_name = data.get('ouName')
-                if not ou_name:
-                    return jsonify({"error": "ouName is required"}), 400
+                # Validate parameters against the tool schema
+                errors = self.schemas.validate('open_pipe_analyze', data)
+                if errors:
+                    return jsonify({"error": "; ".join(errors), "validation_errors": errors}), 400
                 
-                # Validate parameters
                 result = self.open_pipe_analyze(**data)
                 return jsonify(result)
                 
@@ -308,7 +338,11 @@ class MCPServer:
                     return jsonify({"error": "No text provided"}), 400
                 
                 # Route the request
-                result = self.router.route_request(data['text'])
+                result = self.router.route_request(data['text'], session_id=data.get('sessionId'))
+                if 'args' in result:
+                    errors = self.schemas.validate(result['tool'], result['args'])
+                    if errors:
+                        result = {"error": f"Invalid {result['tool']} arguments: {'; '.join(errors)}"}
                 return jsonify(result)
                 
             except Exception as e:
@@ -325,24 +359,16 @@ class MCPServer:
             minStage (int, optional): Only include opps at or beyond this stage (0-8)
             productListCsv (str, optional): CSV list of product names to include
             timeFrame (str): "CURRENT" or "PREVIOUS" (default: "CURRENT")
-            limitN (int): Limit results (1-1000, default: 10)
+            limitN (int): Limit results (1-50, default: 10)
         
         Returns:
             Dict containing analysis results
         """
         try:
-            # Validate required parameters
-            if not kwargs.get('ouName'):
-                return {"error": "ouName is required"}
-            
-            # Validate parameter ranges
-            if kwargs.get('minStage') is not None:
-                if not (0 <= kwargs['minStage'] <= 8):
-                    return {"error": "minStage must be between 0 and 8"}
-            
-            if kwargs.get('limitN'):
-                if not (1 <= kwargs['limitN'] <= 1000):
-                    return {"error": "limitN must be between 1 and 1000"}
+            # Validate against open_pipe_analyze.schema.json
+            errors = self.schemas.validate('open_pipe_analyze', kwargs)
+            if errors:
+                return {"error": "; ".join(errors)}
             
             # Log the call for testing
             logger.info(f"open_pipe_analyze called with args: {kwargs}")
@@ -365,6 +391,8 @@ class MCPServer:
     
     def _call_salesforce_endpoint(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Call Salesforce Apex REST endpoint"""
+        import requests
+        
         try:
             if not self.sf_base_url or not self.sf_access_token:
                 return {"error": "Salesforce configuration missing. Check SF_BASE_URL and SF_ACCESS_TOKEN."}
@@ -422,7 +450,13 @@ def main():
     
     args = parser.parse_args()
     
+    if args.test:
+        # Run router tests (offline; no environment or server dependencies needed)
+        run_router_tests()
+        return
+    
     # Load environment variables
+    from dotenv import load_dotenv
     load_dotenv()
     
     # Get configuration from environment
@@ -432,21 +466,19 @@ def main():
     port = int(os.getenv('PORT', args.port))
     host = os.getenv('HOST', args.host)
     
-    if args.test:
-        # Run router tests
-        run_router_tests()
-    else:
-        # Start the server
-        server = MCPServer(
-            dry_run=dry_run,
-            sf_base_url=sf_base_url,
-            sf_access_token=sf_access_token
-        )
-        server.run(host=host, port=port)
+    # Start the server
+    server = MCPServer(
+        dry_run=dry_run,
+        sf_base_url=sf_base_url,
+        sf_access_token=sf_access_token,
+        sessions=SessionStore.from_env()
+    )
+    server.run(host=host, port=port)
 
 def run_router_tests():
     """Run router tests"""
-    server = MCPServer()
+    # One conversation, so follow-ups build on the turns before them
+    router = OpenPipeRouter(sessions=SessionStore())
     
     # Test utterances from the requirements
     test_utterances = [
@@ -466,7 +498,7 @@ def run_router_tests():
         print(f"\n{i}. User: \"{utterance}\"")
         
         # Route the request
-        result = server.router.route_request(utterance)
+        result = router.route_request(utterance, session_id="router-tests")
         
         if "error" in result:
             print(f"Response: {result['error']}")
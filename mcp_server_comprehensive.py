@@ -4,16 +4,35 @@ Comprehensive MCP Server for Agent Integration
 Handles multiple tool types: Open Pipe, KPI, Content Search, SME Search, Workflow, Future Pipeline
 """
 
+import hmac
 import json
 import logging
+import math
 import re
 import os
+import time
 import argparse
-import requests
-from typing import Dict, Any, Optional, List
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Dict, Any, Optional, List, Tuple
 from dataclasses import dataclass
-from flask import Flask, request, jsonify
-from dotenv import load_dotenv
+from sf_resilience import ResilientCaller, CircuitOpenError
+from result_cache import ResultCache, routing_key, action_key
+from sf_auth import SalesforceAuthManager, AuthError
+from sf_batching import ActionBatcher, BatchError
+from entity_gazetteer import Entity, Gazetteer, load_apex_maps
+from fuzzy_resolver import FuzzyResolver
+from schema_registry import SchemaRegistry
+from session_store import SessionStore, SessionSnapshot
+from speculative_prefetch import SpeculativePrefetcher, speculation_key
+from routing_config import ReloadableRouter, RoutingConfig, RoutingConfigError, ROUTING_CONFIG_PATH
+
+# Flask, requests, dotenv and the NumPy-backed pipeline modules are imported where
+# they are used, so the router loads with the standard library only
+if TYPE_CHECKING:
+    import requests
+    from pipeline_store import PipelineStore
+    from pipeline_sync import PipelineSync
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,89 +44,195 @@ class ToolRequest:
     tool: str
     args: Dict[str, Any]
 
+@dataclass(frozen=True)
+class ArgSpec:
+    """
+    One tool argument: the router method that extracts it (or a constant value)
+    and when it is included: 'always', 'present' (not None or empty) or
+    'non_default' (differs from default). default is used when the text does not
+    state the argument; such extractors are called with default=None.
+    """
+    name: str
+    extractor: Optional[str] = None
+    value: Any = None
+    include: str = 'present'
+    default: Any = None
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """
+    Arguments a tool needs; at least one of required must be extracted or error is
+    returned. In a session, a turn that states none of the context arguments is a
+    follow-up to the previous turn rather than a new request.
+    """
+    args: Tuple[ArgSpec, ...] = ()
+    required: Tuple[str, ...] = ()
+    error: str = ''
+    parser: Optional[str] = None  # router method that builds all args itself
+    context: Tuple[str, ...] = ()
+
+
+_OU_REQUIRED = "Operating Unit (ouName) is required for {}. Please specify an OU like 'AMER ACC' or 'EMEA ENTR'."
+
+TOOL_ARGS: Dict[str, ToolSpec] = {
+    'open_pipe_negative': ToolSpec(parser='parse_negative_intent_args', context=('ouName',)),
+    'open_pipe_analyze': ToolSpec(
+        args=(
+            ArgSpec('ouName', 'extract_ou_name', include='always'),
+            ArgSpec('timeFrame', 'extract_timeframe', include='always', default='CURRENT'),
+            ArgSpec('limitN', 'extract_limit', include='always', default=10),
+            ArgSpec('country', 'extract_country'),
+            ArgSpec('minStage', 'extract_min_stage'),
+            ArgSpec('productListCsv', 'extract_products'),
+            ArgSpec('compare', 'extract_comparison'),
+        ),
+        required=('ouName',),
+        error=_OU_REQUIRED.format('open pipe analysis'),
+        context=('ouName',),
+    ),
+    'kpi_analyze': ToolSpec(
+        args=(
+            ArgSpec('ouName', 'extract_ou_name', include='always'),
+            ArgSpec('timeFrame', 'extract_timeframe', include='always', default='CURRENT'),
+            ArgSpec('country', 'extract_country'),
+            ArgSpec('compare', 'extract_comparison'),
+        ),
+        required=('ouName',),
+        error=_OU_REQUIRED.format('KPI analysis'),
+        context=('ouName',),
+    ),
+    'content_search': ToolSpec(
+        args=(
+            ArgSpec('topic', 'extract_topic', include='always'),
+            ArgSpec('source', 'extract_source', include='always'),
+        ),
+        required=('topic',),
+        error="Please specify a topic to search for (e.g., 'Data Cloud', 'Sales Cloud').",
+        context=('topic',),
+    ),
+    'sme_search': ToolSpec(
+        args=(
+            ArgSpec('region', 'extract_region'),
+            ArgSpec('expertise', 'extract_expertise'),
+        ),
+        required=('region', 'expertise'),
+        error="Please specify a region or expertise area for SME search.",
+        context=('region', 'expertise'),
+    ),
+    'workflow': ToolSpec(
+        args=(
+            ArgSpec('process', value='general', include='always'),
+            ArgSpec('context', 'extract_context', include='always'),
+        ),
+    ),
+    'future_pipeline': ToolSpec(
+        args=(
+            ArgSpec('ouName', 'extract_ou_name', include='always'),
+            ArgSpec('timeFrame', 'extract_timeframe', include='always', default='CURRENT'),
+            ArgSpec('opportunityType', 'extract_opportunity_type'),
+            ArgSpec('product', 'extract_product'),
+            ArgSpec('segment', 'extract_segment'),
+            ArgSpec('limit', 'extract_limit', include='non_default', default=10),
+        ),
+        required=('ouName',),
+        error=_OU_REQUIRED.format('pipeline generation'),
+        context=('ouName',),
+    ),
+}
+
+# Per-turn flags: a follow-up has to state them again rather than inherit them
+TURN_ONLY_ARGS = frozenset({'compare'})
+
 class ComprehensiveRouter:
     """Router for multiple tool types"""
     
-    def __init__(self):
-        # Tool detection patterns
-        self.tool_patterns = {
-            'open_pipe_analyze': [
-                r'open pipe', r'pipeline', r'opportunities', r'opps', r'products.*filter',
-                r'passed stage', r'post stage', r'stage \d+'
-            ],
-            'open_pipe_negative': [
-                r'don\'t have', r'without', r'excluding', r'exclude', r'lack', r'no.*product',
-                r'missing', r'not having', r'who.*don\'t', r'who.*without', r'who.*excluding',
-                r'who.*lack', r'who.*missing', r'who.*not having', r'list.*don\'t',
-                r'show.*don\'t', r'find.*don\'t', r'display.*don\'t'
-            ],
-            'kpi_analyze': [
-                r'kpi', r'key performance', r'performance analysis', r'metrics',
-                r'quarterly results', r'performance indicators'
-            ],
-            'content_search': [
-                r'content search', r'search.*content', r'find.*article', r'knowledge',
-                r'search.*topic', r'content.*topic', r'act.*course', r'consensus.*demo',
-                r'show.*act', r'list.*act', r'find.*act', r'act.*curricula', r'act.*assets',
-                r'consensus.*demo', r'consensus.*video', r'consensus.*preview',
-                r'course.*related', r'course.*created', r'course.*completion', r'course.*enrollment',
-                r'find.*tableau', r'show.*tableau', r'search.*tableau', r'tableau.*content',
-                r'find.*agentforce', r'show.*agentforce', r'search.*agentforce', r'agentforce.*content',
-                r'find.*data cloud', r'show.*data cloud', r'search.*data cloud', r'data cloud.*content',
-                r'demo.*video', r'demo.*content', r'video.*demo', r'content.*demo',
-                r'demo.*video', r'demo.*created', r'demo.*preview', r'demo.*access',
-                r'curricula.*completion', r'assets.*tagged', r'assets.*created',
-                r'top.*course', r'course.*enrollment', r'course.*completion.*rate',
-                r'completion.*rate', r'enrollment.*student', r'created.*between',
-                r'created.*last', r'created.*quarter', r'created.*year',
-                r'tagged.*with', r'preview.*link', r'public.*access', r'completion.*tracking'
-            ],
-            'sme_search': [
-                r'sme', r'subject matter expert', r'expert search', r'find.*expert',
-                r'who.*expert', r'expertise'
-            ],
-            'workflow': [
-                r'workflow', r'process', r'procedure', r'step.*by.*step',
-                r'how.*to', r'guide'
-            ],
-            'future_pipeline': [
-                r'future pipeline', r'pipeline generation', r'generate.*pipeline',
-                r'create.*pipeline', r'new.*pipeline', r'cross-sell.*opportunities',
-                r'upsell.*opportunities', r'renewal.*opportunities', r'most valuable.*product',
-                r'highest amount.*opportunity', r'highest amount.*renewal', r'how many.*opportunities',
-                r'which product.*highest', r'generate.*for.*cross-sell', r'generate.*for.*upsell',
-                r'generate.*for.*renewal', r'show.*opportunities', r'find.*opportunities'
-            ]
-        }
+    # Bump whenever routing behaviour changes so cached routing decisions are invalidated
+    VERSION = "1.4"
+    
+    def __init__(self, config: Optional[RoutingConfig] = None, sessions: Optional[SessionStore] = None):
+        # Routing tables come from routing_config.json; the server swaps in a new router on reload
+        config = config or RoutingConfig.load()
+        unknown = set(config.tool_patterns) ^ set(TOOL_ARGS)
+        if unknown:
+            raise RoutingConfigError(f"{config.path}: tool_patterns must cover exactly the routed tools; "
+                                     f"mismatch on {sorted(unknown)}")
+        self.config = config
+        self.routing_version = config.version
+        # Last routed tool and args per conversation, shared across config reloads
+        self.sessions = sessions
         
-        # OU patterns
-        self.ou_patterns = {
-            r'AMER\s+ACC(?:\s+OU)?': 'AMER ACC',
-            r'AMER-ACC': 'AMER ACC',
-            r'ACC\s+in\s+AMER': 'AMER ACC',
-            r'EMEA\s+ENTR(?:AISE)?': 'EMEA ENTR',
-            r'EMEA-ENTR': 'EMEA ENTR',
-            r'Enterprise\s+EMEA': 'EMEA ENTR',
-            r'UKI': 'UKI',
-            r'LATAM': 'LATAM',
-            r'ANZ': 'ANZ'
-        }
+        # Tool detection patterns, compiled once per config version
+        self.tool_patterns = config.tool_patterns
+        self.tool_regexes = {tool: [re.compile(p) for p in patterns] for tool, patterns in config.tool_patterns.items()}
+        
+        # OU aliases (matched case-insensitively, on top of the Apex OU_ALIAS_MAP)
+        self.ou_aliases = config.ou_aliases
         
         # Country mapping
-        self.country_mapping = {
-            'US': 'United States',
-            'USA': 'United States',
-            'UK': 'United Kingdom',
-            'UAE': 'United Arab Emirates',
+        self.country_mapping = config.country_mapping
+        
+        # Segment aliases for future pipeline
+        self.segment_aliases = config.segment_aliases
+        
+        # Products recognised in addition to the Apex PRODUCT_FAMILY_MAP
+        self.product_aliases = config.product_aliases
+        
+        self.gazetteer = self._build_gazetteer()
+        self.fuzzy = FuzzyResolver.from_gazetteer(self.gazetteer)
+        # Region prefixes of OU names ("AMER" in "AMER ACC"): "in AMER" names a region, not a country
+        self.regions = {ou.split()[0].lower() for ou in self.gazetteer.values('ou')
+                        if ' ' in ou and ou.split()[0].isupper()}
+        
+        # Compiled <tool>.schema.json validators; router output must satisfy them
+        self.schemas = SchemaRegistry()
+
+    @property
+    def cache_version(self) -> str:
+        """Scopes cached routing decisions to both the routing code and the config contents"""
+        return f"{self.VERSION}+{self.config.tag}"
+
+    def _build_gazetteer(self) -> Gazetteer:
+        """Apex alias maps plus the router's own aliases, compiled once"""
+        gazetteer = Gazetteer()
+        apex = load_apex_maps()
+        router_aliases = {
+            'ou': [(alias, ou) for alias, ou in self.ou_aliases.items()],
+            'country': list(self.country_mapping.items()),
+            'segment': list(self.segment_aliases.items()),
         }
         
-        # Product patterns for negative intent
-        self.product_patterns = [
-            r'agentforce', r'data cloud', r'slack', r'tableau', r'mulesoft', r'sales cloud',
-            r'marketing cloud', r'service cloud', r'platform', r'commerce cloud', r'experience cloud',
-            r'field service', r'health cloud', r'financial services', r'manufacturing cloud',
-            r'government cloud', r'nonprofit cloud', r'education cloud', r'media cloud'
-        ]
+        gazetteer.add_many('product', apex.get('product', []))
+        gazetteer.add_many('country', apex.get('country', []))
+        gazetteer.add_many('segment', apex.get('segment', []))
+        for alias, ou in apex.get('ou', []):
+            # OUs named after a product or country ("Tableau", "Japan") would shadow those readings
+            if not gazetteer.lookup(alias):
+                gazetteer.add('ou', alias, ou)
+        
+        # Router vocabulary wins: an Apex canonical sharing an alias with the router takes the router's name
+        for entity_type, pairs in router_aliases.items():
+            # The router always matched OUs and segments case-insensitively; short country codes stay upper-case only
+            case_sensitive = None if entity_type == 'country' else False
+            for alias, value in pairs:
+                existing = gazetteer.lookup(alias).get(entity_type)
+                if existing and existing[1] != value:
+                    gazetteer.rename(entity_type, existing[1], value)
+                gazetteer.add(entity_type, alias, value, case_sensitive=case_sensitive)
+        for product in self.product_aliases:
+            gazetteer.add('product', product, product, replace=False)
+        
+        gazetteer.build()
+        logger.info(f"Entity gazetteer: {gazetteer.stats()}")
+        return gazetteer
+
+    def find_entities(self, text: str, entity_type: str) -> List[Entity]:
+        """Exact gazetteer mentions of one type; typo-tolerant matches only when there are none"""
+        entities = self.gazetteer.find(text)
+        exact = [entity for entity in entities if entity.type == entity_type]
+        if exact:
+            return exact
+        return self.fuzzy.find(text, types=(entity_type,), skip=[(e.start, e.end) for e in entities])
 
     def detect_tool(self, text: str) -> Optional[str]:
         """Detect which tool to use based on text"""
@@ -115,28 +240,28 @@ class ComprehensiveRouter:
         logger.info(f"Detecting tool for: {text_lower}")
         
         # Check for negative intent first (highest priority)
-        if any(re.search(pattern, text_lower) for pattern in self.tool_patterns['open_pipe_negative']):
+        if any(regex.search(text_lower) for regex in self.tool_regexes['open_pipe_negative']):
             logger.info("Detected: open_pipe_negative")
             return 'open_pipe_negative'
         
         # Check for content search second (high priority - before open_pipe_analyze)
-        for pattern in self.tool_patterns['content_search']:
-            if re.search(pattern, text_lower):
-                logger.info(f"Detected: content_search (pattern: {pattern})")
+        for regex in self.tool_regexes['content_search']:
+            if regex.search(text_lower):
+                logger.info(f"Detected: content_search (pattern: {regex.pattern})")
                 return 'content_search'
         
         # Check for future pipeline third (high priority)
-        if any(re.search(pattern, text_lower) for pattern in self.tool_patterns['future_pipeline']):
+        if any(regex.search(text_lower) for regex in self.tool_regexes['future_pipeline']):
             logger.info("Detected: future_pipeline")
             return 'future_pipeline'
         
         # Check for other tools (excluding already checked ones)
-        for tool, patterns in self.tool_patterns.items():
+        for tool, regexes in self.tool_regexes.items():
             if tool in ['future_pipeline', 'content_search']:  # Skip already checked tools
                 continue
-            for pattern in patterns:
-                if re.search(pattern, text_lower):
-                    logger.info(f"Detected: {tool} (pattern: {pattern})")
+            for regex in regexes:
+                if regex.search(text_lower):
+                    logger.info(f"Detected: {tool} (pattern: {regex.pattern})")
                     return tool
         
         logger.info("No tool detected, returning None")
@@ -152,12 +277,11 @@ class ComprehensiveRouter:
         # Extract country
         country = self.extract_country(text)
         
-        # Extract excluded products
+        # Extract excluded products, in the order they are mentioned
         excluded_products = []
-        for pattern in self.product_patterns:
-            if re.search(pattern, text_lower):
-                product_name = re.search(pattern, text_lower).group(0)
-                excluded_products.append(product_name.title())
+        for entity in self.find_entities(text, 'product'):
+            if entity.alias not in excluded_products:
+                excluded_products.append(entity.alias)
         
         # If no specific products found, try to extract from context
         if not excluded_products:
@@ -170,7 +294,7 @@ class ComprehensiveRouter:
         limit = 10  # default
         limit_match = re.search(r'(?:top|first|limit|max).*?(\d+)', text_lower)
         if limit_match:
-            limit = int(limit_match.group(1))
+            limit = min(int(limit_match.group(1)), 50)
         
         return {
             'ouName': ou_name,
@@ -183,15 +307,17 @@ class ComprehensiveRouter:
 
     def extract_ou_name(self, text: str) -> Optional[str]:
         """Extract OU name from text"""
-        text_upper = text.upper()
-        for pattern, ou_name in self.ou_patterns.items():
-            match = re.search(pattern, text_upper)
-            if match:
-                return ou_name
-        return None
+        entities = self.find_entities(text, 'ou')
+        return entities[0].value if entities else None
 
     def extract_country(self, text: str) -> Optional[str]:
         """Extract country from text"""
+        entities = self.find_entities(text, 'country')
+        if entities:
+            return entities[0].value
+        
+        # Spans already read as an OU, product or segment can't also be the country
+        claimed = [(e.start, e.end) for e in self.gazetteer.find(text, ('ou', 'product', 'segment'))]
         country_patterns = [
             r'country\s*=\s*([A-Za-z\s]+?)(?:\s|$)',
             r'in\s+([A-Za-z\s]+?)(?:\s+country|\s+top|\s+for|\s+within|\s+passed|\s+post|\s+stage|\s+quarter|\s+open|\s+pipe|\s+products|\s+filter|\s+show|\s+compare|\s+where|\s+and|\s+order|\s+by|\s+amount|\s+stage|\s+in|\s+\(|\s+\)|\s+>|\s+<|\s+=|\s+$|$)',
@@ -204,7 +330,16 @@ class ComprehensiveRouter:
                 country = re.sub(r'\s+', ' ', country)
                 if len(country) > 50:
                     continue
-                if country.upper() in ['AMER ACC', 'EMEA ENTR', 'UKI', 'LATAM', 'ANZ']:
+                # The catch-all "in X" also matches pipeline wording ("in open pipe") and
+                # OU/product/segment names; only a capitalized, unrecognized name is a country
+                if pattern is country_patterns[1] and not country[0].isupper():
+                    continue
+                start, end = match.span(1)
+                if any(start < e_end and e_start < end for e_start, e_end in claimed):
+                    continue
+                if {'ou', 'product', 'segment'} & self.gazetteer.lookup(country).keys():
+                    continue
+                if country.lower() in self.regions:
                     continue
                 return self.country_mapping.get(country, country)
         
@@ -230,7 +365,7 @@ class ComprehensiveRouter:
                 return extractor(match)
         return None
 
-    def extract_timeframe(self, text: str) -> str:
+    def extract_timeframe(self, text: str, default: Optional[str] = "CURRENT") -> Optional[str]:
         """Extract timeframe from text"""
         text_lower = text.lower()
         timeframe_patterns = {
@@ -245,7 +380,24 @@ class ComprehensiveRouter:
         for pattern, timeframe in timeframe_patterns.items():
             if re.search(pattern, text_lower):
                 return timeframe
-        return "CURRENT"
+        return default
+
+    def extract_comparison(self, text: str) -> Optional[bool]:
+        """
+        True for quarter-over-quarter comparisons ("compare last quarter", "this quarter
+        vs previous", "QoQ"); comparisons between OUs ("AMER ACC vs EMEA ENTR") are not
+        """
+        text_lower = text.lower()
+        if re.search(r'\bqoq\b|quarter[\s-]+over[\s-]+quarter', text_lower):
+            return True
+        versus = re.search(r'\b(?:vs\.?|versus|against)\s+(\w+)', text_lower)
+        if versus and versus.group(1) not in ('last', 'previous', 'prior', 'this', 'current', 'the'):
+            return None
+        if versus or re.search(r'\bcompar(?:e|ed|es|ing|ison)\b', text_lower):
+            if len({entity.value for entity in self.find_entities(text, 'ou')}) > 1:
+                return None
+            return True
+        return None
 
     def extract_products(self, text: str) -> Optional[str]:
         """Extract product list from text"""
@@ -253,7 +405,7 @@ class ComprehensiveRouter:
             r'filter\s+to\s+([^,]+(?:,\s*[^,]+)*)',
             r'products?\s*:\s*([^,]+(?:,\s*[^,]+)*)',
             r'include\s+([^,]+(?:,\s*[^,]+)*)',
-            r'([A-Za-z\s]+(?:\s+Cloud)?)\s+and\s+([A-Za-z\s]+(?:\s+Cloud)?)',
+            r'\b(\w+\s+Cloud)\s+and\s+(\w+\s+Cloud)\b',
         ]
         
         for pattern in product_patterns:
@@ -264,6 +416,9 @@ class ComprehensiveRouter:
                 else:
                     products = match.group(1).strip()
                 products = re.sub(r'\s+', ' ', products)
+                # "Data Cloud and Sales Cloud only." -> "Data Cloud, Sales Cloud"
+                products = re.sub(r'(?:\s+only)?[\s.;!?]*$', '', products, flags=re.IGNORECASE)
+                products = re.sub(r'\s+and\s+', ', ', products, flags=re.IGNORECASE)
                 return products
         
         if 'data cloud' in text.lower() and 'sales cloud' in text.lower():
@@ -271,7 +426,7 @@ class ComprehensiveRouter:
         
         return None
 
-    def extract_limit(self, text: str) -> int:
+    def extract_limit(self, text: str, default: Optional[int] = 10) -> Optional[int]:
         """Extract limit from text"""
         limit_patterns = [
             r'top\s+(\d+)',
@@ -285,7 +440,7 @@ class ComprehensiveRouter:
             if match:
                 limit = int(match.group(1))
                 return min(limit, 50)
-        return 10
+        return default
 
     def extract_topic(self, text: str) -> Optional[str]:
         """Extract topic for content search"""
@@ -305,26 +460,10 @@ class ComprehensiveRouter:
                 topic = match.group(1).strip()
                 return topic
         
-        # Look for common topics
-        text_lower = text.lower()
-        if 'data cloud' in text_lower:
-            return 'Data Cloud'
-        if 'sales cloud' in text_lower:
-            return 'Sales Cloud'
-        if 'service cloud' in text_lower:
-            return 'Service Cloud'
-        if 'tableau' in text_lower:
-            return 'Tableau'
-        if 'agentforce' in text_lower:
-            return 'Agentforce'
-        if 'mulesoft' in text_lower:
-            return 'MuleSoft'
-        if 'marketing cloud' in text_lower:
-            return 'Marketing Cloud'
-        if 'commerce cloud' in text_lower:
-            return 'Commerce Cloud'
-        if 'slack' in text_lower:
-            return 'Slack'
+        # Look for a known product
+        product = self.extract_product(text)
+        if product:
+            return product
         
         # If no specific topic found, try to extract the main search term
         # Look for words that might be topics (exclude common words)
@@ -391,145 +530,140 @@ class ComprehensiveRouter:
 
     def extract_segment(self, text: str) -> Optional[str]:
         """Extract segment for future pipeline"""
-        text_lower = text.lower()
-        
-        if 'enterprise' in text_lower:
-            return 'enterprise'
-        elif 'mid-market' in text_lower or 'mid market' in text_lower:
-            return 'mid-market'
-        elif 'small business' in text_lower or 'sme' in text_lower:
-            return 'small business'
-        
-        return None
+        entity = self.gazetteer.first(text, 'segment')
+        return entity.value if entity else None
 
     def extract_product(self, text: str) -> Optional[str]:
         """Extract product for future pipeline"""
-        text_lower = text.lower()
+        entities = self.find_entities(text, 'product')
+        return entities[0].alias if entities else None
+
+    def extract_context(self, text: str) -> str:
+        """Workflow context is the request itself"""
+        return text
+
+    def _stated(self, arg: ArgSpec, text: str, memo: Dict[Any, Any]) -> Any:
+        """What the text itself states for an argument, or None; each extractor runs once per request"""
+        key = (arg.extractor, arg.default is not None)
+        if key not in memo:
+            extract = getattr(self, arg.extractor)
+            memo[key] = extract(text, default=None) if arg.default is not None else extract(text)
+        return None if memo[key] == '' else memo[key]
+    
+    def _parsed(self, spec: ToolSpec, text: str, memo: Dict[Any, Any]) -> Dict[str, Any]:
+        if spec.parser not in memo:
+            memo[spec.parser] = getattr(self, spec.parser)(text)
+        return memo[spec.parser]
+    
+    def stated_args(self, tool: str, text: str, memo: Optional[Dict[Any, Any]] = None,
+                    names: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+        """
+        Arguments of a tool that the text states itself, without defaults or constants.
+
+        names limits the arguments looked at; for tools with a parser only the
+        context arguments are considered, since the parser fills in the rest.
+        """
+        spec = TOOL_ARGS[tool]
+        memo = {} if memo is None else memo
+        if spec.parser:
+            parsed = self._parsed(spec, text, memo)
+            return {name: parsed[name] for name in (names or spec.context) if parsed.get(name) not in (None, '')}
+        stated = {}
+        for arg in spec.args:
+            if arg.extractor is None or (names is not None and arg.name not in names):
+                continue
+            current = self._stated(arg, text, memo)
+            if current is not None:
+                stated[arg.name] = current
+        return stated
+
+    def build_args(self, tool: str, text: str, inherited: Optional[Dict[str, Any]] = None,
+                   memo: Optional[Dict[Any, Any]] = None) -> Dict[str, Any]:
+        """
+        Arguments for a tool from its TOOL_ARGS spec.
+
+        Extractors run lazily, in spec order and at most once per request, so a tool
+        only pays for the arguments it declares. Arguments the text does not state
+        come from inherited (the previous turn of a session), then the spec default.
+        Returns {"error": ...} if none of the spec's required arguments could be found.
+        """
+        spec = TOOL_ARGS[tool]
+        memo = {} if memo is None else memo
+        inherited = inherited or {}
+        if spec.parser:
+            parsed = self._parsed(spec, text, memo)
+            return {name: inherited[name] if current in (None, '') and inherited.get(name) not in (None, '') else current
+                    for name, current in parsed.items()}
         
-        if 'data cloud' in text_lower:
-            return 'Data Cloud'
-        elif 'sales cloud' in text_lower:
-            return 'Sales Cloud'
-        elif 'service cloud' in text_lower:
-            return 'Service Cloud'
-        elif 'marketing cloud' in text_lower:
-            return 'Marketing Cloud'
+        def value(arg: ArgSpec) -> Any:
+            if arg.extractor is None:
+                return arg.value
+            current = self._stated(arg, text, memo)
+            if current is None:
+                current = inherited.get(arg.name, arg.default)
+            return current
         
-        return None
+        by_name = {arg.name: arg for arg in spec.args}
+        if spec.required and all(value(by_name[name]) in (None, '') for name in spec.required):
+            return {"error": spec.error}
+        
+        args = {}
+        for arg in spec.args:
+            current = value(arg)
+            if arg.include == 'always' or (arg.include == 'present' and current not in (None, '')) \
+                    or (arg.include == 'non_default' and current != arg.default):
+                args[arg.name] = current
+        return args
 
-    def route_request(self, text: str) -> Dict[str, Any]:
-        """Route natural language request to appropriate tool"""
+    def resolve_follow_up(self, tool: Optional[str], previous: SessionSnapshot, text: str,
+                          memo: Dict[Any, Any]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Tool and inherited args for a turn that has a previous turn in its session.
+
+        A turn that states a context argument of its detected tool (an OU, a
+        topic) is a new request. Otherwise it refines the previous one: with no
+        tool detected, or only a catch-all tool such as workflow while it states
+        arguments of the previous tool ("show top 15"), it continues that tool;
+        a different detected tool takes over the previous turn's shared args.
+        """
+        if tool is not None and TOOL_ARGS[tool].context and self.stated_args(tool, text, memo, TOOL_ARGS[tool].context):
+            return tool, None
+        if tool is None or tool == previous.tool or (
+                not TOOL_ARGS[tool].context and self.stated_args(previous.tool, text, memo)):
+            return previous.tool, previous.args
+        return tool, previous.args
+
+    def route_request(self, text: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Route natural language request to appropriate tool.
+
+        With a session_id and a session store, follow-up turns are merged into the
+        previous turn's args (see resolve_follow_up) and each routed turn is recorded.
+        """
         
         # Detect tool
         tool = self.detect_tool(text)
+        memo: Dict[Any, Any] = {}
+        inherited = None
+        session = self.sessions if session_id else None
+        previous = session.get(session_id) if session is not None else None
+        if previous is not None:
+            tool, inherited = self.resolve_follow_up(tool, previous, text, memo)
         if not tool:
             return {
                 "error": "Could not determine the appropriate tool for this request. Please be more specific about what you want to do."
             }
         
-        # Extract common parameters
-        ou_name = self.extract_ou_name(text)
-        country = self.extract_country(text)
-        timeframe = self.extract_timeframe(text)
-        limit = self.extract_limit(text)
-        
-        # Build args based on tool type
-        args = {}
+        args = self.build_args(tool, text, inherited, memo)
+        if 'error' in args:
+            return args
         
-        if tool == 'open_pipe_negative':
-            # Use negative intent parsing
-            args = self.parse_negative_intent_args(text)
-        elif tool == 'open_pipe_analyze':
-            if not ou_name:
-                return {"error": "Operating Unit (ouName) is required for open pipe analysis. Please specify an OU like 'AMER ACC' or 'EMEA ENTR'."}
-            
-            args = {
-                "ouName": ou_name,
-                "timeFrame": timeframe,
-                "limitN": limit
-            }
-            
-            if country:
-                args["country"] = country
-            
-            min_stage = self.extract_min_stage(text)
-            if min_stage is not None:
-                args["minStage"] = min_stage
-            
-            products = self.extract_products(text)
-            if products:
-                args["productListCsv"] = products
-        
-        elif tool == 'kpi_analyze':
-            if not ou_name:
-                return {"error": "Operating Unit (ouName) is required for KPI analysis. Please specify an OU like 'AMER ACC' or 'EMEA ENTR'."}
-            
-            args = {
-                "ouName": ou_name,
-                "timeFrame": timeframe
-            }
-            
-            if country:
-                args["country"] = country
-        
-        elif tool == 'content_search':
-            topic = self.extract_topic(text)
-            if not topic:
-                return {"error": "Please specify a topic to search for (e.g., 'Data Cloud', 'Sales Cloud')."}
-            
-            args = {
-                "topic": topic,
-                "source": self.extract_source(text)
-            }
-        
-        elif tool == 'sme_search':
-            region = self.extract_region(text)
-            expertise = self.extract_expertise(text)
-            
-            if not region and not expertise:
-                return {"error": "Please specify a region or expertise area for SME search."}
-            
-            args = {}
-            if region:
-                args["region"] = region
-            if expertise:
-                args["expertise"] = expertise
-        
-        elif tool == 'workflow':
-            args = {
-                "process": "general",
-                "context": text
-            }
-        
-        elif tool == 'future_pipeline':
-            if not ou_name:
-                return {"error": "Operating Unit (ouName) is required for pipeline generation. Please specify an OU like 'AMER ACC' or 'EMEA ENTR'."}
-            
-            args = {
-                "ouName": ou_name,
-                "timeFrame": timeframe
-            }
-            
-            # Extract opportunity type
-            opportunity_type = self.extract_opportunity_type(text)
-            if opportunity_type:
-                args["opportunityType"] = opportunity_type
-            
-            # Extract product
-            product = self.extract_product(text)
-            if product:
-                args["product"] = product
-            
-            # Extract segment
-            segment = self.extract_segment(text)
-            if segment:
-                args["segment"] = segment
-            
-            # Extract limit
-            limit = self.extract_limit(text)
-            if limit != 10:  # Only add if not default
-                args["limit"] = limit
+        errors = self.schemas.validate(tool, args)
+        if errors:
+            return {"error": f"Invalid {tool} arguments: {'; '.join(errors)}"}
         
+        if session is not None:
+            session.put(session_id, tool, {k: v for k, v in args.items() if k not in TURN_ONLY_ARGS})
         return {
             "tool": tool,
             "args": args
@@ -538,16 +672,90 @@ class ComprehensiveRouter:
 class ComprehensiveMCPServer:
     """Comprehensive MCP Server for multiple tool types"""
     
-    def __init__(self, dry_run: bool = True, sf_base_url: str = None, sf_access_token: str = None):
-        self.router = ComprehensiveRouter()
+    # Read-only actions that are safe to hedge (send twice, keep the first answer)
+    IDEMPOTENT_ACTIONS = {
+        "ANAGENT Open Pipe Analysis V3 - MCP Enhanced",
+        "Run KPI Analysis from MCP",
+    }
+    
+    # Tools that accept compare=true, and the time frames a comparison runs
+    COMPARABLE_TOOLS = {'open_pipe_analyze', 'kpi_analyze'}
+    # Salesforce statuses passed through to the client as retryable (throttled, unavailable)
+    RETRYABLE_STATUS = (429, 503)
+    COMPARED_TIME_FRAMES = ('CURRENT', 'PREVIOUS')
+    
+    # MCP invocable actions for the tools without a dedicated handler; each takes normalizedArgsJsons
+    TOOL_ACTIONS = {
+        'content_search': "Run Content Search from MCP",
+        'sme_search': "Run SME Search from MCP",
+        'workflow': "Run Workflow Service from MCP",
+        'future_pipeline': "Run Future Pipeline Analysis from MCP",
+    }
+    
+    def __init__(self, dry_run: bool = True, sf_base_url: str = None, sf_access_token: str = None,
+                 request_timeout: float = 30.0, hedge_reads: bool = False,
+                 result_cache: Optional[ResultCache] = None, action_cache_ttl_s: float = 3600,
+                 auth: Optional[SalesforceAuthManager] = None, batch_window_ms: float = 0,
+                 pipeline_store: Optional['PipelineStore'] = None, routing_config_path: str = ROUTING_CONFIG_PATH,
+                 admin_token: Optional[str] = None, sessions: Optional[SessionStore] = None,
+                 prefetcher: Optional[SpeculativePrefetcher] = None):
+        # Conversations keyed by the sessionId sent with /route; outlives router reloads
+        self.sessions = sessions or SessionStore()
+        # Router built from routing_config.json; routing.reload() swaps in a rebuilt one
+        self.routing = ReloadableRouter(partial(ComprehensiveRouter, sessions=self.sessions), routing_config_path)
+        self.admin_token = admin_token
         self.dry_run = dry_run
-        self.sf_base_url = sf_base_url
-        self.sf_access_token = sf_access_token
+        self.auth = auth or SalesforceAuthManager(access_token=sf_access_token, instance_url=sf_base_url)
+        if sf_base_url and not self.auth.instance_url:
+            self.auth.instance_url = sf_base_url
+        self.request_timeout = request_timeout
+        self.sf_caller = ResilientCaller(
+            breaker_options={"slow_call_threshold_ms": request_timeout * 1000 * 0.8},
+            hedge_enabled=hedge_reads
+        )
+        self.result_cache = result_cache
+        self.action_cache_ttl_s = action_cache_ttl_s
+        # Multi-input batching of concurrent action calls (disabled when the window is 0)
+        self.batcher = ActionBatcher(self._send_action_batch, window_ms=batch_window_ms) if batch_window_ms > 0 else None
+        # Opt-in: /route starts the Salesforce call its /analyze will make (see _prefetch)
+        self.prefetcher = prefetcher
+        # Runs the PREVIOUS leg of comparisons alongside the CURRENT one (threads start on first use)
+        self._comparison_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="compare")
+        # Local columnar mirror of AGENT_OU_PIPELINE_V2__c; when loaded, open pipe analyses run locally
+        self.pipeline_store = pipeline_store
+        # Materialized OU/time-frame/country/product rollups over the mirror, refreshed with each snapshot
+        self.pipeline_rollups = None
+        if pipeline_store is not None:
+            from pipeline_rollups import PipelineRollups
+            self.pipeline_rollups = PipelineRollups.build(pipeline_store)
+        # Incremental sync that swaps fresh snapshots into pipeline_store (see enable_pipeline_sync)
+        self.pipeline_sync: Optional['PipelineSync'] = None
+        from flask import Flask
         self.app = Flask(__name__)
         self._setup_routes()
     
+    @property
+    def sf_base_url(self) -> Optional[str]:
+        """Org base URL; follows the instance_url returned by each token refresh"""
+        return self.auth.instance_url
+    
+    @property
+    def router(self) -> ComprehensiveRouter:
+        """Router for the current routing config; read once per request"""
+        return self.routing.current
+    
     def _setup_routes(self):
         """Setup Flask routes"""
+        from flask import request, jsonify
+        
+        @self.app.after_request
+        def retry_after(response):
+            # Throttled and open-circuit answers carry retry_after_s; mirror it in the standard header
+            if response.status_code in self.RETRYABLE_STATUS and response.is_json:
+                seconds = (response.get_json(silent=True) or {}).get('retry_after_s')
+                if seconds is not None:
+                    response.headers['Retry-After'] = str(max(1, math.ceil(seconds)))
+            return response
         
         @self.app.route('/health', methods=['GET'])
         def health():
@@ -555,8 +763,20 @@ class ComprehensiveMCPServer:
                 "status": "healthy",
                 "service": "comprehensive-mcp",
                 "dry_run": self.dry_run,
-                "sf_configured": bool(self.sf_base_url and self.sf_access_token),
-                "supported_tools": list(self.router.tool_patterns.keys())
+                "sf_configured": bool(self.sf_base_url and self.auth.is_configured()),
+                "auth": self.auth.snapshot(),
+                "supported_tools": list(self.router.tool_patterns.keys()),
+                "router_version": self.router.cache_version,
+                "routing_config": self.routing.stats(),
+                "sessions": self.sessions.stats(),
+                "argument_schemas": self.router.schemas.stats(),
+                "salesforce_actions": self.sf_caller.snapshot(),
+                "action_batching": self.batcher.stats() if self.batcher else None,
+                "speculative_prefetch": self.prefetcher.stats() if self.prefetcher else None,
+                "result_cache": self.result_cache.stats() if self.result_cache else None,
+                "pipeline_mirror": self.pipeline_store.stats() if self.pipeline_store else None,
+                "pipeline_rollups": self.pipeline_rollups.stats() if self.pipeline_rollups else None,
+                "pipeline_sync": self.pipeline_sync.stats() if self.pipeline_sync else None
             })
         
         @self.app.route('/route', methods=['POST'])
@@ -567,7 +787,12 @@ class ComprehensiveMCPServer:
                     return jsonify({"error": "No text provided"}), 400
                 
                 # Route the request
-                result = self.router.route_request(data['text'])
+                result = self._route(data['text'], session_id=data.get('sessionId'))
+                if self.prefetcher is not None and 'error' not in result:
+                    try:
+                        self._prefetch(result, data['text'])
+                    except Exception as e:
+                        logger.warning(f"Speculative prefetch not started: {e}")
                 return jsonify(result)
                 
             except Exception as e:
@@ -581,11 +806,36 @@ class ComprehensiveMCPServer:
                 if not data:
                     return jsonify({"error": "No JSON data provided"}), 400
                 
+                # A /route response posted as-is ({"tool": ..., "args": {...}}) runs its routed tool
+                if isinstance(data.get('args'), dict) and data.get('tool') in TOOL_ARGS:
+                    tool = data['tool']
+                    errors = self.router.schemas.validate(tool, data['args'], allow_additional=True)
+                    if errors:
+                        return jsonify({"error": f"Invalid {tool} arguments", "validation_errors": errors}), 400
+                    return self._execute_tool(tool, data['args'], data.get('text', ''))
+                
+                # Reject malformed arguments before touching the mirror or Salesforce
+                if data.get('negativeIntent'):
+                    tool = 'open_pipe_negative'
+                elif data.get('tool') == 'kpi_analyze':
+                    tool = 'kpi_analyze'
+                else:
+                    tool = 'open_pipe_analyze'
+                errors = self.router.schemas.validate(tool, data, allow_additional=True)
+                if errors:
+                    return jsonify({"error": f"Invalid {tool} arguments", "validation_errors": errors}), 400
+                
+                if data.get('compare') and tool in self.COMPARABLE_TOOLS:
+                    return self._handle_comparison(tool, data)
+                
                 # Check if this is a negative intent query
                 if 'negativeIntent' in data and data['negativeIntent']:
                     # Route to negative intent handler
                     return self._handle_negative_intent(data)
                 
+                if data.get('tool') == 'kpi_analyze':
+                    return self._handle_kpi_analysis(data)
+                
                 # Handle regular open pipe analysis
                 return self._handle_regular_analysis(data)
                 
@@ -593,123 +843,555 @@ class ComprehensiveMCPServer:
                 logger.error(f"Error in analyze endpoint: {e}")
                 return jsonify({"error": str(e)}), 500
     
+        @self.app.route('/execute', methods=['POST'])
+        def execute():
+            """Route the text and run the chosen tool in one call (saves the /route -> /analyze hop)"""
+            started = time.perf_counter()
+            try:
+                data = request.get_json()
+                if not data or 'text' not in data:
+                    return jsonify({"error": "No text provided"}), 400
+                
+                routed = self._route(data['text'], session_id=data.get('sessionId'))
+                route_done = time.perf_counter()
+                if 'error' in routed:
+                    body, status, action_ms = routed, 200, 0.0
+                else:
+                    result = self._execute_tool(routed['tool'], routed['args'], data['text'])
+                    body, status = result if isinstance(result, tuple) else (result, 200)
+                    body = {"route": routed, **body}
+                    action_ms = (time.perf_counter() - route_done) * 1000
+                
+                response = jsonify(body)
+                response.status_code = status
+                response.headers['Server-Timing'] = (
+                    f"route;dur={(route_done - started) * 1000:.2f}, action;dur={action_ms:.2f}, "
+                    f"total;dur={(time.perf_counter() - started) * 1000:.2f}"
+                )
+                return response
+                
+            except Exception as e:
+                logger.error(f"Error in execute endpoint: {e}")
+                return jsonify({"error": str(e)}), 500
+        
+        @self.app.route('/aggregate', methods=['POST'])
+        def aggregate():
+            from pipeline_aggregate import AggregationSpec, AggregationRunner, AggregationError
+            try:
+                data = request.get_json()
+                if not data:
+                    return jsonify({"error": "No JSON data provided"}), 400
+                
+                specs = [AggregationSpec.from_dict(spec) for spec in data.get('specs', [data])]
+                if data.get('records') is not None:
+                    # Aggregate records already returned from Salesforce
+                    runner, source = AggregationRunner.from_records(data['records']), "records"
+                elif self.pipeline_store is not None:
+                    runner, source = self.pipeline_store.aggregation_runner(), "local_mirror"
+                else:
+                    return jsonify({"error": "No pipeline mirror loaded; pass records to aggregate"}), 400
+                
+                return jsonify({
+                    "status": "success",
+                    "source": source,
+                    "results": runner.run_multiple(specs)
+                })
+                
+            except AggregationError as e:
+                return jsonify({"error": str(e)}), 400
+            except Exception as e:
+                logger.error(f"Error in aggregate endpoint: {e}")
+                return jsonify({"error": str(e)}), 500
+    
+        @self.app.route('/admin/reload-routing', methods=['POST'])
+        def reload_routing():
+            if self.admin_token and not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), self.admin_token):
+                return jsonify({"error": "Invalid admin token"}), 403
+            try:
+                force = bool((request.get_json(silent=True) or {}).get('force'))
+                return jsonify(self.routing.reload(force=force))
+            except RoutingConfigError as e:
+                return jsonify({"error": str(e), "routingVersion": self.routing.config.version}), 400
+    
+    def enable_pipeline_sync(self, state_path: str, interval_s: float, batch_size: int = 5000,
+                             snapshot_path: Optional[str] = None):
+        """
+        Keep the pipeline mirror fresh from Salesforce, swapping in each completed sync.
+        Until the first sync finishes (or a saved one is restored) the current mirror,
+        if any, keeps answering.
+        """
+        from pipeline_rollups import PipelineRollups
+        from pipeline_sync import PipelineSync, SalesforceQuerySource, WatermarkStore
+        
+        def publish(store: 'PipelineStore'):
+            rollups = self.pipeline_rollups
+            self.pipeline_rollups = rollups.refresh(store) if rollups else PipelineRollups.build(store)
+            self.pipeline_store = store
+        
+        self.pipeline_sync = PipelineSync(
+            SalesforceQuerySource(self.auth),
+            WatermarkStore(state_path),
+            snapshot_path=snapshot_path,
+            publish=publish,
+            batch_size=batch_size
+        )
+        if self.pipeline_sync.ready:
+            publish(self.pipeline_sync.store)
+        self.pipeline_sync.start_background(interval_s=interval_s)
+    
+    def _route(self, text: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Route text, reusing a persisted decision for the same router and config version"""
+        # One router for the whole request, even if a reload swaps in another meanwhile
+        router = self.router
+        if session_id:
+            # Depends on the conversation so far, so never served from or written to the cache
+            result = router.route_request(text, session_id=session_id)
+        elif self.result_cache is None:
+            result = router.route_request(text)
+        else:
+            key = routing_key(router.cache_version, text)
+            result = self.result_cache.get('route', key)
+            if result is None:
+                result = router.route_request(text)
+                self.result_cache.put('route', key, result)
+        return {**result, "routingVersion": router.routing_version}
+    
+    def _execute_tool(self, tool: str, args: Dict[str, Any], text: str) -> Dict[str, Any]:
+        """Run a routed tool in-process; returns a response dict, or (dict, status) on failure"""
+        data = {**args, 'text': text}
+        if data.get('compare') and tool in self.COMPARABLE_TOOLS:
+            return self._handle_comparison(tool, data)
+        if tool == 'open_pipe_negative':
+            return self._handle_negative_intent(data)
+        if tool == 'kpi_analyze':
+            return self._handle_kpi_analysis(data)
+        if tool == 'open_pipe_analyze':
+            return self._handle_regular_analysis(data)
+        return self._handle_tool_action(tool, data)
+    
+    def _regular_sf_args(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Open pipe analysis action inputs for an /analyze payload"""
+        sf_args = {
+            'naturalLanguageQuery': data.get('text', ''),
+            'ouName': data.get('ouName'),
+            'limitN': data.get('limitN', data.get('limit', '10')),
+            'correlationId': data.get('correlationId', f'regular-{hash(str(data)) % 10000}')
+        }
+        
+        # Add optional parameters
+        for key in ('country', 'timeFrame', 'minStage', 'productListCsv'):
+            if key in data:
+                sf_args[key] = data[key]
+        return sf_args
+    
+    def _kpi_sf_args(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """KPI analysis action inputs for an /analyze payload (AN_KPI_FromMCP takes one JSON string)"""
+        args = {
+            'ouName': data.get('ouName'),
+            'timeFrame': data.get('timeFrame', 'CURRENT'),
+            'correlationId': data.get('correlationId', f'kpi-{hash(str(data)) % 10000}')
+        }
+        if data.get('country'):
+            # The adapter filters on work location country through 'region'
+            args['region'] = data['country']
+        return {'normalizedArgsJsons': json.dumps(args)}
+    
+    def _negative_sf_args(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Negative intent open pipe action inputs for an /analyze payload"""
+        sf_args = {
+            'naturalLanguageQuery': data.get('text', ''),
+            'ouName': data.get('ouName'),
+            'excludeProductListCsv': data.get('excludeProducts'),
+            'negativeIntent': True,
+            'requireNoProductMatch': True,
+            'limitN': data.get('limit', '10'),
+            'correlationId': data.get('correlationId', f'negative-{hash(str(data)) % 10000}')
+        }
+        if 'country' in data:
+            sf_args['country'] = data['country']
+        return sf_args
+    
+    def _salesforce_request(self, tool: str, data: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        The (action name, inputs) /analyze will send to Salesforce for a routed tool,
+        or None when it is answered locally (dry run, mirror or rollups)
+        """
+        if self.dry_run or not data.get('ouName'):
+            return None
+        if tool == 'open_pipe_analyze' and self.pipeline_store is None:
+            return "ANAGENT Open Pipe Analysis V3 - MCP Enhanced", self._regular_sf_args(data)
+        if tool == 'open_pipe_negative' and self.pipeline_store is None:
+            return "ANAGENT Open Pipe Analysis V3 - MCP Enhanced", self._negative_sf_args(data)
+        if tool == 'kpi_analyze' and self.pipeline_rollups is None:
+            return "Run KPI Analysis from MCP", self._kpi_sf_args(data)
+        return None
+    
+    def _prefetch(self, routed: Dict[str, Any], text: str):
+        """Start the Salesforce call a routed request is about to make with /analyze"""
+        tool = routed.get('tool')
+        if tool not in self.prefetcher.tools:
+            return
+        data = {**routed['args'], 'text': text}
+        # A comparison makes one call per time frame
+        legs = [{**data, 'timeFrame': tf} for tf in self.COMPARED_TIME_FRAMES] if data.get('compare') else [data]
+        for leg in legs:
+            request = self._salesforce_request(tool, leg)
+            if request is None:
+                return
+            action_name, sf_args = request
+            self.prefetcher.start(tool, speculation_key(action_name, sf_args),
+                                  partial(self._call_salesforce_action, action_name, sf_args, speculative=True))
+    
     def _handle_regular_analysis(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Handle regular open pipe analysis by calling Salesforce action"""
         try:
-            # Prepare Salesforce action request
-            sf_args = {
-                'naturalLanguageQuery': data.get('text', ''),
-                'ouName': data.get('ouName'),
-                'limitN': data.get('limit', '10'),
-                'correlationId': data.get('correlationId', f'regular-{hash(str(data)) % 10000}')
-            }
+            sf_args = self._regular_sf_args(data)
             
-            # Add optional parameters
-            if 'country' in data:
-                sf_args['country'] = data['country']
-            if 'timeFrame' in data:
-                sf_args['timeFrame'] = data['timeFrame']
-            if 'minStage' in data:
-                sf_args['minStage'] = data['minStage']
-            if 'productListCsv' in data:
-                sf_args['productListCsv'] = data['productListCsv']
+            # Answer from the rollups or the local mirror when one is loaded (one snapshot per request)
+            pipeline_store = self.pipeline_store
+            if pipeline_store is not None and sf_args['ouName']:
+                query = dict(
+                    ouName=sf_args['ouName'],
+                    country=sf_args.get('country'),
+                    minStage=sf_args.get('minStage'),
+                    productListCsv=sf_args.get('productListCsv'),
+                    timeFrame=sf_args.get('timeFrame', 'CURRENT'),
+                    limitN=int(sf_args['limitN'])
+                )
+                rollups = self.pipeline_rollups
+                result = rollups.open_pipe_analyze(**query) if rollups is not None else None
+                source = "rollup"
+                if result is None:
+                    result, source = pipeline_store.open_pipe_analyze(**query), "local_mirror"
+                return {
+                    "status": "success",
+                    "message": "Regular analysis - answered from local pipeline mirror",
+                    "source": source,
+                    "result": result
+                }
             
             # For dry run, return the Salesforce action parameters
             if self.dry_run:
-                return jsonify({
+                return {
                     "status": "success",
                     "message": "Regular analysis - would call Salesforce action",
                     "salesforce_action": "ANAGENT Open Pipe Analysis V3 - MCP Enhanced",
                     "sf_args": sf_args,
                     "note": "This is a dry run. Set DRY_RUN=false to call Salesforce."
-                })
+                }
             
             # Call the actual Salesforce action
             return self._call_salesforce_action("ANAGENT Open Pipe Analysis V3 - MCP Enhanced", sf_args)
             
         except Exception as e:
             logger.error(f"Error handling regular analysis: {e}")
-            return jsonify({"error": f"Failed to handle regular analysis: {str(e)}"}), 500
+            return {"error": f"Failed to handle regular analysis: {str(e)}"}, 500
     
-    def _handle_negative_intent(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Handle negative intent queries by calling Salesforce action"""
+    def _handle_kpi_analysis(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Handle KPI analysis from the rollups when a mirror is loaded, else the Salesforce action"""
         try:
-            # Prepare Salesforce action request
-            sf_args = {
-                'naturalLanguageQuery': data.get('text', ''),
-                'ouName': data.get('ouName'),
-                'excludeProductListCsv': data.get('excludeProducts'),
-                'negativeIntent': True,
-                'requireNoProductMatch': True,
-                'limitN': data.get('limit', '10'),
-                'correlationId': data.get('correlationId', f'negative-{hash(str(data)) % 10000}')
-            }
+            rollups = self.pipeline_rollups
+            if rollups is not None and data.get('ouName'):
+                return {
+                    "status": "success",
+                    "message": "KPI analysis - answered from pipeline rollups",
+                    "source": "rollup",
+                    "result": rollups.kpi_analyze(data['ouName'], data.get('timeFrame', 'CURRENT'), data.get('country'))
+                }
+            
+            sf_args = self._kpi_sf_args(data)
             
-            # Add optional parameters
-            if 'country' in data:
-                sf_args['country'] = data['country']
+            if self.dry_run:
+                return {
+                    "status": "success",
+                    "message": "KPI analysis - would call Salesforce action",
+                    "salesforce_action": "Run KPI Analysis from MCP",
+                    "sf_args": sf_args,
+                    "note": "This is a dry run. Set DRY_RUN=false to call Salesforce."
+                }
             
+            return self._call_salesforce_action("Run KPI Analysis from MCP", sf_args)
+            
+        except Exception as e:
+            logger.error(f"Error handling KPI analysis: {e}")
+            return {"error": f"Failed to handle KPI analysis: {str(e)}"}, 500
+    
+    def _handle_negative_intent(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Handle negative intent queries by calling Salesforce action"""
+        try:
+            sf_args = self._negative_sf_args(data)
+
+            # Set difference over the mirror's bitmap index instead of an Apex heap-bound scan
+            pipeline_store = self.pipeline_store
+            if pipeline_store is not None and sf_args['ouName']:
+                return {
+                    "status": "success",
+                    "message": "Negative intent - answered from local pipeline mirror",
+                    "source": "local_mirror",
+                    "result": pipeline_store.bitmap_index().negative_intent(
+                        ouName=sf_args['ouName'],
+                        excludeProducts=sf_args['excludeProductListCsv'],
+                        country=sf_args.get('country'),
+                        timeFrame=data.get('timeFrame', 'CURRENT'),
+                        includeProducts=data.get('productListCsv'),
+                        minStage=data.get('minStage'),
+                        limitN=int(sf_args['limitN'])
+                    )
+                }
+
             # For dry run, return the Salesforce action parameters
             if self.dry_run:
-                return jsonify({
+                return {
                     "status": "success",
                     "message": "Negative intent detected - would call Salesforce action",
                     "salesforce_action": "ANAGENT Open Pipe Analysis V3 - MCP Enhanced",
                     "sf_args": sf_args,
                     "note": "This is a dry run. Set DRY_RUN=false to call Salesforce."
-                })
+                }
             
             # Call the actual Salesforce action
             return self._call_salesforce_action("ANAGENT Open Pipe Analysis V3 - MCP Enhanced", sf_args)
             
         except Exception as e:
             logger.error(f"Error handling negative intent: {e}")
-            return jsonify({"error": f"Failed to handle negative intent: {str(e)}"}), 500
+            return {"error": f"Failed to handle negative intent: {str(e)}"}, 500
     
-    def _call_salesforce_action(self, action_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
-        """Call Salesforce action via REST API"""
+    def _handle_comparison(self, tool: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        CURRENT vs PREVIOUS in one request. Open pipe over the mirror is one pass with
+        per-product and per-stage deltas; otherwise the two analyses run concurrently
+        and their numeric results (KPI totals) are diffed. Salesforce answers with a
+        formatted message, so for live calls both are returned side by side.
+        """
         try:
-            if not self.sf_base_url or not self.sf_access_token:
-                return jsonify({"error": "Salesforce not configured"}), 500
+            pipeline_store = self.pipeline_store
+            if tool == 'open_pipe_analyze' and pipeline_store is not None and data.get('ouName'):
+                from pipeline_compare import compare_open_pipe
+                return {
+                    "status": "success",
+                    "message": "Open pipe comparison - answered from local pipeline mirror",
+                    "source": "local_mirror",
+                    "comparison": compare_open_pipe(
+                        pipeline_store,
+                        ouName=data['ouName'],
+                        country=data.get('country'),
+                        minStage=data.get('minStage'),
+                        productListCsv=data.get('productListCsv'),
+                        limitN=int(data.get('limitN', data.get('limit', '10')))
+                    )
+                }
             
-            # Prepare the request payload
-            payload = {
-                "inputs": [args]
+            handler = self._handle_kpi_analysis if tool == 'kpi_analyze' else self._handle_regular_analysis
+            legs = []
+            for time_frame in self.COMPARED_TIME_FRAMES:
+                leg = {key: value for key, value in data.items() if key != 'compare'}
+                leg['timeFrame'] = time_frame
+                if 'correlationId' in data:
+                    leg['correlationId'] = f"{data['correlationId']}-{time_frame.lower()}"
+                legs.append(leg)
+            # PREVIOUS on the pool while CURRENT runs on the request thread
+            previous_future = self._comparison_executor.submit(handler, legs[1])
+            current = handler(legs[0])
+            previous = previous_future.result()
+            for result in (current, previous):
+                if isinstance(result, tuple):
+                    return result
+            
+            response = {
+                "status": "success",
+                "message": f"{tool} comparison - {' and '.join(self.COMPARED_TIME_FRAMES)} run concurrently",
+                "current": current,
+                "previous": previous
             }
+            if isinstance(current.get('result'), dict) and isinstance(previous.get('result'), dict):
+                from pipeline_compare import numeric_deltas
+                response["deltas"] = numeric_deltas(current['result'], previous['result'])
+            return response
+            
+        except Exception as e:
+            logger.error(f"Error handling {tool} comparison: {e}")
+            return {"error": f"Failed to handle {tool} comparison: {str(e)}"}, 500
+    
+    def _handle_tool_action(self, tool: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Content search, SME search, workflow and future pipeline through their MCP invocable actions"""
+        try:
+            action_name = self.TOOL_ACTIONS[tool]
+            args = {key: value for key, value in data.items() if key != 'text'}
+            if tool == 'sme_search' and 'searchTerm' not in args:
+                # AN_SearchSME_FromMCP searches by term; the router extracts expertise or region
+                args['searchTerm'] = args.get('expertise') or args.get('region')
+            args.setdefault('correlationId', f'{tool}-{hash(str(data)) % 10000}')
+            sf_args = {'normalizedArgsJsons': json.dumps(args)}
+            
+            if self.dry_run:
+                return {
+                    "status": "success",
+                    "message": f"{tool} - would call Salesforce action",
+                    "salesforce_action": action_name,
+                    "sf_args": sf_args,
+                    "note": "This is a dry run. Set DRY_RUN=false to call Salesforce."
+                }
+            
+            return self._call_salesforce_action(action_name, sf_args)
             
-            # Make the REST API call
+        except Exception as e:
+            logger.error(f"Error handling {tool}: {e}")
+            return {"error": f"Failed to handle {tool}: {str(e)}"}, 500
+    
+    def _post_action(self, action_name: str, payload: Dict[str, Any]) -> 'requests.Response':
+        """POST an invocable action request, refreshing the token and retrying once on 401"""
+        import requests
+        
+        url = f"{self.sf_base_url}/services/data/v58.0/actions/custom/{action_name}"
+        
+        def send(token: str) -> 'requests.Response':
             headers = {
-                'Authorization': f'Bearer {self.sf_access_token}',
+                'Authorization': f'Bearer {token}',
                 'Content-Type': 'application/json'
             }
+            return self.sf_caller.call(
+                action_name,
+                lambda: requests.post(url, json=payload, headers=headers, timeout=self.request_timeout),
+                idempotent=action_name in self.IDEMPOTENT_ACTIONS,
+                is_failure=lambda r: r.status_code >= 500 or r.status_code == 429
+            )
+        
+        token = self.auth.get_token()
+        response = send(token)
+        if response.status_code == 401 and self.auth.can_refresh:
+            logger.info(f"Salesforce returned 401 for {action_name}, refreshing token")
+            response = send(self.auth.refresh(stale_token=token))
+        return response
+    
+    def _send_action_batch(self, action_name: str, inputs: List[Dict[str, Any]]) -> tuple:
+        """Send a multi-input invocable action request for the batcher"""
+        response = self._post_action(action_name, {"inputs": inputs})
+        if response.status_code != 200:
+            raise BatchError(f"Salesforce API error: {response.status_code}", response.status_code,
+                             response.text, retry_after_s=self._retry_after(response))
+        return response.status_code, response.json()
+    
+    @staticmethod
+    def _retry_after(response: 'requests.Response') -> Optional[float]:
+        """Seconds from a Retry-After header given in seconds, else None"""
+        try:
+            return float(response.headers.get('Retry-After', ''))
+        except ValueError:
+            return None
+    
+    def _action_error(self, action_name: str, status_code: int, body: str,
+                      retry_after_s: Optional[float] = None) -> tuple:
+        """
+        Response for a failed action request. A 401 (after any token refresh) stays
+        401; throttling and unavailability keep their status and are marked
+        retryable; anything else is a 500.
+        """
+        error = {
+            "status": "error",
+            "message": f"Salesforce API error: {status_code}",
+            "error": body
+        }
+        if status_code == 401:
+            logger.error(f"Salesforce returned 401 for {action_name}")
+            return {**error, "message": "Salesforce authentication failed"}, 401
+        if status_code in self.RETRYABLE_STATUS:
+            error["retryable"] = True
+            if retry_after_s is not None:
+                error["retry_after_s"] = retry_after_s
+            return error, status_code
+        return error, 500
+    
+    def _call_salesforce_action(self, action_name: str, args: Dict[str, Any],
+                                speculative: bool = False) -> Dict[str, Any]:
+        """Call Salesforce action via REST API"""
+        import requests
+        
+        try:
+            if not self.sf_base_url or not self.auth.is_configured():
+                return {"error": "Salesforce not configured"}, 500
             
-            url = f"{self.sf_base_url}/services/data/v58.0/actions/custom/{action_name}"
+            # Attach to the call /route already started for these inputs; one still queued is
+            # cancelled by claim() and made here instead
+            if self.prefetcher is not None and not speculative:
+                future = self.prefetcher.claim(speculation_key(action_name, args))
+                if future is not None:
+                    result = future.result()
+                    if isinstance(result, dict):
+                        result = {**result, "prefetched": True}
+                    return result
             
-            response = requests.post(url, json=payload, headers=headers)
+            # Replay persisted results for read-only actions
+            cacheable = self.result_cache is not None and action_name in self.IDEMPOTENT_ACTIONS
+            if cacheable:
+                cached = self.result_cache.get('action', action_key(action_name, args))
+                if cached is not None:
+                    return {
+                        "status": "success",
+                        "message": f"Called Salesforce action: {action_name}",
+                        "result": cached,
+                        "cached": True
+                    }
             
-            if response.status_code == 200:
-                return jsonify({
-                    "status": "success",
-                    "message": f"Called Salesforce action: {action_name}",
-                    "result": response.json()
-                })
+            if self.batcher is not None:
+                # Coalesce with concurrent calls to the same action; keep the one-input response shape
+                try:
+                    result = [self.batcher.submit(action_name, args).result()]
+                except BatchError as e:
+                    return self._action_error(action_name, e.status_code, e.body, e.retry_after_s)
             else:
-                return jsonify({
-                    "status": "error",
-                    "message": f"Salesforce API error: {response.status_code}",
-                    "error": response.text
-                }), 500
+                # Prepare the request payload
+                payload = {
+                    "inputs": [args]
+                }
+                
+                response = self._post_action(action_name, payload)
                 
+                if response.status_code != 200:
+                    return self._action_error(action_name, response.status_code, response.text,
+                                              self._retry_after(response))
+                result = response.json()
+            
+            # A failed action (isSuccess false) is returned but not replayed
+            if cacheable and all(isinstance(entry, dict) and entry.get('isSuccess') for entry in result):
+                self.result_cache.put('action', action_key(action_name, args), result,
+                                      ttl_s=self.action_cache_ttl_s)
+            return {
+                "status": "success",
+                "message": f"Called Salesforce action: {action_name}",
+                "result": result
+            }
+                
+        except AuthError as e:
+            logger.error(f"Salesforce authentication failed: {e}")
+            return {"status": "error", "message": "Salesforce authentication failed", "error": str(e)}, 401
+        except CircuitOpenError as e:
+            logger.warning(str(e))
+            return {
+                "status": "error",
+                "message": f"Salesforce action temporarily unavailable: {action_name}",
+                "error": str(e),
+                "retryable": True,
+                "retry_after_s": round(e.retry_after_s, 1)
+            }, 503
+        except requests.exceptions.Timeout:
+            logger.error(f"Salesforce action timed out after {self.request_timeout}s: {action_name}")
+            return {"error": f"Salesforce action timed out after {self.request_timeout}s"}, 504
         except Exception as e:
             logger.error(f"Error calling Salesforce action: {e}")
-            return jsonify({"error": f"Failed to call Salesforce action: {str(e)}"}), 500
+            return {"error": f"Failed to call Salesforce action: {str(e)}"}, 500
     
     def run(self, host: str = 'localhost', port: int = 8787):
         """Run the Flask server"""
         logger.info(f"Starting Comprehensive MCP server on {host}:{port}")
         logger.info(f"Dry run mode: {self.dry_run}")
-        logger.info(f"Salesforce configured: {bool(self.sf_base_url and self.sf_access_token)}")
+        logger.info(f"Salesforce configured: {bool(self.sf_base_url and self.auth.is_configured())}")
         logger.info(f"Supported tools: {list(self.router.tool_patterns.keys())}")
+        logger.info(f"Routing config: {self.routing.config.tag}")
+        
+        if not self.dry_run:
+            self.auth.start_background_refresh()
+        # kill -HUP <pid> reloads routing_config.json without a restart
+        self.routing.install_signal_handler()
         
         self.app.run(host=host, port=port, debug=False)
 
@@ -724,21 +1406,49 @@ def main():
     args = parser.parse_args()
     
     # Load environment variables
+    from dotenv import load_dotenv
     load_dotenv()
     
     # Get configuration from environment
     sf_base_url = os.getenv('SF_BASE_URL')
-    sf_access_token = os.getenv('SF_ACCESS_TOKEN')
     dry_run = args.dry_run or (not args.live and os.getenv('DRY_RUN', 'true').lower() == 'true')
     port = int(os.getenv('PORT', args.port))
     host = os.getenv('HOST', args.host)
+    request_timeout = float(os.getenv('SF_TIMEOUT_SECONDS', '30'))
+    hedge_reads = os.getenv('SF_HEDGE_READS', 'false').lower() == 'true'
+    action_cache_ttl_s = float(os.getenv('RESULT_CACHE_ACTION_TTL', '3600'))
+    batch_window_ms = float(os.getenv('SF_BATCH_WINDOW_MS', '0'))
+    pipeline_mirror_path = os.getenv('PIPELINE_MIRROR_PATH')
+    routing_config_path = os.getenv('ROUTING_CONFIG_PATH') or ROUTING_CONFIG_PATH
+    pipeline_store = None
+    if pipeline_mirror_path:
+        from pipeline_store import PipelineStore
+        pipeline_store = PipelineStore.load(pipeline_mirror_path)
     
     # Start the server
     server = ComprehensiveMCPServer(
         dry_run=dry_run,
         sf_base_url=sf_base_url,
-        sf_access_token=sf_access_token
+        auth=SalesforceAuthManager.from_env(),
+        request_timeout=request_timeout,
+        hedge_reads=hedge_reads,
+        result_cache=ResultCache.from_env(),
+        action_cache_ttl_s=action_cache_ttl_s,
+        batch_window_ms=batch_window_ms,
+        pipeline_store=pipeline_store,
+        routing_config_path=routing_config_path,
+        admin_token=os.getenv('ADMIN_TOKEN') or None,
+        sessions=SessionStore.from_env(),
+        prefetcher=None if dry_run else SpeculativePrefetcher.from_env()
     )
+    sync_interval_s = float(os.getenv('PIPELINE_SYNC_INTERVAL', '0'))
+    if sync_interval_s > 0 and not dry_run:
+        server.enable_pipeline_sync(
+            state_path=os.getenv('PIPELINE_SYNC_STATE', '.cache/pipeline_sync.json'),
+            interval_s=sync_interval_s,
+            batch_size=int(os.getenv('PIPELINE_SYNC_BATCH', '5000')),
+            snapshot_path=os.getenv('PIPELINE_SYNC_SNAPSHOT', '.cache/pipeline_sync.npz') or None
+        )
     server.run(host=host, port=port)
 
 if __name__ == "__main__":
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Vectorized group-by aggregation over pipeline records
+Python counterpart of ANAgentAggregationSpec / ANAgentAggregationRunner: the same
+metric and dimension registries and result shape, evaluated with NumPy over the
+local mirror or over records returned from Salesforce
+"""
+
+import logging
+import time
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+
+from pipeline_store import PipelineStore, ColumnTable, DictColumn
+from topk import top_k_indices
+
+logger = logging.getLogger(__name__)
+
+
+class AggregationError(ValueError):
+    """Invalid spec: unknown metric or dimension, unsupported time frame or aggregate"""
+
+
+@dataclass(frozen=True)
+class MetricDefinition:
+    metricKey: str
+    currentField: str
+    previousField: Optional[str]
+    defaultAgg: str
+    requiresTimeframe: bool
+    perAEDenominator: bool
+    precision: int
+
+
+# Same entries as ANAgentMetricRegistry
+METRICS = {m.metricKey: m for m in [
+    MetricDefinition('ACV', 'CQ_ACV__c', 'PQ_ACV__c', 'SUM', True, False, 2),
+    MetricDefinition('PG', 'CQ_PG__c', 'PQ_PG__c', 'SUM', True, False, 2),
+    MetricDefinition('CALLS', 'CQ_CALL_CONNECT__c', 'PQ_CALL_CONNECT__c', 'AVG', True, True, 2),
+    MetricDefinition('MEETINGS', 'CQ_CUSTOMER_MEETING__c', 'PQ_CUSTOMER_MEETING__c', 'AVG', True, True, 2),
+    MetricDefinition('AI_MENTIONS', 'CALL_AI_MENTION__c', None, 'COUNT', False, False, 0),
+    MetricDefinition('COVERAGE', 'COVERAGE__c', None, 'AVG', False, True, 2),
+    MetricDefinition('RAMP_STATUS', 'RAMP_STATUS__c', None, 'AVG', False, True, 2),
+    MetricDefinition('GROWTH_FACTORS', 'ACTIONABLE__c', None, 'COUNT', False, False, 0),
+]}
+
+# Same keys as ANAgentDimensionRegistry (legacy aliases included)
+DIMENSIONS = {
+    'COUNTRY': 'WORK_LOCATION_COUNTRY__c',
+    'REGION': 'WORK_LOCATION_COUNTRY__c',
+    'OU': 'OU_NAME__c',
+    'INDUSTRY': 'PRIMARY_INDUSTRY__c',
+    'AE': 'EMP_ID__c',
+    'MANAGER': 'EMP_MGR_NM__c',
+    'FULL_NAME': 'FULL_NAME__c',
+    'EMAIL': 'EMP_EMAIL_ADDR__c',
+    'LEARNER_PROFILE': 'LEARNER_PROFILE_ID__c',
+    'WORK_LOCATION_COUNTRY': 'WORK_LOCATION_COUNTRY__c',
+    'OU_NAME': 'OU_NAME__c',
+    'PRIMARY_INDUSTRY': 'PRIMARY_INDUSTRY__c',
+    'EMP_ID': 'EMP_ID__c',
+    'EMP_MGR_NM': 'EMP_MGR_NM__c',
+    'EMP_EMAIL_ADDR': 'EMP_EMAIL_ADDR__c',
+    'LEARNER_PROFILE_ID': 'LEARNER_PROFILE_ID__c',
+    'TIME_FRAME': 'TIME_FRAME',
+}
+
+COUNTRY_ALIASES = {
+    'USA': 'US', 'U.S.': 'US', 'United States': 'US',
+    'Brasil': 'Brazil', 'UK': 'UKI', 'U.K.': 'UKI'
+}
+DIMENSION_ALIASES = {'COUNTRY': COUNTRY_ALIASES, 'WORK_LOCATION_COUNTRY': COUNTRY_ALIASES}
+
+AGG_FUNCTIONS = ('SUM', 'AVG', 'COUNT', 'MIN', 'MAX', 'PERCENTILE')
+
+
+def field_for(dim_key: str) -> str:
+    """Field API name for a dimension key, like ANAgentDimensionRegistry.fieldFor"""
+    mapped = DIMENSIONS.get(dim_key.upper())
+    if mapped:
+        return mapped
+    return dim_key if dim_key.endswith('__c') else dim_key + '__c'
+
+
+def normalize_value(dim_key: str, raw: Any) -> Any:
+    if not isinstance(raw, str):
+        return raw
+    value = raw.strip()
+    return DIMENSION_ALIASES.get(dim_key.upper(), {}).get(value, value)
+
+
+@dataclass
+class AggregationSpec:
+    """
+    One aggregation request.
+
+    filters replaces the Apex filterWhere fragment with {dimension: value or
+    [values]}; dimensions are registry keys or field API names. aggFn defaults to
+    the metric's registry aggregate and may be overridden with SUM, AVG, COUNT,
+    MIN, MAX, MEDIAN, PERCENTILE (with percentile) or a shorthand like "P90".
+    As in Apex, timeFrame only picks the CQ_/PQ_ metric field; to restrict rows
+    to one TIME_FRAME, add it to filters.
+    """
+
+    metricKey: str
+    timeFrame: str = 'CURRENT'
+    groupByDim: Optional[str] = None
+    filters: Dict[str, Any] = field(default_factory=dict)
+    limitN: Optional[int] = None
+    restrictInValues: List[str] = field(default_factory=list)
+    perAENormalize: bool = False
+    requireNonNullMetric: bool = True
+    aggFn: Optional[str] = None
+    percentile: Optional[float] = None
+
+    # Resolved by from_request
+    metricFieldApi: Optional[str] = None
+    groupByFieldApi: Optional[str] = None
+    precision: int = 2
+
+    @classmethod
+    def from_request(cls, metricKey: str, timeFrame: Optional[str] = 'CURRENT', groupByDim: Optional[str] = None,
+                     filters: Optional[Dict[str, Any]] = None, limitN: Optional[int] = None,
+                     restrictInValues: Optional[List[str]] = None, perAENormalize: Optional[bool] = None,
+                     requireNonNullMetric: bool = True, aggFn: Optional[str] = None,
+                     percentile: Optional[float] = None) -> 'AggregationSpec':
+        """Resolve metric and dimension fields, mirroring ANAgentAggregationSpec.fromRequest"""
+        definition = METRICS.get((metricKey or '').upper())
+        if definition is None:
+            raise AggregationError(f"Unknown metric: {metricKey}")
+        time_frame = (timeFrame or 'CURRENT').upper()
+        if time_frame == 'PREVIOUS' and definition.previousField is None:
+            raise AggregationError(f"Metric {metricKey} does not support PREVIOUS timeframe")
+
+        agg_fn = (aggFn or definition.defaultAgg).upper()
+        if agg_fn == 'MEDIAN':
+            agg_fn, percentile = 'PERCENTILE', 50.0
+        elif agg_fn.startswith('P') and agg_fn[1:].replace('.', '', 1).isdigit():
+            agg_fn, percentile = 'PERCENTILE', float(agg_fn[1:])
+        if agg_fn not in AGG_FUNCTIONS:
+            raise AggregationError(f"Unsupported aggregate: {aggFn}")
+        if agg_fn == 'PERCENTILE' and (percentile is None or not 0 <= float(percentile) <= 100):
+            raise AggregationError("PERCENTILE needs a percentile between 0 and 100")
+
+        return cls(
+            metricKey=definition.metricKey,
+            timeFrame=time_frame,
+            groupByDim=groupByDim or None,
+            filters=dict(filters or {}),
+            limitN=int(limitN) if limitN else None,
+            restrictInValues=list(restrictInValues or []),
+            perAENormalize=bool(perAENormalize),
+            requireNonNullMetric=requireNonNullMetric,
+            aggFn=agg_fn,
+            percentile=float(percentile) if percentile is not None else None,
+            metricFieldApi=definition.previousField if time_frame == 'PREVIOUS' else definition.currentField,
+            groupByFieldApi=field_for(groupByDim) if groupByDim else None,
+            precision=definition.precision
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'AggregationSpec':
+        keys = ('metricKey', 'timeFrame', 'groupByDim', 'filters', 'limitN', 'restrictInValues',
+                'perAENormalize', 'requireNonNullMetric', 'aggFn', 'percentile')
+        return cls.from_request(**{k: data[k] for k in keys if k in data})
+
+    def summary(self) -> str:
+        agg = f"P{self.percentile:g}" if self.aggFn == 'PERCENTILE' else self.aggFn
+        return f"{agg}({self.metricFieldApi}) BY {self.groupByFieldApi or '-'} [{self.timeFrame}]"
+
+
+class AggregationRunner:
+    """
+    Runs AggregationSpecs over the employee table of a PipelineStore.
+
+    Result shape matches ANAgentAggregationRunner.Result: rows of {groupValue,
+    agg, nPeople} plus totalAgg and totalPeople, with rows ordered by agg
+    (largest first) before limitN is applied. Column dictionary codes are
+    computed once per runner, and run_multiple shares filter masks and group
+    codes across specs so a batch costs one pass per distinct filter set.
+    """
+
+    def __init__(self, table: ColumnTable):
+        self.table = table
+        self._codes: Dict[str, Tuple[np.ndarray, List[Any]]] = {}
+
+    @classmethod
+    def from_store(cls, store: PipelineStore) -> 'AggregationRunner':
+        return cls(store.employees)
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> 'AggregationRunner':
+        """Runner over records returned by Salesforce (field API names as keys)"""
+        return cls(PipelineStore.from_records(records).employees)
+
+    # ------------------------------------------------------------------ columns
+
+    def _column(self, name: str) -> Any:
+        if name not in self.table:
+            raise AggregationError(f"Unknown field: {name}")
+        return self.table[name]
+
+    def codes(self, name: str) -> Tuple[np.ndarray, List[Any]]:
+        """(int codes, distinct values) for a text column; -1 is null"""
+        cached = self._codes.get(name)
+        if cached is not None:
+            return cached
+        column = self._column(name)
+        if isinstance(column, DictColumn):
+            cached = (column.codes, column.values)
+        else:
+            present = np.not_equal(column, None)
+            values, inverse = np.unique(column[present].astype(str), return_inverse=True)
+            codes = np.full(len(column), -1, dtype=np.int64)
+            codes[present] = inverse
+            cached = (codes, values.tolist())
+        self._codes[name] = cached
+        return cached
+
+    def _match(self, name: str, wanted: List[Any]) -> np.ndarray:
+        """Rows whose column equals any wanted value (case-insensitive for text)"""
+        column = self._column(name)
+        if isinstance(column, np.ndarray) and column.dtype != object:
+            return np.isin(column, np.array(wanted, dtype=np.float64))
+        codes, values = self.codes(name)
+        lowered = {str(v).lower() for v in wanted}
+        matched = [code for code, value in enumerate(values) if value.lower() in lowered]
+        return np.isin(codes, matched) if matched else np.zeros(len(codes), dtype=bool)
+
+    def filter_mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(len(self.table), dtype=bool)
+        for dim, value in filters.items():
+            if value is None:
+                continue
+            wanted = value if isinstance(value, (list, tuple, set)) else [value]
+            mask &= self._match(field_for(dim), [normalize_value(dim, v) for v in wanted])
+        return mask
+
+    # ------------------------------------------------------------------ running
+
+    def run(self, spec: AggregationSpec, _shared: Optional[Dict[Any, Any]] = None) -> Dict[str, Any]:
+        start = time.perf_counter()
+        shared = _shared if _shared is not None else {}
+
+        filter_key = ('filters', tuple(sorted((k, str(v)) for k, v in spec.filters.items())))
+        mask = shared.get(filter_key)
+        if mask is None:
+            mask = shared[filter_key] = self.filter_mask(spec.filters)
+
+        metric = self._column(spec.metricFieldApi)
+        numeric = isinstance(metric, np.ndarray) and metric.dtype != object
+        if numeric:
+            present = ~np.isnan(metric)
+        else:
+            present = self.codes(spec.metricFieldApi)[0] >= 0
+            if spec.aggFn != 'COUNT':
+                raise AggregationError(f"{spec.aggFn} needs a numeric field, {spec.metricFieldApi} is text")
+
+        rows_mask = mask & present if spec.requireNonNullMetric else mask
+        if spec.groupByFieldApi:
+            group_codes, group_values = self.codes(spec.groupByFieldApi)
+            if spec.restrictInValues:
+                rows_mask = rows_mask & self._match(
+                    spec.groupByFieldApi, [normalize_value(spec.groupByDim, v) for v in spec.restrictInValues])
+        else:
+            group_codes, group_values = np.zeros(len(self.table), dtype=np.int64), [None]
+
+        rows = np.flatnonzero(rows_mask)
+        # Compact group codes for the selected rows; null groups get their own slot
+        raw_groups = group_codes[rows].astype(np.int64)
+        keys, groups = np.unique(raw_groups, return_inverse=True)
+        n_groups = len(keys)
+        if not spec.groupByFieldApi and n_groups == 0:
+            keys, n_groups = np.zeros(1, dtype=np.int64), 1
+
+        agg = self._aggregate(spec, metric if numeric else None, present, rows, groups, n_groups)
+
+        people = None
+        if spec.perAENormalize:
+            # COUNT_DISTINCT(EMP_ID__c) per group via distinct (group, employee) pairs
+            emp_codes = self.codes('EMP_ID__c')[0][rows].astype(np.int64)
+            known = emp_codes >= 0
+            stride = int(emp_codes.max(initial=0)) + 1
+            pairs = np.unique(groups[known].astype(np.int64) * stride + emp_codes[known])
+            people = np.bincount(pairs // stride, minlength=n_groups)
+
+        order = top_k_indices(agg, spec.limitN or n_groups)
+
+        result_rows = []
+        for g in order:
+            key = int(keys[g])
+            result_rows.append({
+                "groupValue": group_values[key] if spec.groupByFieldApi and key >= 0 else None,
+                "agg": round(float(agg[g]), spec.precision),
+                "nPeople": int(people[g]) if people is not None else None
+            })
+        return {
+            "spec": spec.summary(),
+            "rows": result_rows,
+            "totalAgg": round(sum(r["agg"] for r in result_rows), spec.precision),
+            "totalPeople": sum(r["nPeople"] or 0 for r in result_rows),
+            "recordCount": int(len(rows)),
+            "queryTimeMs": round((time.perf_counter() - start) * 1000, 3)
+        }
+
+    def _aggregate(self, spec: AggregationSpec, metric: Optional[np.ndarray], present: np.ndarray,
+                   rows: np.ndarray, groups: np.ndarray, n_groups: int) -> np.ndarray:
+        """Per-group aggregate of the metric over rows (nulls ignored, like SOQL)"""
+        has_value = present[rows]
+        if spec.aggFn == 'COUNT':
+            return np.bincount(groups[has_value], minlength=n_groups).astype(np.float64)
+
+        values = metric[rows][has_value]
+        value_groups = groups[has_value]
+        counts = np.bincount(value_groups, minlength=n_groups)
+        if spec.aggFn == 'SUM':
+            return np.bincount(value_groups, weights=values, minlength=n_groups)
+        if spec.aggFn == 'AVG':
+            sums = np.bincount(value_groups, weights=values, minlength=n_groups)
+            return np.divide(sums, counts, out=np.zeros(n_groups), where=counts > 0)
+
+        # MIN / MAX / PERCENTILE: sort values within each group once
+        order = np.lexsort((values, value_groups))
+        sorted_values = values[order]
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+        out = np.zeros(n_groups)
+        filled = counts > 0
+        if spec.aggFn == 'MIN':
+            out[filled] = sorted_values[starts[filled]]
+        elif spec.aggFn == 'MAX':
+            out[filled] = sorted_values[starts[filled] + counts[filled] - 1]
+        else:
+            # Linear interpolation between closest ranks, as numpy.percentile
+            position = starts[filled] + (counts[filled] - 1) * (spec.percentile / 100.0)
+            low = np.floor(position).astype(np.int64)
+            high = np.minimum(low + 1, starts[filled] + counts[filled] - 1)
+            fraction = position - low
+            out[filled] = sorted_values[low] + (sorted_values[high] - sorted_values[low]) * fraction
+        return out
+
+    def run_multiple(self, specs: List[AggregationSpec]) -> List[Dict[str, Any]]:
+        """
+        Run specs in order over one shared scan; a failing spec yields an empty
+        result with its error instead of failing the batch, as in runMultiple.
+        """
+        shared: Dict[Any, Any] = {}
+        results = []
+        for spec in specs:
+            try:
+                results.append(self.run(spec, shared))
+            except Exception as e:
+                logger.error(f"Failed to execute spec: {spec.summary()}: {e}")
+                results.append({"spec": spec.summary(), "rows": [], "totalAgg": 0, "totalPeople": 0,
+                                "error": str(e)})
+        return results
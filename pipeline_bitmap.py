@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Compressed bitmap index over the local pipeline mirror
+Per-AE bitmaps by OU, country, time frame, product and stage, so negative-intent
+("AEs without product X") and multi-product include/exclude queries run as
+bitwise AND / OR / ANDNOT instead of per-row scans
+"""
+
+import time
+import numpy as np
+from typing import Dict, Any, List, Optional, Iterable
+
+from topk import top_k_indices
+
+# Rows are split into chunks of 2^16 by their high bits. A chunk holding at most
+# ARRAY_MAX rows is a sorted uint16 array of the low bits; a denser chunk is a
+# 65536-bit bitset stored as 1024 uint64 words (8 KB either way at the crossover).
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+ARRAY_MAX = 4096
+WORDS_PER_CHUNK = CHUNK_SIZE // 64
+
+
+def _is_bitset(container: np.ndarray) -> bool:
+    return container.dtype == np.uint64
+
+
+def _to_bitset(container: np.ndarray) -> np.ndarray:
+    if _is_bitset(container):
+        return container
+    bits = np.zeros(CHUNK_SIZE, dtype=bool)
+    bits[container] = True
+    return np.packbits(bits, bitorder='little').view(np.uint64)
+
+
+def _to_array(container: np.ndarray) -> np.ndarray:
+    if not _is_bitset(container):
+        return container
+    return np.flatnonzero(np.unpackbits(container.view(np.uint8), bitorder='little')).astype(np.uint16)
+
+
+def _cardinality(container: np.ndarray) -> int:
+    if _is_bitset(container):
+        return int(np.unpackbits(container.view(np.uint8)).sum())
+    return len(container)
+
+
+def _normalize(container: np.ndarray) -> Optional[np.ndarray]:
+    """Pick the smaller representation; None for an empty chunk"""
+    if _is_bitset(container):
+        count = _cardinality(container)
+        if count > ARRAY_MAX:
+            return container
+        container = _to_array(container)
+    elif len(container) > ARRAY_MAX:
+        return _to_bitset(container)
+    return container if len(container) else None
+
+
+def _test(words: np.ndarray, lows: np.ndarray) -> np.ndarray:
+    """Membership of each low value in a bitset"""
+    return ((words[lows >> 6] >> (lows & 63).astype(np.uint64)) & np.uint64(1)).astype(bool)
+
+
+def _and(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    if _is_bitset(a) and _is_bitset(b):
+        return _normalize(a & b)
+    if _is_bitset(a):
+        a, b = b, a
+    if _is_bitset(b):
+        return _normalize(a[_test(b, a)])
+    return _normalize(np.intersect1d(a, b, assume_unique=True))
+
+
+def _or(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    if _is_bitset(a) or _is_bitset(b):
+        return _to_bitset(a) | _to_bitset(b)
+    return _normalize(np.union1d(a, b))
+
+
+def _andnot(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    if _is_bitset(a):
+        return _normalize(a & ~_to_bitset(b))
+    if _is_bitset(b):
+        return _normalize(a[~_test(b, a)])
+    return _normalize(np.setdiff1d(a, b, assume_unique=True))
+
+
+class Bitmap:
+    """
+    Roaring-style compressed set of row numbers.
+
+    containers maps a chunk key (row >> 16) to an array or bitset container for
+    that chunk's low 16 bits. Operations work chunk by chunk and never touch
+    chunks that cannot contribute, so sparse sets stay cheap at any row count.
+    """
+
+    __slots__ = ('containers',)
+
+    def __init__(self, containers: Optional[Dict[int, np.ndarray]] = None):
+        self.containers = containers or {}
+
+    @classmethod
+    def from_rows(cls, rows: np.ndarray) -> 'Bitmap':
+        """Bitmap of sorted, distinct row numbers"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return cls()
+        highs = rows >> CHUNK_BITS
+        keys, starts = np.unique(highs, return_index=True)
+        ends = np.append(starts[1:], len(rows))
+        lows = (rows & (CHUNK_SIZE - 1)).astype(np.uint16)
+        return cls({int(key): _normalize(lows[start:end]) for key, start, end in zip(keys, starts, ends)})
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> 'Bitmap':
+        return cls.from_rows(np.flatnonzero(mask))
+
+    @classmethod
+    def full(cls, n: int) -> 'Bitmap':
+        """Rows 0 .. n-1"""
+        return cls.from_rows(np.arange(n, dtype=np.int64))
+
+    @staticmethod
+    def union_all(bitmaps: Iterable['Bitmap']) -> 'Bitmap':
+        result = Bitmap()
+        for bitmap in bitmaps:
+            result = result | bitmap
+        return result
+
+    def __and__(self, other: 'Bitmap') -> 'Bitmap':
+        containers = {}
+        small, large = (self, other) if len(self.containers) <= len(other.containers) else (other, self)
+        for key, container in small.containers.items():
+            match = large.containers.get(key)
+            if match is not None:
+                merged = _and(container, match)
+                if merged is not None:
+                    containers[key] = merged
+        return Bitmap(containers)
+
+    def __or__(self, other: 'Bitmap') -> 'Bitmap':
+        containers = dict(self.containers)
+        for key, container in other.containers.items():
+            existing = containers.get(key)
+            containers[key] = container if existing is None else _or(existing, container)
+        return Bitmap(containers)
+
+    def __sub__(self, other: 'Bitmap') -> 'Bitmap':
+        """ANDNOT: rows in self that are not in other"""
+        containers = {}
+        for key, container in self.containers.items():
+            match = other.containers.get(key)
+            merged = container if match is None else _andnot(container, match)
+            if merged is not None:
+                containers[key] = merged
+        return Bitmap(containers)
+
+    def __len__(self):
+        return sum(_cardinality(container) for container in self.containers.values())
+
+    def __bool__(self):
+        return bool(self.containers)
+
+    def to_rows(self) -> np.ndarray:
+        """Sorted row numbers as int64"""
+        if not self.containers:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([(np.int64(key) << CHUNK_BITS) + _to_array(self.containers[key]).astype(np.int64)
+                               for key in sorted(self.containers)])
+
+    def nbytes(self) -> int:
+        return sum(container.nbytes for container in self.containers.values())
+
+
+def _group_bitmaps(codes: np.ndarray, rows: np.ndarray) -> Dict[int, Bitmap]:
+    """One bitmap per code from (code, row) pairs sorted by code then row; code -1 is skipped"""
+    if not len(codes):
+        return {}
+    keys, starts = np.unique(codes, return_index=True)
+    ends = np.append(starts[1:], len(codes))
+    return {int(key): Bitmap.from_rows(rows[start:end])
+            for key, start, end in zip(keys, starts, ends) if key >= 0}
+
+
+def _column_bitmaps(codes: np.ndarray) -> Dict[int, Bitmap]:
+    """One bitmap per dictionary code of an employee column"""
+    order = np.argsort(codes, kind='stable')
+    return _group_bitmaps(codes[order], order)
+
+
+def _held_bitmaps(codes: np.ndarray, emp_rows: np.ndarray, n_employees: int) -> Dict[int, Bitmap]:
+    """One bitmap per code of the employees holding at least one open-pipe row with it"""
+    valid = codes >= 0
+    pairs = np.unique(codes[valid].astype(np.int64) * max(n_employees, 1) + emp_rows[valid])
+    return _group_bitmaps(pairs // max(n_employees, 1), pairs % max(n_employees, 1))
+
+
+def _split_csv(value: Any) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [part.strip() for part in str(value).split(',') if part.strip()]
+
+
+class PipelineBitmapIndex:
+    """
+    Bitmaps over the employee rows of one PipelineStore snapshot.
+
+    Every employee row (one AE in one time frame) has a bit in the OU, country and
+    time-frame bitmaps for its own values, in the product bitmap of every product
+    on its open pipe, and in the stage bitmap of every stage its opportunities are
+    in. Negative intent then mirrors the Apex semantics, where an AE is dropped
+    when any of their products matches an excluded name, as one ANDNOT.
+    """
+
+    def __init__(self, store):
+        start = time.perf_counter()
+        self.store = store
+        employees, pipe = store.employees, store.pipe
+        n = len(employees)
+        self.n = n
+        self.ou = _column_bitmaps(employees['OU_NAME__c'].codes)
+        self.country = _column_bitmaps(employees['WORK_LOCATION_COUNTRY__c'].codes)
+        self.time_frame = _column_bitmaps(employees['TIME_FRAME'].codes)
+
+        emp_row = pipe['EMP_ROW'].astype(np.int64)
+        self.products = pipe['OPEN_PIPE_PROD_NM__c']
+        self.product = _held_bitmaps(self.products.codes, emp_row, n)
+        self.stage = _held_bitmaps(pipe['STAGE'].astype(np.int32), emp_row, n)
+
+        amounts = np.nan_to_num(pipe['OPEN_PIPE_ORIGINAL_OPENPIPE_ALLOC_AMT__c'])
+        self.amount_by_ae = np.bincount(emp_row, weights=amounts, minlength=n)
+        self.opps_by_ae = np.bincount(emp_row, minlength=n)
+        # Open-pipe rows grouped by employee, for listing an AE's products
+        self._pipe_order = np.argsort(emp_row, kind='stable')
+        self._pipe_offsets = np.searchsorted(emp_row[self._pipe_order], np.arange(n + 1))
+        self.build_ms = round((time.perf_counter() - start) * 1000, 3)
+
+    # ------------------------------------------------------------------ lookups
+
+    def _lookup(self, bitmaps: Dict[int, Bitmap], column, value: Optional[str]) -> Optional[Bitmap]:
+        """Employees whose column equals value (case-insensitive); None when value is unset"""
+        if not value:
+            return None
+        return Bitmap.union_all(bitmaps[code] for code in column.codes_for(value) if code in bitmaps)
+
+    def product_bitmap(self, name: str) -> Bitmap:
+        """Employees with any open-pipe product containing name, case-insensitively"""
+        return Bitmap.union_all(self.product[code] for code in self.products.codes_containing(name)
+                                if code in self.product)
+
+    def min_stage_bitmap(self, min_stage: int) -> Bitmap:
+        return Bitmap.union_all(bitmap for stage, bitmap in self.stage.items() if stage >= int(min_stage))
+
+    def select(self, ouName: Optional[str] = None, country: Optional[str] = None,
+               timeFrame: Optional[str] = 'CURRENT', includeProducts: Any = None,
+               excludeProducts: Any = None, requireAllProducts: bool = False,
+               minStage: Optional[int] = None) -> Bitmap:
+        """
+        Employees matching every filter.
+
+        includeProducts keeps AEs holding any listed product (all of them with
+        requireAllProducts); excludeProducts drops AEs holding any listed product.
+        Filters are intersected smallest first.
+        """
+        employees = self.store.employees
+        filters = [
+            self._lookup(self.ou, employees['OU_NAME__c'], ouName),
+            self._lookup(self.country, employees['WORK_LOCATION_COUNTRY__c'], country),
+            self._lookup(self.time_frame, employees['TIME_FRAME'], timeFrame),
+        ]
+        include = [self.product_bitmap(name) for name in _split_csv(includeProducts)]
+        if include:
+            filters.extend(include if requireAllProducts else [Bitmap.union_all(include)])
+        if minStage is not None:
+            filters.append(self.min_stage_bitmap(minStage))
+
+        filters = sorted((f for f in filters if f is not None), key=lambda b: len(b.containers))
+        result = filters[0] if filters else Bitmap.full(self.n)
+        for bitmap in filters[1:]:
+            if not result:
+                break
+            result = result & bitmap
+
+        for name in _split_csv(excludeProducts):
+            if not result:
+                break
+            result = result - self.product_bitmap(name)
+        return result
+
+    def ae_products(self, ae: int) -> List[str]:
+        names: List[str] = []
+        for row in self._pipe_order[self._pipe_offsets[ae]:self._pipe_offsets[ae + 1]]:
+            name = self.products[row]
+            if name and name not in names:
+                names.append(name)
+        return names
+
+    # ------------------------------------------------------------------ queries
+
+    def negative_intent(self, ouName: str, excludeProducts: Any, country: Optional[str] = None,
+                        timeFrame: str = 'CURRENT', includeProducts: Any = None,
+                        requireAllProducts: bool = False, minStage: Optional[int] = None,
+                        limitN: int = 10) -> Dict[str, Any]:
+        """
+        AEs in the OU (and country) with no open pipe on any excluded product,
+        largest open pipe first, in the same row shape as open_pipe_analyze.
+        """
+        start = time.perf_counter()
+        base = self.select(ouName, country, timeFrame, includeProducts, None, requireAllProducts, minStage)
+        matched = self.select(ouName, country, timeFrame, includeProducts, excludeProducts,
+                              requireAllProducts, minStage) if excludeProducts else base
+        aes = matched.to_rows()
+        order = aes[top_k_indices(self.amount_by_ae[aes], limitN)]
+
+        employees = self.store.employees
+        rows = []
+        for ae in order:
+            ae = int(ae)
+            rows.append({
+                "empId": employees.value('EMP_ID__c', ae),
+                "fullName": employees.value('FULL_NAME__c', ae),
+                "email": employees.value('EMP_EMAIL_ADDR__c', ae),
+                "country": employees.value('WORK_LOCATION_COUNTRY__c', ae),
+                "opportunities": int(self.opps_by_ae[ae]),
+                "openPipeAmount": round(float(self.amount_by_ae[ae]), 2),
+                "products": self.ae_products(ae)
+            })
+
+        matched_count = len(aes)
+        return {
+            "filters": {
+                "ouName": ouName,
+                "country": country,
+                "timeFrame": timeFrame,
+                "excludeProducts": _split_csv(excludeProducts),
+                "includeProducts": _split_csv(includeProducts),
+                "requireAllProducts": requireAllProducts,
+                "minStage": minStage,
+                "limitN": limitN
+            },
+            "candidateAeCount": len(base),
+            "excludedAeCount": len(base) - matched_count,
+            "aeCount": matched_count,
+            "totalOpenPipeAmount": round(float(self.amount_by_ae[aes].sum()), 2),
+            "rows": rows,
+            "queryTimeMs": round((time.perf_counter() - start) * 1000, 3)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        families = {'ou': self.ou, 'country': self.country, 'time_frame': self.time_frame,
+                    'product': self.product, 'stage': self.stage}
+        return {
+            "employees": self.n,
+            "bitmaps": {name: len(bitmaps) for name, bitmaps in families.items()},
+            "bytes": sum(b.nbytes() for bitmaps in families.values() for b in bitmaps.values()),
+            "build_ms": self.build_ms
+        }
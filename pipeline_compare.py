@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+CURRENT vs PREVIOUS comparison over the local pipeline mirror
+Both time frames for the same open pipe filters in one pass, with per-product and
+per-stage deltas and growth percentages
+"""
+
+import time
+import numpy as np
+from typing import Dict, Any, List, Optional, Sequence
+
+from pipeline_store import PipelineStore
+from topk import top_k_indices
+
+TIME_FRAMES = ('CURRENT', 'PREVIOUS')
+
+
+def growth_pct(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    """Percentage change per element; NaN where the previous value is 0"""
+    current = np.asarray(current, dtype=np.float64)
+    previous = np.asarray(previous, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(previous != 0, (current - previous) / np.abs(previous) * 100, np.nan)
+
+
+def _round(value: float, digits: int = 2) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def _delta_rows(key: str, labels: Sequence[Any], amounts: np.ndarray, counts: np.ndarray,
+                limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    One row per group present in either time frame. amounts and counts are
+    (groups, 2) arrays with CURRENT in column 0; with limit, only the groups with
+    the largest absolute amount change are kept, largest first.
+    """
+    groups = np.flatnonzero(counts.sum(axis=1))
+    delta = amounts[:, 0] - amounts[:, 1]
+    if limit is not None:
+        groups = groups[top_k_indices(np.abs(delta[groups]), limit)]
+    growth = growth_pct(amounts[groups, 0], amounts[groups, 1])
+    return [{
+        key: labels[g],
+        "current": round(float(amounts[g, 0]), 2),
+        "previous": round(float(amounts[g, 1]), 2),
+        "delta": round(float(delta[g]), 2),
+        "growthPct": _round(pct, 1),
+        "opportunities": [int(counts[g, 0]), int(counts[g, 1])]
+    } for g, pct in zip(groups, growth)]
+
+
+def compare_open_pipe(store: PipelineStore, ouName: str, country: Optional[str] = None,
+                      minStage: Optional[int] = None, productListCsv: Optional[str] = None,
+                      limitN: int = 10) -> Dict[str, Any]:
+    """
+    Open pipe for CURRENT and PREVIOUS under the same filters, as a compact diff.
+
+    Rows of both time frames are selected with one mask and tagged 0 (CURRENT) or
+    1 (PREVIOUS); each breakdown is then a single bincount over group * 2 + frame,
+    reshaped to (groups, 2), so the deltas and growth for every product and stage
+    come out of the same vectorized pass. Products are the limitN with the largest
+    absolute change; every stage present is listed, lowest first.
+    """
+    start = time.perf_counter()
+    pipe = store.pipe
+    mask = store.pipe_mask(ouName, country, minStage, productListCsv, timeFrame=None)
+    time_frame = pipe['TIME_FRAME']
+    frame = np.full(len(pipe), -1, dtype=np.int64)
+    for index, name in enumerate(TIME_FRAMES):
+        frame[time_frame.isin(time_frame.codes_for(name))] = index
+    rows = np.flatnonzero(mask & (frame >= 0))
+    frame = frame[rows]
+    amounts = np.nan_to_num(pipe['OPEN_PIPE_ORIGINAL_OPENPIPE_ALLOC_AMT__c'][rows])
+
+    def breakdown(group: np.ndarray, n_groups: int):
+        slots = group * 2 + frame
+        return (np.bincount(slots, weights=amounts, minlength=n_groups * 2).reshape(n_groups, 2),
+                np.bincount(slots, minlength=n_groups * 2).reshape(n_groups, 2))
+
+    # Null product (-1) and unknown stage (-1) shift to group 0
+    products = pipe['OPEN_PIPE_PROD_NM__c']
+    product_amounts, product_counts = breakdown(products.codes[rows].astype(np.int64) + 1, len(products.values) + 1)
+    stages = pipe['STAGE'][rows].astype(np.int64) + 1
+    n_stages = int(stages.max()) + 1 if len(stages) else 1
+    stage_amounts, stage_counts = breakdown(stages, n_stages)
+    totals, opportunities = stage_amounts.sum(axis=0), stage_counts.sum(axis=0)
+
+    return {
+        "filters": {
+            "ouName": ouName,
+            "country": country,
+            "minStage": minStage,
+            "productListCsv": productListCsv,
+            "timeFrames": list(TIME_FRAMES),
+            "limitN": limitN
+        },
+        "totals": {
+            "current": round(float(totals[0]), 2),
+            "previous": round(float(totals[1]), 2),
+            "delta": round(float(totals[0] - totals[1]), 2),
+            "growthPct": _round(growth_pct(totals[0], totals[1]), 1),
+            "opportunities": [int(opportunities[0]), int(opportunities[1])]
+        },
+        "byProduct": _delta_rows("product", [None] + products.values, product_amounts, product_counts, limitN),
+        "byStage": _delta_rows("stage", [None] + list(range(n_stages - 1)), stage_amounts, stage_counts),
+        "queryTimeMs": round((time.perf_counter() - start) * 1000, 3)
+    }
+
+
+def numeric_deltas(current: Dict[str, Any], previous: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Delta and growth for every numeric field the two results share (KPI totals and the like)"""
+    keys = [k for k, v in current.items()
+            if isinstance(v, (int, float)) and not isinstance(v, bool)
+            and isinstance(previous.get(k), (int, float)) and not isinstance(previous.get(k), bool)
+            and k != 'queryTimeMs']
+    values = np.array([[current[k], previous[k]] for k in keys], dtype=np.float64).reshape(-1, 2)
+    delta = values[:, 0] - values[:, 1]
+    growth = growth_pct(values[:, 0], values[:, 1])
+    return {k: {
+        "current": current[k],
+        "previous": previous[k],
+        "delta": round(float(d), 2),
+        "growthPct": _round(g, 1)
+    } for k, d, g in zip(keys, delta, growth)}
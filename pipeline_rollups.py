@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Materialized rollups over the local pipeline mirror
+Open-pipe counts, amounts and AE counts "at or beyond stage N" for every
+OU × time frame × country × product slice, plus KPI totals per OU × time frame
+× country, refreshed incrementally per OU/time-frame partition
+"""
+
+import logging
+import time
+import numpy as np
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from pipeline_store import PipelineStore
+
+logger = logging.getLogger(__name__)
+
+# Stage buckets: bucket 0 holds rows with an unknown stage (-1), bucket s + 1 holds
+# stage s; stages above STAGE_BUCKETS - 2 share the last bucket
+STAGE_BUCKETS = 16
+
+# Rows kept per memoized AE list; matches the router's limitN cap
+ROW_LIMIT = 50
+
+# Group id meaning "every value" for the country / product parts of a slice key
+ALL = -2
+
+SliceKey = Tuple[str, str, Optional[str], Optional[str]]
+
+
+def _lowered_ids(column, names: List[str], index: Dict[str, int]) -> np.ndarray:
+    """Per-row ids of the lower-cased value (-1 for null), extending names/index"""
+    remap = np.empty(len(column.values) + 1, dtype=np.int64)
+    remap[-1] = -1
+    for code, value in enumerate(column.values):
+        lowered = value.lower()
+        if lowered not in index:
+            index[lowered] = len(names)
+            names.append(lowered)
+        remap[code] = index[lowered]
+    return remap[column.codes]
+
+
+class _Names:
+    """Shared lower-cased value dictionaries for one build"""
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.index: Dict[str, int] = {}
+
+    def ids(self, column) -> np.ndarray:
+        return _lowered_ids(column, self.names, self.index)
+
+    def partition_mask(self, ou_ids: np.ndarray, tf_ids: np.ndarray,
+                       partitions: Optional[Set[Tuple[str, str]]]) -> np.ndarray:
+        if partitions is None:
+            return np.ones(len(ou_ids), dtype=bool)
+        wanted = [(self.index[ou], self.index[tf]) for ou, tf in partitions
+                  if ou in self.index and tf in self.index]
+        if not wanted:
+            return np.zeros(len(ou_ids), dtype=bool)
+        stride = len(self.names) + 1
+        combined = ou_ids * stride + tf_ids
+        return np.isin(combined, [ou * stride + tf for ou, tf in wanted])
+
+
+def _slice_groups(columns: List[np.ndarray], radix: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (distinct key rows, per-row slice id) for id columns with values in
+    [ALL, radix - 3], packed into one int64 per row so a single 1-D unique suffices
+    """
+    packed = np.zeros(len(columns[0]), dtype=np.int64)
+    for column in columns:
+        packed = packed * radix + (column - ALL)
+    keys, inverse = np.unique(packed, return_inverse=True)
+    decoded = []
+    for _ in columns:
+        decoded.append(keys % radix + ALL)
+        keys = keys // radix
+    return np.stack(decoded[::-1], axis=1), inverse.reshape(-1)
+
+
+def _pipe_rollups(store: PipelineStore, partitions: Optional[Set[Tuple[str, str]]] = None
+                  ) -> Dict[SliceKey, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Cumulative (opportunities, amount, AEs) by stage bucket for every slice"""
+    pipe = store.pipe
+    names = _Names()
+    ou = names.ids(pipe['OU_NAME__c'])
+    tf = names.ids(pipe['TIME_FRAME'])
+    country = names.ids(pipe['WORK_LOCATION_COUNTRY__c'])
+    product = names.ids(pipe['OPEN_PIPE_PROD_NM__c'])
+    rows = np.flatnonzero(names.partition_mask(ou, tf, partitions) & (ou >= 0) & (tf >= 0))
+
+    ou, tf, country, product = ou[rows], tf[rows], country[rows], product[rows]
+    bucket = np.clip(pipe['STAGE'][rows].astype(np.int64) + 1, 0, STAGE_BUCKETS - 1)
+    amount = np.nan_to_num(pipe['OPEN_PIPE_ORIGINAL_OPENPIPE_ALLOC_AMT__c'][rows])
+    emp = pipe['EMP_ROW'][rows].astype(np.int64)
+    everything = np.full(len(rows), ALL, dtype=np.int64)
+
+    rollups = {}
+    for country_ids in (everything, country):
+        for product_ids in (everything, product):
+            keys, slices = _slice_groups([ou, tf, country_ids, product_ids], len(names.names) + 3)
+            n_slices = len(keys)
+            cells = slices * STAGE_BUCKETS + bucket
+            size = n_slices * STAGE_BUCKETS
+            opps = np.bincount(cells, minlength=size).reshape(n_slices, STAGE_BUCKETS)
+            amounts = np.bincount(cells, weights=amount, minlength=size).reshape(n_slices, STAGE_BUCKETS)
+
+            # Each AE counts once per slice, at the furthest stage they reached there
+            order = np.lexsort((bucket, emp, slices))
+            slice_sorted, emp_sorted = slices[order], emp[order]
+            last = np.ones(len(order), dtype=bool)
+            last[:-1] = (slice_sorted[1:] != slice_sorted[:-1]) | (emp_sorted[1:] != emp_sorted[:-1])
+            furthest = slice_sorted[last] * STAGE_BUCKETS + bucket[order][last]
+            aes = np.bincount(furthest, minlength=size).reshape(n_slices, STAGE_BUCKETS)
+
+            # "At or beyond" = reverse cumulative sum over stage buckets
+            opps = np.cumsum(opps[:, ::-1], axis=1)[:, ::-1]
+            amounts = np.cumsum(amounts[:, ::-1], axis=1)[:, ::-1]
+            aes = np.cumsum(aes[:, ::-1], axis=1)[:, ::-1]
+
+            for i, (ou_id, tf_id, country_id, product_id) in enumerate(keys):
+                if country_id == -1 or product_id == -1:
+                    continue  # null country/product can never be filtered on
+                key = (names.names[ou_id], names.names[tf_id],
+                       names.names[country_id] if country_id >= 0 else None,
+                       names.names[product_id] if product_id >= 0 else None)
+                rollups[key] = (opps[i], amounts[i], aes[i])
+    return rollups
+
+
+def _kpi_rollups(store: PipelineStore, partitions: Optional[Set[Tuple[str, str]]] = None
+                 ) -> Dict[Tuple[str, str, Optional[str]], Dict[str, float]]:
+    """KPI totals per OU × time frame, overall and per country"""
+    employees = store.employees
+    names = _Names()
+    ou = names.ids(employees['OU_NAME__c'])
+    tf = names.ids(employees['TIME_FRAME'])
+    country = names.ids(employees['WORK_LOCATION_COUNTRY__c'])
+    rows = np.flatnonzero(names.partition_mask(ou, tf, partitions) & (ou >= 0) & (tf >= 0))
+    ou, tf, country = ou[rows], tf[rows], country[rows]
+
+    def column(name: str) -> np.ndarray:
+        return employees[name][rows]
+
+    meetings = column('CQ_CUSTOMER_MEETING__c')
+    coverage = column('COVERAGE__c')
+    actionable = column('ACTIONABLE__c')
+    measures = {
+        'records': np.ones(len(rows)),
+        'totalACV': np.nan_to_num(column('CQ_ACV__c')),
+        'totalPG': np.nan_to_num(column('CQ_PG__c')),
+        'totalMeetings': np.nan_to_num(meetings),
+        'totalCallConnects': np.nan_to_num(column('CQ_CALL_CONNECT__c')),
+        'coverageSum': np.nan_to_num(coverage),
+        'coverageCount': (~np.isnan(coverage)).astype(np.float64),
+        'missingMeetingData': np.isnan(meetings).astype(np.float64),
+        'missingActionable': np.array([not (v or '').strip() for v in actionable], dtype=np.float64),
+    }
+
+    rollups = {}
+    for country_ids in (np.full(len(rows), ALL, dtype=np.int64), country):
+        keys, groups = _slice_groups([ou, tf, country_ids], len(names.names) + 3)
+        sums = {name: np.bincount(groups, weights=values, minlength=len(keys))
+                for name, values in measures.items()}
+        for i, (ou_id, tf_id, country_id) in enumerate(keys):
+            if country_id == -1:
+                continue
+            key = (names.names[ou_id], names.names[tf_id], names.names[country_id] if country_id >= 0 else None)
+            rollups[key] = {name: float(values[i]) for name, values in sums.items()}
+    return rollups
+
+
+class PipelineRollups:
+    """
+    Materialized rollups for one PipelineStore snapshot.
+
+    Totals for open_pipe_analyze and kpi_analyze args are dictionary lookups.
+    The top-AE rows of open_pipe_analyze are computed from the snapshot the first
+    time a slice is asked for, then kept until that slice's partition changes.
+    Like PipelineStore, an instance is never modified. refresh() returns a new
+    one that recomputes only the (OU, time frame) partitions touched by the
+    snapshot's changed Ids and reuses everything else.
+    """
+
+    def __init__(self, store: PipelineStore, pipe_slices: Dict[SliceKey, Tuple[np.ndarray, np.ndarray, np.ndarray]],
+                 kpi: Dict[Tuple[str, str, Optional[str]], Dict[str, float]],
+                 rows: Optional[Dict[Tuple, List[Dict[str, Any]]]] = None, build_ms: float = 0.0):
+        self.store = store
+        self.pipe_slices = pipe_slices
+        self.kpi = kpi
+        self._rows = rows if rows is not None else {}
+        self.build_ms = build_ms
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def build(cls, store: PipelineStore) -> 'PipelineRollups':
+        start = time.perf_counter()
+        pipe_slices = _pipe_rollups(store)
+        kpi = _kpi_rollups(store)
+        build_ms = round((time.perf_counter() - start) * 1000, 3)
+        logger.info(f"Pipeline rollups built: {len(pipe_slices)} open-pipe slices, {len(kpi)} KPI slices "
+                    f"in {build_ms}ms")
+        return cls(store, pipe_slices, kpi, build_ms=build_ms)
+
+    @staticmethod
+    def _partitions(store: PipelineStore, ids: Set[str]) -> Set[Tuple[str, str]]:
+        """(OU, time frame) partitions of the records with the given Ids"""
+        employees = store.employees
+        if not ids or not len(employees):
+            return set()
+        rows = np.flatnonzero(store.id_mask(ids))
+        return {((employees['OU_NAME__c'][row] or '').lower(), (employees['TIME_FRAME'][row] or '').lower())
+                for row in rows}
+
+    def refresh(self, store: PipelineStore) -> 'PipelineRollups':
+        """Rollups for a newer snapshot; incremental when store directly follows ours"""
+        if store is self.store:
+            return self
+        changed = getattr(store, 'changed_ids', None)
+        if changed is None or store.version != self.store.version + 1:
+            return PipelineRollups.build(store)
+
+        start = time.perf_counter()
+        partitions = self._partitions(self.store, changed) | self._partitions(store, changed)
+        pipe_slices = {key: value for key, value in self.pipe_slices.items() if key[:2] not in partitions}
+        pipe_slices.update(_pipe_rollups(store, partitions))
+        kpi = {key: value for key, value in self.kpi.items() if key[:2] not in partitions}
+        kpi.update(_kpi_rollups(store, partitions))
+        rows = {key: value for key, value in self._rows.items() if key[:2] not in partitions}
+        build_ms = round((time.perf_counter() - start) * 1000, 3)
+        logger.info(f"Pipeline rollups refreshed: {len(partitions)} partitions in {build_ms}ms")
+        return PipelineRollups(store, pipe_slices, kpi, rows, build_ms)
+
+    # ------------------------------------------------------------------ lookups
+
+    def _product_key(self, productListCsv: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """(answerable, product slice) for a product filter; only single-product filters are materialized"""
+        if not productListCsv:
+            return True, None
+        products = [p.strip() for p in productListCsv.split(',') if p.strip()]
+        if len(products) != 1:
+            return False, None
+        column = self.store.pipe['OPEN_PIPE_PROD_NM__c']
+        matches = {column.values[code].lower() for code in column.codes_containing(products[0])}
+        if len(matches) > 1:
+            return False, None
+        return True, matches.pop() if matches else products[0].lower()
+
+    def open_pipe_analyze(self, ouName: str, country: Optional[str] = None, minStage: Optional[int] = None,
+                          productListCsv: Optional[str] = None, timeFrame: str = 'CURRENT',
+                          limitN: int = 10) -> Optional[Dict[str, Any]]:
+        """
+        Same result as PipelineStore.open_pipe_analyze, or None when the args
+        fall outside the materialized slices (several products, limitN > ROW_LIMIT).
+        """
+        start = time.perf_counter()
+        answerable, product = self._product_key(productListCsv)
+        if not answerable or not ouName or int(limitN) > ROW_LIMIT:
+            self.misses += 1
+            return None
+
+        key = (ouName.lower(), (timeFrame or '').lower(), country.lower() if country else None, product)
+        bucket = 0 if minStage is None else int(minStage) + 1
+        opps = amount = aes = 0
+        entry = self.pipe_slices.get(key)
+        if entry is not None and bucket < STAGE_BUCKETS:
+            bucket = max(bucket, 0)
+            opps, amount, aes = int(entry[0][bucket]), float(entry[1][bucket]), int(entry[2][bucket])
+
+        row_key = key + (None if minStage is None else int(minStage),)
+        rows = self._rows.get(row_key)
+        if rows is None:
+            rows = [] if not aes else self.store.open_pipe_analyze(
+                ouName, country, minStage, productListCsv, timeFrame, ROW_LIMIT)['rows']
+            self._rows[row_key] = rows
+        self.hits += 1
+
+        return {
+            "filters": {
+                "ouName": ouName,
+                "country": country,
+                "minStage": minStage,
+                "productListCsv": productListCsv,
+                "timeFrame": timeFrame,
+                "limitN": limitN
+            },
+            "totalOpenPipeAmount": round(amount, 2),
+            "opportunityCount": opps,
+            "aeCount": aes,
+            "rows": rows[:max(0, int(limitN))],
+            "queryTimeMs": round((time.perf_counter() - start) * 1000, 3)
+        }
+
+    def kpi_analyze(self, ouName: str, timeFrame: str = 'CURRENT', country: Optional[str] = None) -> Dict[str, Any]:
+        """KPI totals in the ANAgentKPIAnalysisService shape (CQ_ fields of the time frame's records)"""
+        start = time.perf_counter()
+        totals = self.kpi.get((ouName.lower(), (timeFrame or '').lower(), country.lower() if country else None), {})
+        self.hits += 1
+
+        warnings = []
+        if totals.get('missingActionable'):
+            warnings.append(f"{int(totals['missingActionable'])} AEs missing actionable content")
+        if totals.get('missingMeetingData'):
+            warnings.append(f"{int(totals['missingMeetingData'])} AEs missing meeting data")
+        coverage_count = totals.get('coverageCount', 0)
+        return {
+            "filters": {"ouName": ouName, "timeFrame": timeFrame, "country": country},
+            "aeCount": int(totals.get('records', 0)),
+            "totalACV": round(totals.get('totalACV', 0.0), 2),
+            "totalPG": round(totals.get('totalPG', 0.0), 2),
+            "totalMeetings": int(totals.get('totalMeetings', 0)),
+            "totalCallConnects": int(totals.get('totalCallConnects', 0)),
+            "avgCoverage": round(totals['coverageSum'] / coverage_count, 2) if coverage_count else 0,
+            "warnings": warnings,
+            "queryTimeMs": round((time.perf_counter() - start) * 1000, 3)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open_pipe_slices": len(self.pipe_slices),
+            "kpi_slices": len(self.kpi),
+            "memoized_row_lists": len(self._rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "build_ms": self.build_ms,
+            "store_version": self.store.version
+        }
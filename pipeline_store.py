@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+Local columnar mirror of AGENT_OU_PIPELINE_V2__c
+Typed NumPy columns with dictionary-encoded strings, loaded from CSV/JSONL exports,
+answering open_pipe_analyze queries without a round trip through Apex
+"""
+
+import csv
+import json
+import logging
+import os
+import re
+import time
+import numpy as np
+from typing import Dict, Any, List, Optional, Iterable
+
+from scripts.generate_missing_fields import fields as PIPELINE_FIELDS
+from topk import top_k_indices
+
+logger = logging.getLogger(__name__)
+
+# Each pipeline record carries up to five open-pipe opportunities in numbered slot fields
+OPEN_PIPE_SLOTS = 5
+OPEN_PIPE_SLOT_FIELDS = [
+    {'name': 'OPEN_PIPE_PROD_NM__c', 'type': 'Text'},
+    {'name': 'OPEN_PIPE_OPTY_NM__c', 'type': 'Text'},
+    {'name': 'OPEN_PIPE_OPTY_STG_NM__c', 'type': 'Text'},
+    {'name': 'OPEN_PIPE_ORIGINAL_OPENPIPE_ALLOC_AMT__c', 'type': 'Currency'},
+    {'name': 'OPEN_PIPE_AE_SCORE__c', 'type': 'Number'},
+    {'name': 'OPEN_PIPE_APM_L2__c', 'type': 'Text'},
+    {'name': 'OPEN_PIPE_OPTY_DAYS_IN_STAGE__c', 'type': 'Number'},
+    {'name': 'OPEN_PIPE_REVISED_SUB_SECTOR__c', 'type': 'Text'},
+]
+
+# Present on the object but not in generate_missing_fields
+EXTRA_FIELDS = [
+    {'name': 'CALL_AI_MENTION__c', 'type': 'Number'},
+]
+
+NUMERIC_TYPES = {'Currency', 'Number', 'Percent'}
+
+# Low-cardinality text fields stored as int32 codes into a shared dictionary
+DICTIONARY_FIELDS = {
+    'OU_NAME__c', 'WORK_LOCATION_COUNTRY__c', 'EMP_MGR_NM__c', 'PRIMARY_INDUSTRY__c', 'RAMP_STATUS__c',
+    'OPEN_PIPE_PROD_NM__c', 'OPEN_PIPE_OPTY_STG_NM__c', 'OPEN_PIPE_APM_L2__c',
+    'OPEN_PIPE_REVISED_SUB_SECTOR__c', 'TIME_FRAME'
+}
+
+# Employee attributes copied onto every open-pipe row so filters never need a join
+PIPE_EMPLOYEE_FIELDS = ['OU_NAME__c', 'WORK_LOCATION_COUNTRY__c', 'TIME_FRAME']
+
+TIME_FRAMES = ('CURRENT', 'PREVIOUS')
+
+STAGE_PATTERN = re.compile(r'^\s*(\d+)')
+
+
+def slot_field(name: str, slot: int) -> str:
+    """OPEN_PIPE_PROD_NM__c, 2 -> OPEN_PIPE_PROD_NM_2__c"""
+    return f"{name[:-3]}_{slot}__c"
+
+
+def parse_stage(stage_name: Optional[str]) -> int:
+    """Numeric stage from names like "04 - Confirming Value With Power"; -1 if unknown"""
+    match = STAGE_PATTERN.match(stage_name or '')
+    return int(match.group(1)) if match else -1
+
+
+class DictColumn:
+    """Dictionary-encoded string column: int32 codes into a list of distinct values (-1 = null)"""
+
+    def __init__(self, codes: np.ndarray, values: List[str]):
+        self.codes = codes
+        self.values = values
+        self._lower: Dict[str, List[int]] = {}
+        for code, value in enumerate(values):
+            self._lower.setdefault(value.lower(), []).append(code)
+
+    @classmethod
+    def encode(cls, strings: Iterable[Optional[str]]) -> 'DictColumn':
+        index: Dict[str, int] = {}
+        codes = []
+        for value in strings:
+            if value is None:
+                codes.append(-1)
+            else:
+                codes.append(index.setdefault(value, len(index)))
+        return cls(np.array(codes, dtype=np.int32), list(index))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        code = self.codes[row]
+        return self.values[code] if code >= 0 else None
+
+    def codes_for(self, value: str) -> List[int]:
+        """Codes whose value equals value, case-insensitively"""
+        return self._lower.get(value.lower(), [])
+
+    def codes_containing(self, fragment: str) -> List[int]:
+        """Codes whose value contains fragment, case-insensitively"""
+        fragment = fragment.lower()
+        return [code for code, value in enumerate(self.values) if fragment in value.lower()]
+
+    def isin(self, codes: List[int]) -> np.ndarray:
+        if not codes:
+            return np.zeros(len(self.codes), dtype=bool)
+        if len(codes) == 1:
+            return self.codes == codes[0]
+        return np.isin(self.codes, codes)
+
+    def take(self, indices: np.ndarray) -> 'DictColumn':
+        """Subset of rows sharing this column's dictionary"""
+        column = DictColumn.__new__(DictColumn)
+        column.codes = self.codes[indices]
+        column.values = self.values
+        column._lower = self._lower
+        return column
+
+    def concat(self, other: 'DictColumn') -> 'DictColumn':
+        """Rows of self followed by rows of other, merging other's dictionary into ours"""
+        if other.values == self.values[:len(other.values)]:
+            return DictColumn(np.concatenate([self.codes, other.codes]), self.values)
+        index = {value: code for code, value in enumerate(self.values)}
+        values = list(self.values)
+        remap = np.empty(len(other.values) + 1, dtype=np.int32)
+        remap[-1] = -1
+        for code, value in enumerate(other.values):
+            if value not in index:
+                index[value] = len(values)
+                values.append(value)
+            remap[code] = index[value]
+        # Null code -1 indexes the trailing -1 entry
+        return DictColumn(np.concatenate([self.codes, remap[other.codes]]), values)
+
+
+class ColumnTable:
+    """Equal-length named columns: float64/int arrays, object arrays or DictColumns"""
+
+    def __init__(self, columns: Dict[str, Any]):
+        self.columns = columns
+        self.n = len(next(iter(columns.values()))) if columns else 0
+
+    def __len__(self):
+        return self.n
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def __getitem__(self, name: str) -> Any:
+        return self.columns[name]
+
+    def value(self, name: str, row: int) -> Any:
+        """Python value of one cell (None for null)"""
+        column = self.columns[name]
+        if isinstance(column, DictColumn):
+            return column[row]
+        value = column[row]
+        if isinstance(value, np.floating):
+            return None if np.isnan(value) else float(value)
+        if isinstance(value, np.integer):
+            return int(value)
+        return value
+
+    def take(self, indices: np.ndarray) -> 'ColumnTable':
+        return ColumnTable({name: column.take(indices) if isinstance(column, DictColumn) else column[indices]
+                            for name, column in self.columns.items()})
+
+    def concat(self, other: 'ColumnTable') -> 'ColumnTable':
+        """Rows of self followed by rows of other (same column names)"""
+        columns = {}
+        for name, column in self.columns.items():
+            if isinstance(column, DictColumn):
+                columns[name] = column.concat(other[name])
+            else:
+                columns[name] = np.concatenate([column, other[name]])
+        return ColumnTable(columns)
+
+
+def _build_column(name: str, field_type: str, values: List[Any]) -> Any:
+    if field_type in NUMERIC_TYPES:
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    if name in DICTIONARY_FIELDS:
+        return DictColumn.encode(values)
+    return np.array(values, dtype=object)
+
+
+def _to_number(value: Any) -> Optional[float]:
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+class PipelineStore:
+    """
+    Immutable snapshot of pipeline data in two columnar tables.
+
+    employees has one row per AGENT_OU_PIPELINE_V2__c record with every field from
+    generate_missing_fields plus TIME_FRAME. pipe has one row per populated
+    open-pipe slot (the five OPEN_PIPE_*_n__c groups exploded), with the slot
+    fields under their Agent_Open_Pipe__c names, a numeric STAGE, EMP_ROW pointing
+    back at the employee row, and copies of the employee's OU, country and time
+    frame so filters never need a join.
+    """
+
+    EMPLOYEE_FIELDS = PIPELINE_FIELDS + EXTRA_FIELDS
+
+    def __init__(self, employees: ColumnTable, pipe: ColumnTable, loaded_at: Optional[float] = None):
+        self.employees = employees
+        self.pipe = pipe
+        self.loaded_at = loaded_at or time.time()
+        # Set by apply_changes: one more than the parent snapshot, and the Ids it changed
+        self.version = 0
+        self.changed_ids: Optional[frozenset] = None
+        self._bitmap_index = None
+        self._aggregation_runner = None
+
+    # ------------------------------------------------------------------ loading
+
+    @classmethod
+    def _key_map(cls) -> Dict[str, str]:
+        """Upper-cased export column name -> canonical field name"""
+        names = [f['name'] for f in cls.EMPLOYEE_FIELDS]
+        names += [slot_field(f['name'], slot) for f in OPEN_PIPE_SLOT_FIELDS
+                  for slot in range(1, OPEN_PIPE_SLOTS + 1)]
+        key_map = {name.upper(): name for name in names}
+        key_map.update({'TIME_FRAME': 'TIME_FRAME', 'TIMEFRAME': 'TIME_FRAME', 'ID': 'Id'})
+        return key_map
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> 'PipelineStore':
+        """Build a snapshot from dicts keyed by field API name (any case)"""
+        key_map = cls._key_map()
+        employee_types = {f['name']: f['type'] for f in cls.EMPLOYEE_FIELDS}
+        employee_types['TIME_FRAME'] = 'Text'
+        employee_types['Id'] = 'Text'
+        slot_types = {f['name']: f['type'] for f in OPEN_PIPE_SLOT_FIELDS}
+
+        employee_values: Dict[str, List[Any]] = {name: [] for name in employee_types}
+        pipe_values: Dict[str, List[Any]] = {name: [] for name in slot_types}
+        emp_rows: List[int] = []
+
+        for row, raw in enumerate(records):
+            record = {key_map[k.upper()]: v for k, v in raw.items() if k.upper() in key_map}
+            for name, field_type in employee_types.items():
+                value = record.get(name)
+                employee_values[name].append(_to_number(value) if field_type in NUMERIC_TYPES else _to_text(value))
+            time_frame = employee_values['TIME_FRAME'][-1]
+            employee_values['TIME_FRAME'][-1] = time_frame.upper() if time_frame else 'CURRENT'
+
+            for slot in range(1, OPEN_PIPE_SLOTS + 1):
+                if not _to_text(record.get(slot_field('OPEN_PIPE_OPTY_NM__c', slot))) and \
+                        not _to_text(record.get(slot_field('OPEN_PIPE_PROD_NM__c', slot))):
+                    continue
+                for name, field_type in slot_types.items():
+                    value = record.get(slot_field(name, slot))
+                    pipe_values[name].append(_to_number(value) if field_type in NUMERIC_TYPES else _to_text(value))
+                emp_rows.append(row)
+
+        employees = ColumnTable({name: _build_column(name, employee_types[name], values)
+                                 for name, values in employee_values.items()})
+        pipe_columns = {name: _build_column(name, slot_types[name], values)
+                        for name, values in pipe_values.items()}
+        emp_row = np.array(emp_rows, dtype=np.int32)
+        pipe_columns['EMP_ROW'] = emp_row
+        pipe_columns['STAGE'] = np.array([parse_stage(s) for s in pipe_values['OPEN_PIPE_OPTY_STG_NM__c']],
+                                         dtype=np.int8)
+        for name in PIPE_EMPLOYEE_FIELDS:
+            pipe_columns[name] = employees[name].take(emp_row)
+        store = cls(employees, ColumnTable(pipe_columns))
+        logger.info(f"Pipeline store built: {len(employees)} records, {len(store.pipe)} open-pipe rows")
+        return store
+
+    @classmethod
+    def from_csv(cls, path: str) -> 'PipelineStore':
+        with open(path, newline='', encoding='utf-8') as f:
+            return cls.from_records(csv.DictReader(f))
+
+    @classmethod
+    def from_jsonl(cls, path: str) -> 'PipelineStore':
+        def records():
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        return cls.from_records(records())
+
+    @classmethod
+    def load(cls, path: str) -> 'PipelineStore':
+        """Load a CSV or JSONL export, chosen by file extension"""
+        if path.endswith('.jsonl') or path.endswith('.ndjson'):
+            return cls.from_jsonl(path)
+        return cls.from_csv(path)
+
+    def save(self, path: str, metadata: Optional[Dict[str, Any]] = None):
+        """
+        Write the snapshot to an .npz file, atomically. Numeric columns and dictionary
+        codes are stored as arrays; dictionaries, text columns and metadata go in a
+        JSON layout entry, so loading never needs pickle.
+        """
+        arrays: Dict[str, np.ndarray] = {}
+        layout: Dict[str, Any] = {'version': self.version, 'metadata': metadata or {}, 'tables': {}}
+        for table_name, table in (('employees', self.employees), ('pipe', self.pipe)):
+            columns = layout['tables'][table_name] = {}
+            for name, column in table.columns.items():
+                key = f'{table_name}/{name}'
+                if isinstance(column, DictColumn):
+                    arrays[key] = column.codes
+                    columns[name] = {'kind': 'dict', 'values': column.values}
+                elif column.dtype == object:
+                    columns[name] = {'kind': 'object', 'values': column.tolist()}
+                else:
+                    arrays[key] = column
+                    columns[name] = {'kind': 'array'}
+        arrays['__layout__'] = np.frombuffer(json.dumps(layout).encode('utf-8'), dtype=np.uint8)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_saved(cls, path: str) -> tuple:
+        """(store, metadata) from a file written by save()"""
+        with np.load(path, allow_pickle=False) as data:
+            layout = json.loads(data['__layout__'].tobytes().decode('utf-8'))
+            tables = {}
+            for table_name, columns in layout['tables'].items():
+                table = {}
+                for name, spec in columns.items():
+                    key = f'{table_name}/{name}'
+                    if spec['kind'] == 'dict':
+                        table[name] = DictColumn(data[key], spec['values'])
+                    elif spec['kind'] == 'object':
+                        table[name] = np.array(spec['values'], dtype=object)
+                    else:
+                        table[name] = data[key]
+                tables[table_name] = ColumnTable(table)
+        store = cls(tables['employees'], tables['pipe'])
+        store.version = layout['version']
+        return store, layout['metadata']
+
+    def id_mask(self, ids: Iterable[str]) -> np.ndarray:
+        """Boolean mask of employee rows whose Id is in ids"""
+        ids = set(ids)
+        column = self.employees['Id'] if len(self.employees) else []
+        # Set lookups; np.isin on object arrays compares every pair
+        return np.fromiter((value in ids for value in column), dtype=bool, count=len(column))
+
+    def apply_changes(self, upserts: List[Dict[str, Any]], deleted_ids: Iterable[str]) -> 'PipelineStore':
+        """
+        New snapshot with records replaced or added by Id and deleted Ids removed.
+
+        This snapshot is left untouched, so readers holding it are never affected;
+        callers publish the returned store by swapping a reference.
+        """
+        upsert_ids = [record.get('Id') or record.get('ID') or record.get('id') for record in upserts]
+        changed = {record_id for record_id in upsert_ids if record_id} | set(deleted_ids)
+        if not changed and not upserts:
+            return self
+
+        keep_employees = ~self.id_mask(changed)
+        new_rows = np.cumsum(keep_employees) - 1
+        emp_row = self.pipe['EMP_ROW']
+        keep_pipe = keep_employees[emp_row] if len(emp_row) else np.zeros(0, dtype=bool)
+
+        employees = self.employees.take(np.nonzero(keep_employees)[0])
+        pipe = self.pipe.take(np.nonzero(keep_pipe)[0])
+        pipe.columns['EMP_ROW'] = new_rows[emp_row[keep_pipe]].astype(np.int32)
+
+        if upserts:
+            delta = PipelineStore.from_records(upserts)
+            delta.pipe.columns['EMP_ROW'] = delta.pipe['EMP_ROW'] + np.int32(len(employees))
+            employees = employees.concat(delta.employees)
+            pipe = pipe.concat(delta.pipe)
+        snapshot = PipelineStore(employees, pipe)
+        snapshot.version = self.version + 1
+        # Records upserted without an Id cannot be traced back, so leave the delta unknown
+        snapshot.changed_ids = frozenset(changed) if all(upsert_ids) else None
+        return snapshot
+
+    # ------------------------------------------------------------------ queries
+
+    def pipe_mask(self, ouName: Optional[str] = None, country: Optional[str] = None,
+                  minStage: Optional[int] = None, productListCsv: Optional[str] = None,
+                  timeFrame: Optional[str] = 'CURRENT') -> np.ndarray:
+        """Boolean mask over open-pipe rows for the open_pipe_analyze filters"""
+        pipe = self.pipe
+        mask = np.ones(len(pipe), dtype=bool)
+        if ouName:
+            mask &= pipe['OU_NAME__c'].isin(pipe['OU_NAME__c'].codes_for(ouName))
+        if country:
+            mask &= pipe['WORK_LOCATION_COUNTRY__c'].isin(pipe['WORK_LOCATION_COUNTRY__c'].codes_for(country))
+        if timeFrame:
+            mask &= pipe['TIME_FRAME'].isin(pipe['TIME_FRAME'].codes_for(timeFrame))
+        if minStage is not None:
+            mask &= pipe['STAGE'] >= int(minStage)
+        if productListCsv:
+            products = pipe['OPEN_PIPE_PROD_NM__c']
+            codes = []
+            for product in productListCsv.split(','):
+                if product.strip():
+                    codes.extend(products.codes_containing(product.strip()))
+            mask &= products.isin(codes)
+        return mask
+
+    def open_pipe_analyze(self, ouName: str, country: Optional[str] = None, minStage: Optional[int] = None,
+                          productListCsv: Optional[str] = None, timeFrame: str = 'CURRENT',
+                          limitN: int = 10) -> Dict[str, Any]:
+        """
+        Open pipe by AE for the filters, largest allocated amount first.
+
+        Mirrors the open_pipe_analyze tool contract: returns the filters applied,
+        totals over everything matched, and the top limitN AEs with their
+        opportunity count, amount, average AE score and products.
+        """
+        start = time.perf_counter()
+        mask = self.pipe_mask(ouName, country, minStage, productListCsv, timeFrame)
+        rows = np.nonzero(mask)[0]
+        emp = self.pipe['EMP_ROW'][rows]
+        amounts = np.nan_to_num(self.pipe['OPEN_PIPE_ORIGINAL_OPENPIPE_ALLOC_AMT__c'][rows])
+        scores = self.pipe['OPEN_PIPE_AE_SCORE__c'][rows]
+
+        n_employees = len(self.employees)
+        amount_by_ae = np.bincount(emp, weights=amounts, minlength=n_employees)
+        opps_by_ae = np.bincount(emp, minlength=n_employees)
+        scored = ~np.isnan(scores)
+        score_sum = np.bincount(emp[scored], weights=scores[scored], minlength=n_employees)
+        score_n = np.bincount(emp[scored], minlength=n_employees)
+
+        aes = np.nonzero(opps_by_ae)[0]
+        order = aes[top_k_indices(amount_by_ae[aes], limitN)]
+
+        products: Dict[int, List[str]] = {int(ae): [] for ae in order}
+        product_column = self.pipe['OPEN_PIPE_PROD_NM__c']
+        for row in rows[np.isin(emp, order)]:
+            name = product_column[row]
+            ae_products = products[int(self.pipe['EMP_ROW'][row])]
+            if name and name not in ae_products:
+                ae_products.append(name)
+
+        results = []
+        for ae in order:
+            ae = int(ae)
+            results.append({
+                "empId": self.employees.value('EMP_ID__c', ae),
+                "fullName": self.employees.value('FULL_NAME__c', ae),
+                "email": self.employees.value('EMP_EMAIL_ADDR__c', ae),
+                "country": self.employees.value('WORK_LOCATION_COUNTRY__c', ae),
+                "opportunities": int(opps_by_ae[ae]),
+                "openPipeAmount": round(float(amount_by_ae[ae]), 2),
+                "avgAeScore": round(float(score_sum[ae] / score_n[ae]), 2) if score_n[ae] else None,
+                "products": products[ae]
+            })
+
+        return {
+            "filters": {
+                "ouName": ouName,
+                "country": country,
+                "minStage": minStage,
+                "productListCsv": productListCsv,
+                "timeFrame": timeFrame,
+                "limitN": limitN
+            },
+            "totalOpenPipeAmount": round(float(amounts.sum()), 2),
+            "opportunityCount": int(len(rows)),
+            "aeCount": int(len(aes)),
+            "rows": results,
+            "queryTimeMs": round((time.perf_counter() - start) * 1000, 3)
+        }
+
+    def bitmap_index(self):
+        """PipelineBitmapIndex for this snapshot, built on first use"""
+        if self._bitmap_index is None:
+            from pipeline_bitmap import PipelineBitmapIndex
+            self._bitmap_index = PipelineBitmapIndex(self)
+        return self._bitmap_index
+
+    def aggregation_runner(self):
+        """AggregationRunner over this snapshot's records, created on first use"""
+        if self._aggregation_runner is None:
+            from pipeline_aggregate import AggregationRunner
+            self._aggregation_runner = AggregationRunner.from_store(self)
+        return self._aggregation_runner
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "records": len(self.employees),
+            "open_pipe_rows": len(self.pipe),
+            "ous": len(self.pipe['OU_NAME__c'].values) if len(self.pipe) else 0,
+            "products": len(self.pipe['OPEN_PIPE_PROD_NM__c'].values) if len(self.pipe) else 0,
+            "loaded_at": self.loaded_at
+        }
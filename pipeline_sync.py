@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Incremental sync for the local pipeline mirror
+Pulls rows changed since a persisted LastModifiedDate watermark, page by page,
+applies upserts and deletes in batches and publishes each completed run as a new snapshot
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable, Iterator
+from urllib.parse import quote
+
+import requests
+
+from pipeline_store import PipelineStore, OPEN_PIPE_SLOT_FIELDS, OPEN_PIPE_SLOTS, slot_field
+from sf_auth import SalesforceAuthManager
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_OBJECT = 'AGENT_OU_PIPELINE_V2__c'
+
+
+def pipeline_sync_fields() -> List[str]:
+    """Fields selected from AGENT_OU_PIPELINE_V2__c for the mirror"""
+    names = [f['name'] for f in PipelineStore.EMPLOYEE_FIELDS]
+    names += [slot_field(f['name'], slot) for f in OPEN_PIPE_SLOT_FIELDS
+              for slot in range(1, OPEN_PIPE_SLOTS + 1)]
+    return names
+
+
+def soql_datetime(value: str) -> str:
+    """Salesforce datetime ("2024-05-01T10:00:00.000+0000") as a SOQL literal"""
+    parsed = datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+    return parsed.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class SalesforceQuerySource:
+    """Paged queryAll against the REST API, so soft-deleted rows come back with IsDeleted"""
+
+    def __init__(self, auth: SalesforceAuthManager, api_version: str = 'v58.0', timeout: float = 120.0):
+        self.auth = auth
+        self.api_version = api_version
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _get(self, url: str) -> Dict[str, Any]:
+        token = self.auth.get_token()
+        response = self.session.get(url, headers={'Authorization': f'Bearer {token}'}, timeout=self.timeout)
+        if response.status_code == 401 and self.auth.can_refresh:
+            token = self.auth.refresh(stale_token=token)
+            response = self.session.get(url, headers={'Authorization': f'Bearer {token}'}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def pages(self, soql: str) -> Iterator[List[Dict[str, Any]]]:
+        """Yield record pages, following nextRecordsUrl"""
+        base_url = self.auth.instance_url.rstrip('/')
+        body = self._get(f"{base_url}/services/data/{self.api_version}/queryAll?q={quote(soql)}")
+        while True:
+            yield body.get('records', [])
+            if body.get('done', True) or not body.get('nextRecordsUrl'):
+                return
+            body = self._get(f"{base_url}{body['nextRecordsUrl']}")
+
+
+class StubQuerySource:
+    """
+    In-memory stand-in for SalesforceQuerySource.
+
+    Holds records with Id, LastModifiedDate and IsDeleted, and answers the sync
+    query's watermark filter in pages of page_size, like queryAll would.
+    """
+
+    def __init__(self, records: Optional[List[Dict[str, Any]]] = None, page_size: int = 2000):
+        self.records = records or []
+        self.page_size = page_size
+        self.queries: List[str] = []
+
+    def pages(self, soql: str) -> Iterator[List[Dict[str, Any]]]:
+        self.queries.append(soql)
+        matched = self.records
+        marker = 'LastModifiedDate >= '
+        if marker in soql:
+            since = soql.split(marker, 1)[1].split()[0]
+            matched = [r for r in matched if soql_datetime(r['LastModifiedDate']) >= since]
+        matched = sorted(matched, key=lambda r: (r['LastModifiedDate'], r['Id']))
+        for start in range(0, len(matched), self.page_size):
+            yield matched[start:start + self.page_size]
+
+
+class WatermarkStore:
+    """
+    Per-object sync watermarks in a JSON file, written atomically.
+
+    Each watermark records the id of the saved mirror snapshot it belongs to; a
+    watermark is only meaningful together with that snapshot.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, object_name: str) -> Optional[str]:
+        return self.load().get(object_name, {}).get('watermark')
+
+    def snapshot_id(self, object_name: str) -> Optional[str]:
+        return self.load().get(object_name, {}).get('snapshot_id')
+
+    def set(self, object_name: str, watermark: str, snapshot_id: Optional[str] = None):
+        state = self.load()
+        state[object_name] = {'watermark': watermark, 'snapshot_id': snapshot_id, 'synced_at': time.time()}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class PipelineSync:
+    """
+    Keeps a PipelineStore current with changes from Salesforce.
+
+    Each run selects rows with LastModifiedDate at or after the watermark
+    (inclusive, since upserts are idempotent and this avoids losing rows that share
+    the boundary timestamp) and applies them batch_size at a time. Only a finished
+    run is handed to publish(), as one reference swap, so readers never see a
+    half-applied pull and keep whichever snapshot they hold meanwhile.
+
+    A watermark only describes the mirror it was taken for. On startup the synced
+    mirror saved at snapshot_path is reloaded when its id matches the stored
+    watermark; otherwise (no snapshot, a different one, or none configured) the
+    first run is a full pull into an empty store. After each run the snapshot is
+    saved before its watermark, so a crash in between just forces a full pull.
+    """
+
+    def __init__(self, source, watermarks: WatermarkStore, snapshot_path: Optional[str] = None,
+                 publish: Optional[Callable[[PipelineStore], None]] = None,
+                 object_name: str = PIPELINE_OBJECT, batch_size: int = 5000):
+        self.source = source
+        self.watermarks = watermarks
+        self.snapshot_path = snapshot_path
+        self.publish = publish
+        self.object_name = object_name
+        self.batch_size = batch_size
+        self.store, self.watermark = self._restore()
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.runs = 0
+        self.last_run: Dict[str, Any] = {}
+        self.last_error: Optional[str] = None
+
+    def _restore(self) -> tuple:
+        """The saved mirror and its watermark, or an empty store and no watermark"""
+        empty = PipelineStore.from_records([])
+        expected = self.watermarks.snapshot_id(self.object_name)
+        if not self.snapshot_path or not expected or not os.path.exists(self.snapshot_path):
+            return empty, None
+        try:
+            store, metadata = PipelineStore.load_saved(self.snapshot_path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Pipeline sync snapshot {self.snapshot_path} unreadable, doing a full pull: {e}")
+            return empty, None
+        if metadata.get('snapshot_id') != expected:
+            logger.warning(f"Pipeline sync snapshot {self.snapshot_path} does not match the stored watermark, "
+                           f"doing a full pull")
+            return empty, None
+        logger.info(f"Pipeline sync resumed from {self.snapshot_path}: {len(store.employees)} records")
+        return store, self.watermarks.get(self.object_name)
+
+    @property
+    def ready(self) -> bool:
+        """Whether the store holds a complete mirror (restored, or after the first run)"""
+        return self.watermark is not None
+
+    def build_query(self, watermark: Optional[str]) -> str:
+        fields = ', '.join(['Id', 'IsDeleted', 'LastModifiedDate'] + pipeline_sync_fields())
+        soql = f"SELECT {fields} FROM {self.object_name}"
+        if watermark:
+            soql += f" WHERE LastModifiedDate >= {soql_datetime(watermark)}"
+        return soql + " ORDER BY LastModifiedDate, Id"
+
+    def sync_once(self) -> Dict[str, Any]:
+        """Pull and apply everything changed since the watermark"""
+        with self._run_lock:
+            start = time.time()
+            watermark = self.watermark
+            base = store = self.store
+            changed_ids = set()
+            # Latest version of each changed row in the current batch; None marks a delete
+            pending: Dict[str, Optional[Dict[str, Any]]] = {}
+            counts = {'upserts': 0, 'deletes': 0, 'batches': 0, 'pages': 0, 'full': watermark is None}
+            newest = watermark
+
+            def flush():
+                nonlocal store, changed_ids
+                if not pending:
+                    return
+                upserts = [record for record in pending.values() if record is not None]
+                deletes = [record_id for record_id, record in pending.items() if record is None]
+                store = store.apply_changes(upserts, deletes)
+                if changed_ids is not None and store.changed_ids is not None:
+                    changed_ids.update(store.changed_ids)
+                else:
+                    changed_ids = None
+                counts['upserts'] += len(upserts)
+                counts['deletes'] += len(deletes)
+                counts['batches'] += 1
+                pending.clear()
+
+            for page in self.source.pages(self.build_query(watermark)):
+                counts['pages'] += 1
+                for record in page:
+                    record = {k: v for k, v in record.items() if k != 'attributes'}
+                    pending[record['Id']] = None if record.get('IsDeleted') else record
+                    modified = record.get('LastModifiedDate')
+                    if modified and (newest is None or modified > newest):
+                        newest = modified
+                    if len(pending) >= self.batch_size:
+                        flush()
+            flush()
+            if counts['batches']:
+                # The run as one step from the published snapshot, so rollups can refresh incrementally
+                store.version = base.version + 1
+                store.changed_ids = frozenset(changed_ids) if changed_ids is not None else None
+            if counts['batches'] or watermark is None:
+                self._commit(store, newest or '1970-01-01T00:00:00.000+0000')
+
+            self.runs += 1
+            self.last_run = dict(counts, watermark=newest, duration_s=round(time.time() - start, 3),
+                                 finished_at=time.time())
+            logger.info(f"Pipeline sync: {counts['upserts']} upserts, {counts['deletes']} deletes "
+                        f"in {counts['batches']} batches")
+            return self.last_run
+
+    def _commit(self, store: PipelineStore, watermark: str):
+        """Persist and publish a completed run: snapshot first, then the watermark that goes with it"""
+        snapshot_id = None
+        if self.snapshot_path:
+            snapshot_id = uuid.uuid4().hex
+            store.save(self.snapshot_path, {'snapshot_id': snapshot_id, 'watermark': watermark})
+        self.watermarks.set(self.object_name, watermark, snapshot_id)
+        self.store, self.watermark = store, watermark
+        if self.publish is not None:
+            self.publish(store)
+
+    def start_background(self, interval_s: float = 3600.0, initial_delay_s: float = 0.0):
+        """Sync after initial_delay_s, then every interval_s seconds, on a daemon thread"""
+        if self._thread is not None:
+            return
+
+        def loop():
+            delay = initial_delay_s
+            while not self._stop.wait(delay):
+                delay = interval_s
+                try:
+                    self.sync_once()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.error(f"Pipeline sync failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name="pipeline-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "object": self.object_name,
+            "watermark": self.watermark,
+            "ready": self.ready,
+            "snapshot_path": self.snapshot_path,
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Persistent result cache for routing and Salesforce action results
+SQLite-backed so reruns after a restart (and other processes) reuse earlier work
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Keys that change on every call without changing the result
+VOLATILE_ARG_KEYS = {'correlationId'}
+
+
+def normalize_utterance(text: str) -> str:
+    """Collapse whitespace; case is kept because extractors are case-sensitive"""
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+
+def canonical_args(args: Dict[str, Any]) -> str:
+    """Stable JSON form of action args, ignoring per-call volatile keys"""
+    stable = {k: v for k, v in (args or {}).items() if k not in VOLATILE_ARG_KEYS}
+    # MCP adapters take their args as one JSON string; look inside it too
+    packed = stable.get('normalizedArgsJsons')
+    if isinstance(packed, str):
+        try:
+            stable['normalizedArgsJsons'] = json.loads(packed, object_hook=lambda d: {
+                k: v for k, v in d.items() if k not in VOLATILE_ARG_KEYS})
+        except ValueError:
+            pass
+    return json.dumps(stable, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def routing_key(router_version: str, text: str) -> str:
+    """Cache key for a routing decision"""
+    return f"{router_version}|{normalize_utterance(text)}"
+
+
+def action_key(action_name: str, args: Dict[str, Any]) -> str:
+    """Cache key for a Salesforce action result"""
+    return f"{action_name}|{canonical_args(args)}"
+
+
+class ResultCache:
+    """
+    Size-bounded key/value cache persisted in SQLite.
+
+    Entries are grouped by namespace ("route", "action", ...). The most recently used
+    entries are loaded into memory at startup, and the least recently used rows are
+    evicted once the stored payload exceeds max_bytes. Hits only note their access
+    time in memory; the times are written back in one batch every touch_interval_s,
+    on the next put, and before eviction, so reads stay off the SQLite write path.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024, warm_entries: int = 5000,
+                 touch_interval_s: float = 30.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.warm_entries = warm_entries
+        self.touch_interval_s = touch_interval_s
+        self._lock = threading.Lock()
+        self._memory: Dict[tuple, tuple] = {}
+        self._touched: Dict[tuple, float] = {}
+        self._touched_since = time.time()
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                ns TEXT NOT NULL,
+                key_hash TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (ns, key_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self._warm_start()
+
+    @classmethod
+    def from_env(cls) -> Optional['ResultCache']:
+        """Build a cache from RESULT_CACHE_PATH / RESULT_CACHE_MAX_MB, or None if unset"""
+        path = os.getenv('RESULT_CACHE_PATH')
+        if not path:
+            return None
+        max_mb = float(os.getenv('RESULT_CACHE_MAX_MB', '64'))
+        return cls(path, max_bytes=int(max_mb * 1024 * 1024))
+
+    @staticmethod
+    def _hash(key: str) -> str:
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _warm_start(self):
+        """Load the most recently used live entries into memory"""
+        now = time.time()
+        rows = self._conn.execute(
+            "SELECT ns, key_hash, value, expires_at FROM entries "
+            "WHERE expires_at IS NULL OR expires_at > ? "
+            "ORDER BY last_access DESC LIMIT ?",
+            (now, self.warm_entries)
+        ).fetchall()
+        for ns, key_hash, value, expires_at in rows:
+            self._memory[(ns, key_hash)] = (json.loads(value), expires_at)
+        if rows:
+            logger.info(f"Result cache warm start: {len(rows)} entries from {self.path}")
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """Return the cached value, or None if absent or expired"""
+        key_hash = self._hash(key)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get((namespace, key_hash))
+            if entry is None:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM entries WHERE ns = ? AND key_hash = ?",
+                    (namespace, key_hash)
+                ).fetchone()
+                if row is not None:
+                    entry = (json.loads(row[0]), row[1])
+                    self._remember((namespace, key_hash), entry)
+
+            if entry is None or (entry[1] is not None and entry[1] <= now):
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._touched[(namespace, key_hash)] = now
+            if now - self._touched_since >= self.touch_interval_s:
+                self._flush_touches()
+                self._conn.commit()
+            return entry[0]
+
+    def put(self, namespace: str, key: str, value: Any, ttl_s: Optional[float] = None):
+        """Store a JSON-serializable value, evicting old entries if over budget"""
+        key_hash = self._hash(key)
+        payload = json.dumps(value, separators=(',', ':'), default=str)
+        now = time.time()
+        expires_at = now + ttl_s if ttl_s else None
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT size FROM entries WHERE ns = ? AND key_hash = ?", (namespace, key_hash)
+            ).fetchone()
+            self._total_bytes += len(payload) - (previous[0] if previous else 0)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (ns, key_hash, value, size, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, key_hash, payload, len(payload), expires_at, now)
+            )
+            self._touched.pop((namespace, key_hash), None)
+            self._remember((namespace, key_hash), (value, expires_at))
+            self._flush_touches()
+            self._evict()
+            self._conn.commit()
+
+    def _flush_touches(self):
+        """Write pending access times in one statement (lock held, caller commits)"""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE entries SET last_access = ? WHERE ns = ? AND key_hash = ?",
+                [(at, ns, key_hash) for (ns, key_hash), at in self._touched.items()]
+            )
+            self._touched.clear()
+        self._touched_since = time.time()
+
+    def _remember(self, mem_key: tuple, entry: tuple):
+        """Keep an entry in memory, bounded to warm_entries (lock held)"""
+        self._memory.pop(mem_key, None)
+        self._memory[mem_key] = entry
+        while len(self._memory) > self.warm_entries:
+            del self._memory[next(iter(self._memory))]
+
+    def _evict(self):
+        """Drop expired rows, then LRU rows until under 90% of max_bytes (lock held)"""
+        if self._total_bytes <= self.max_bytes:
+            return
+        self._conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        target = int(self.max_bytes * 0.9)
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        evicted = 0
+        for ns, key_hash, size in self._conn.execute(
+                "SELECT ns, key_hash, size FROM entries ORDER BY last_access ASC").fetchall():
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM entries WHERE ns = ? AND key_hash = ?", (ns, key_hash))
+            self._memory.pop((ns, key_hash), None)
+            total -= size
+            evicted += 1
+        self._total_bytes = total
+        # Expired rows may still be in memory
+        now = time.time()
+        for mem_key in [k for k, (_, exp) in self._memory.items() if exp is not None and exp <= now]:
+            del self._memory[mem_key]
+        if evicted:
+            logger.info(f"Result cache evicted {evicted} entries")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and storage size"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            return {
+                "path": self.path,
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
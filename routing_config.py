@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Versioned routing configuration with hot reload
+Routing tables live in routing_config.json; a running server rebuilds its router from the file and swaps it in
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import signal
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+ROUTING_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'routing_config.json')
+
+# Alias tables and their JSON shape (alias -> canonical name, or a list of names)
+ALIAS_TABLES = {
+    'ou_aliases': dict,
+    'country_mapping': dict,
+    'segment_aliases': dict,
+    'product_aliases': list,
+}
+
+T = TypeVar('T')
+
+
+class RoutingConfigError(ValueError):
+    """The routing config file is missing, malformed or fails validation"""
+
+
+@dataclass(frozen=True)
+class RoutingConfig:
+    """One parsed, validated version of the routing tables"""
+    version: str
+    checksum: str
+    path: str
+    tool_patterns: Dict[str, List[str]]
+    ou_aliases: Dict[str, str]
+    country_mapping: Dict[str, str]
+    segment_aliases: Dict[str, str]
+    product_aliases: List[str]
+
+    @property
+    def tag(self) -> str:
+        """Version plus content hash, so an edit without a version bump still reads as new"""
+        return f"{self.version}@{self.checksum[:8]}"
+
+    @classmethod
+    def load(cls, path: str = ROUTING_CONFIG_PATH) -> 'RoutingConfig':
+        try:
+            with open(path, 'rb') as f:
+                raw = f.read()
+        except OSError as e:
+            raise RoutingConfigError(f"Cannot read routing config {path}: {e}")
+        try:
+            data = json.loads(raw.decode('utf-8'))
+        except ValueError as e:
+            raise RoutingConfigError(f"Routing config {path} is not valid JSON: {e}")
+        return cls.from_dict(data, path=path, checksum=hashlib.sha256(raw).hexdigest())
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], path: str = '<dict>', checksum: Optional[str] = None) -> 'RoutingConfig':
+        """Validate the tables; every tool pattern must compile"""
+        if not isinstance(data, dict):
+            raise RoutingConfigError(f"{path}: expected a JSON object")
+        version = data.get('version')
+        if not isinstance(version, str) or not version.strip():
+            raise RoutingConfigError(f"{path}: 'version' must be a non-empty string")
+
+        tool_patterns = data.get('tool_patterns')
+        if not isinstance(tool_patterns, dict) or not tool_patterns:
+            raise RoutingConfigError(f"{path}: 'tool_patterns' must map tool names to pattern lists")
+        for tool, patterns in tool_patterns.items():
+            if not isinstance(patterns, list) or not all(isinstance(p, str) for p in patterns):
+                raise RoutingConfigError(f"{path}: tool_patterns.{tool} must be a list of strings")
+            for pattern in patterns:
+                try:
+                    re.compile(pattern)
+                except re.error as e:
+                    raise RoutingConfigError(f"{path}: tool_patterns.{tool} has invalid pattern {pattern!r}: {e}")
+
+        tables = {}
+        for key, kind in ALIAS_TABLES.items():
+            table = data.get(key, kind())
+            if kind is dict:
+                valid = isinstance(table, dict) and all(isinstance(k, str) and isinstance(v, str) for k, v in table.items())
+            else:
+                valid = isinstance(table, list) and all(isinstance(v, str) for v in table)
+            if not valid:
+                raise RoutingConfigError(f"{path}: '{key}' must be a {'string map' if kind is dict else 'list of strings'}")
+            tables[key] = table
+
+        if checksum is None:
+            checksum = hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+        return cls(version=version.strip(), checksum=checksum, path=path, tool_patterns=tool_patterns, **tables)
+
+
+class ReloadableRouter(Generic[T]):
+    """
+    Holds the router built from the current routing config and replaces it on reload.
+
+    reload() parses the file and builds a complete new router off to the side
+    (patterns, gazetteer, fuzzy index), then publishes it with a single reference
+    assignment. Callers read current once per request, so in-flight requests
+    finish on the router they started with and never see half-built tables. A
+    config that fails to parse or build leaves the current router in place.
+    """
+
+    def __init__(self, build: Callable[[RoutingConfig], T], path: str = ROUTING_CONFIG_PATH):
+        self.build = build
+        self.path = path
+        self._lock = threading.Lock()
+        config = RoutingConfig.load(path)
+        self._current: Tuple[RoutingConfig, T] = (config, build(config))
+        self.loaded_at = time.time()
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        logger.info(f"Routing config {config.tag} loaded from {path}")
+
+    @property
+    def current(self) -> T:
+        return self._current[1]
+
+    @property
+    def config(self) -> RoutingConfig:
+        return self._current[0]
+
+    def reload(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Rebuild from the config file and swap the new router in.
+
+        Returns a status dict ('reloaded' or 'unchanged'); raises RoutingConfigError
+        if the new config is invalid, keeping the current router.
+        """
+        with self._lock:
+            previous = self._current[0]
+            start = time.perf_counter()
+            try:
+                config = RoutingConfig.load(self.path)
+                if config.checksum == previous.checksum and not force:
+                    return {"status": "unchanged", "routingVersion": previous.version, "tag": previous.tag}
+                router = self.build(config)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                logger.error(f"Routing config reload failed, keeping {previous.tag}: {e}")
+                if isinstance(e, RoutingConfigError):
+                    raise
+                raise RoutingConfigError(str(e)) from e
+            build_ms = (time.perf_counter() - start) * 1000
+            self._current = (config, router)
+            self.loaded_at = time.time()
+            self.reloads += 1
+            self.last_error = None
+        logger.info(f"Routing config reloaded: {previous.tag} -> {config.tag} (built in {build_ms:.0f}ms)")
+        return {
+            "status": "reloaded",
+            "routingVersion": config.version,
+            "previousVersion": previous.version,
+            "tag": config.tag,
+            "build_ms": round(build_ms, 1)
+        }
+
+    def install_signal_handler(self, signum: Optional[int] = None) -> bool:
+        """
+        Reload on SIGHUP (or signum). The rebuild runs on a worker thread so the
+        serving thread is not held up. Only possible from the main thread on
+        platforms with SIGHUP; returns whether the handler was installed.
+        """
+        signum = signum if signum is not None else getattr(signal, 'SIGHUP', None)
+        if signum is None or threading.current_thread() is not threading.main_thread():
+            return False
+
+        def reload_in_background():
+            try:
+                self.reload()
+            except RoutingConfigError:
+                pass  # already logged; the current router stays
+
+        def handle(_signum, _frame):
+            threading.Thread(target=reload_in_background, name='routing-reload', daemon=True).start()
+
+        signal.signal(signum, handle)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        config = self.config
+        return {
+            "version": config.version,
+            "tag": config.tag,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error
+        }
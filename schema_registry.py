@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+JSON Schema registry for tool arguments
+Loads one <tool>.schema.json per tool and compiles each into generated Python checks
+"""
+
+import glob
+import json
+import logging
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_SUFFIX = '.schema.json'
+
+# Keywords that only document a schema
+ANNOTATIONS = {'$schema', '$id', 'title', 'description', 'default', 'examples'}
+SUPPORTED = ANNOTATIONS | {
+    'type', 'enum', 'const', 'required', 'properties', 'additionalProperties', 'anyOf',
+    'minimum', 'maximum', 'minLength', 'maxLength', 'pattern', 'items'
+}
+
+TYPE_CHECKS = {
+    'object': 'isinstance({v}, dict)',
+    'array': 'isinstance({v}, list)',
+    'string': 'isinstance({v}, str)',
+    'boolean': 'isinstance({v}, bool)',
+    'null': '{v} is None',
+    'number': '(isinstance({v}, (int, float)) and not isinstance({v}, bool))',
+    'integer': '((isinstance({v}, int) and not isinstance({v}, bool)) '
+               'or (isinstance({v}, float) and {v}.is_integer()))',
+}
+
+Validator = Callable[[Any], List[str]]
+
+
+class SchemaError(ValueError):
+    """A schema uses a keyword or type this compiler does not implement"""
+
+
+class _Compiler:
+    """
+    Emits the source of one validator function for a schema.
+
+    Each keyword becomes straight-line Python (isinstance checks, comparisons,
+    set membership), so validating costs no schema interpretation at call time.
+    Constants such as enums and compiled patterns are bound into the namespace.
+    With allow_additional, additionalProperties: false is not enforced.
+    """
+
+    def __init__(self, name: str, allow_additional: bool):
+        self.name = name
+        self.allow_additional = allow_additional
+        self.lines: List[str] = []
+        self.namespace: Dict[str, Any] = {'_MISSING': object()}
+        self._counter = 0
+
+    def _var(self, prefix: str) -> str:
+        self._counter += 1
+        return f'{prefix}{self._counter}'
+
+    def _const(self, value: Any) -> str:
+        name = self._var('_c')
+        self.namespace[name] = value
+        return name
+
+    def _emit(self, depth: int, line: str):
+        self.lines.append('    ' * depth + line)
+
+    def compile(self, schema: Dict[str, Any]) -> Validator:
+        self._emit(0, 'def validate(value):')
+        self._emit(1, 'errors = []')
+        self._node(schema, 'value', _Path(''), 1)
+        self._emit(1, 'return errors')
+        source = '\n'.join(self.lines)
+        exec(compile(source, f'<schema {self.name}>', 'exec'), self.namespace)
+        validator = self.namespace['validate']
+        validator.__name__ = f'validate_{self.name}'
+        validator.source = source
+        return validator
+
+    def _fail(self, depth: int, path: '_Path', message: str):
+        self._emit(depth, f'errors.append({path.message(message)})')
+
+    def _block(self, depth: int, header: str, body: Callable[[], None]):
+        """Emit header, then body one level deeper, or nothing if body emits nothing"""
+        self._emit(depth, header)
+        mark = len(self.lines)
+        body()
+        if len(self.lines) == mark:
+            self.lines.pop()
+
+    def _node(self, schema: Dict[str, Any], v: str, path: '_Path', depth: int):
+        unknown = set(schema) - SUPPORTED
+        if unknown:
+            raise SchemaError(f"{self.name}: unsupported schema keywords {sorted(unknown)}")
+
+        types = schema.get('type')
+        if types is None:
+            self._checks(schema, v, path, depth, types)
+            return
+        types = [types] if isinstance(types, str) else list(types)
+        for t in types:
+            if t not in TYPE_CHECKS:
+                raise SchemaError(f"{self.name}: unsupported type {t!r}")
+        check = ' or '.join(TYPE_CHECKS[t].format(v=v) for t in types)
+        self._emit(depth, f'if not ({check}):')
+        self._fail(depth + 1, path, f"must be of type {' or '.join(types)}")
+        # Value checks only run once the type is right
+        self._block(depth, 'else:', lambda: self._checks(schema, v, path, depth + 1, types))
+
+    def _checks(self, schema, v, path, depth, types):
+        if 'enum' in schema:
+            allowed = schema['enum']
+            if all(isinstance(a, str) for a in allowed):
+                self._emit(depth, f'if not (isinstance({v}, str) and {v} in {self._const(frozenset(allowed))}):')
+            else:
+                # Compare types too, so True does not match an enum member 1
+                self._emit(depth, f'if not any({v} == a and type({v}) is type(a) for a in {self._const(allowed)}):')
+            self._fail(depth + 1, path, 'must be one of ' + ', '.join(json.dumps(a) for a in allowed))
+        if 'const' in schema:
+            self._emit(depth, f'if {v} != {self._const(schema["const"])}:')
+            self._fail(depth + 1, path, f"must be {json.dumps(schema['const'])}")
+
+        self._guarded(depth, v, types, ('number', 'integer'), 'isinstance({v}, (int, float)) and not isinstance({v}, bool)',
+                      lambda d: self._number(schema, v, path, d))
+        self._guarded(depth, v, types, ('string',), 'isinstance({v}, str)', lambda d: self._string(schema, v, path, d))
+        self._guarded(depth, v, types, ('object',), 'isinstance({v}, dict)', lambda d: self._object(schema, v, path, d))
+        self._guarded(depth, v, types, ('array',), 'isinstance({v}, list)', lambda d: self._array(schema, v, path, d))
+
+        if 'anyOf' in schema:
+            branches = [_Compiler(f'{self.name}.anyOf', self.allow_additional).compile(sub) for sub in schema['anyOf']]
+            self._emit(depth, f'if not any(not branch({v}) for branch in {self._const(branches)}):')
+            self._fail(depth + 1, path, 'must match at least one of: ' + '; '.join(
+                _describe(sub) for sub in schema['anyOf']))
+
+    def _guarded(self, depth, v, types, kinds, guard, emit):
+        # Skip the isinstance guard when the type check already guarantees this kind
+        if types is not None and all(t in kinds for t in types):
+            emit(depth)
+        else:
+            self._block(depth, f'if {guard.format(v=v)}:', lambda: emit(depth + 1))
+
+    def _number(self, schema, v, path, depth):
+        for keyword, op, word in (('minimum', '<', '>='), ('maximum', '>', '<=')):
+            if keyword in schema:
+                self._emit(depth, f'if {v} {op} {schema[keyword]!r}:')
+                self._fail(depth + 1, path, f"must be {word} {schema[keyword]}")
+
+    def _string(self, schema, v, path, depth):
+        if 'minLength' in schema:
+            self._emit(depth, f'if len({v}) < {int(schema["minLength"])}:')
+            self._fail(depth + 1, path, f"must be at least {schema['minLength']} characters")
+        if 'maxLength' in schema:
+            self._emit(depth, f'if len({v}) > {int(schema["maxLength"])}:')
+            self._fail(depth + 1, path, f"must be at most {schema['maxLength']} characters")
+        if 'pattern' in schema:
+            self._emit(depth, f'if not {self._const(re.compile(schema["pattern"]))}.search({v}):')
+            self._fail(depth + 1, path, f"must match {schema['pattern']}")
+
+    def _object(self, schema, v, path, depth):
+        properties = schema.get('properties', {})
+        for key in schema.get('required', []):
+            self._emit(depth, f'if {key!r} not in {v}:')
+            self._fail(depth + 1, path.child(key), 'is required')
+        for key, sub in properties.items():
+            item = self._var('v')
+            self._emit(depth, f'{item} = {v}.get({key!r}, _MISSING)')
+            self._block(depth, f'if {item} is not _MISSING:',
+                        lambda: self._node(sub, item, path.child(key), depth + 1))
+        if schema.get('additionalProperties', True) is False and not self.allow_additional:
+            allowed = self._const(frozenset(properties))
+            self._emit(depth, f'for key in {v}:')
+            self._emit(depth + 1, f'if key not in {allowed}:')
+            self._emit(depth + 2, f"errors.append({path.message('has unexpected property ')} + str(key))"
+                       if path.static or path.index_expr else f"errors.append('unexpected property ' + str(key))")
+
+    def _array(self, schema, v, path, depth):
+        if 'items' not in schema:
+            return
+        item, index = self._var('v'), self._var('i')
+        self._emit(depth, f'for {index}, {item} in enumerate({v}):')
+        self._node(schema['items'], item, path.item(index), depth + 1)
+
+
+class _Path:
+    """Where a value sits in the arguments; static unless it is inside an array"""
+
+    def __init__(self, static: str, index_expr: Optional[str] = None):
+        self.static = static
+        self.index_expr = index_expr
+
+    def child(self, key: str) -> '_Path':
+        if self.index_expr:
+            return _Path(self.static, f"{self.index_expr} + {'.' + key!r}")
+        return _Path(f'{self.static}.{key}' if self.static else key)
+
+    def item(self, index_var: str) -> '_Path':
+        prefix = self.index_expr or repr(self.static)
+        return _Path(self.static, f"{prefix} + '[' + str({index_var}) + ']'")
+
+    def message(self, text: str) -> str:
+        """Python expression for an error message at this path"""
+        if self.index_expr:
+            return f"{self.index_expr} + {' ' + text!r}"
+        return repr(f'{self.static} {text}' if self.static else text)
+
+
+def _describe(schema: Dict[str, Any]) -> str:
+    if set(schema) == {'required'}:
+        return ' and '.join(schema['required']) + ' present'
+    return json.dumps(schema, sort_keys=True)
+
+
+def compile_schema(schema: Dict[str, Any], name: str = 'schema', allow_additional: bool = False) -> Validator:
+    """Validator function for a schema: value -> list of error messages (empty if valid)"""
+    return _Compiler(name, allow_additional).compile(schema)
+
+
+class SchemaRegistry:
+    """
+    One compiled validator per tool, loaded from <tool>.schema.json at startup.
+
+    validate() returns error messages, empty when the arguments are valid. The
+    lenient variant (allow_additional=True) ignores unknown keys, for payloads
+    that carry request metadata such as text or correlationId alongside the
+    tool arguments; it is compiled on first use.
+    """
+
+    def __init__(self, directory: str = SCHEMA_DIR):
+        self.directory = directory
+        self.schemas: Dict[str, Dict[str, Any]] = {}
+        self._validators: Dict[Tuple[str, bool], Validator] = {}
+        for path in sorted(glob.glob(os.path.join(directory, '*' + SCHEMA_SUFFIX))):
+            tool = os.path.basename(path)[:-len(SCHEMA_SUFFIX)]
+            with open(path, encoding='utf-8') as f:
+                self.schemas[tool] = json.load(f)
+            self._validators[(tool, False)] = compile_schema(self.schemas[tool], tool)
+        logger.info(f"Loaded argument schemas for: {', '.join(self.schemas) or 'none'}")
+
+    def __contains__(self, tool: str) -> bool:
+        return tool in self.schemas
+
+    def validator(self, tool: str, allow_additional: bool = False) -> Optional[Validator]:
+        if tool not in self.schemas:
+            return None
+        key = (tool, allow_additional)
+        if key not in self._validators:
+            self._validators[key] = compile_schema(self.schemas[tool], tool, allow_additional)
+        return self._validators[key]
+
+    def validate(self, tool: str, args: Any, allow_additional: bool = False) -> List[str]:
+        """Error messages for args against a tool's schema; tools without a schema always pass"""
+        validator = self.validator(tool, allow_additional)
+        return validator(args) if validator else []
+
+    def stats(self) -> Dict[str, Any]:
+        return {'directory': self.directory, 'tools': sorted(self.schemas)}
@@ -2,14 +2,29 @@
 """
 Simple Agent API Server for Content Search UAT Testing
 Simulates agent responses for ACT courses and Consensus demos
+
+Responses are deterministic for a given --seed and cached per query, so the
+server can drive load tests; --latency injects a response-time distribution
+and --workers serves from several pre-forked processes.
 """
 
 from flask import Flask, request, jsonify
+import argparse
 import json
+import os
 import random
+import signal
+import socket
+import sys
+import time
 from datetime import datetime, timedelta
+from functools import lru_cache
+from werkzeug.serving import make_server
 
-app = Flask(__name__)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from content_catalog import ContentCatalog, parse_range_filters, parse_ranking
+from bm25_index import BM25Index
+from mcp_server_comprehensive import ComprehensiveRouter
 
 # Sample data for ACT courses
 ACT_COURSES = [
@@ -85,12 +100,70 @@ CONSENSUS_DEMOS = [
     }
 ]
 
-def generate_agent_response(utterance):
-    """Generate a realistic agent response based on the utterance"""
+# Indexed catalog over the samples, plus an optional JSONL catalog for load tests
+CATALOG = ContentCatalog()
+CATALOG.add_many(ACT_COURSES, 'ACT')
+CATALOG.add_many(CONSENSUS_DEMOS, 'CONSENSUS')
+if os.getenv('CONTENT_CATALOG_PATH'):
+    CATALOG.load_jsonl(os.getenv('CONTENT_CATALOG_PATH'))
+
+# BM25 relevance index over the same items; doc ids line up with catalog ids
+SEARCH_INDEX = BM25Index()
+for item, source in zip(CATALOG.items, CATALOG.sources):
+    SEARCH_INDEX.add(item, source)
+
+ROUTER = ComprehensiveRouter()
+
+# Benchmark settings, set by create_app()
+SEED = 0
+LATENCY = None
+WORKER = 0
+
+class LatencyModel:
+    """
+    Injected response latency in milliseconds, from a spec like "fixed:50",
+    "uniform:20,80", "normal:50,10", "lognormal:50,0.5" (median, sigma) or "exp:50" (mean)
+    """
+    
+    def __init__(self, spec, seed=0):
+        self.spec = spec
+        name, _, params = spec.partition(':')
+        self.name = name.lower()
+        self.params = [float(p) for p in params.split(',') if p]
+        expected = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2, 'exp': 1}
+        if self.name not in expected or len(self.params) != expected[self.name]:
+            raise ValueError(f"Invalid latency spec: {spec}")
+        self.seed = seed
+        self.rng = random.Random(seed)
+    
+    def reseed(self, worker):
+        """Give a forked worker its own sample stream (worker 0 keeps the plain seed)"""
+        self.rng.seed(self.seed if worker == 0 else f"{self.seed}|{worker}")
+    
+    def sample_ms(self):
+        p = self.params
+        if self.name == 'fixed':
+            value = p[0]
+        elif self.name == 'uniform':
+            value = self.rng.uniform(p[0], p[1])
+        elif self.name == 'normal':
+            value = self.rng.normalvariate(p[0], p[1])
+        elif self.name == 'lognormal':
+            value = p[0] * self.rng.lognormvariate(0, p[1])
+        else:
+            value = self.rng.expovariate(1.0 / p[0])
+        return max(0.0, value)
+    
+    def sleep(self):
+        time.sleep(self.sample_ms() / 1000.0)
+
+def parse_query(utterance):
+    """Reduce an utterance to the (hashable) fields that determine its response"""
     
     # Determine if it's asking for ACT or Consensus content
     is_act = "ACT" in utterance.upper()
-    is_consensus = "Consensus" in utterance.upper()
+    is_consensus = "CONSENSUS" in utterance.upper()
+    kind = "act" if is_act else "consensus" if is_consensus else "mixed"
     
     # Determine product focus
     product = "Sales Cloud"
@@ -101,175 +174,316 @@ def generate_agent_response(utterance):
     elif "Marketing Cloud" in utterance:
         product = "Marketing Cloud"
     
-    # Generate response based on content type
-    if is_act:
-        return generate_act_response(utterance, product)
-    elif is_consensus:
-        return generate_consensus_response(utterance, product)
-    else:
-        # Mixed or unclear request
-        return generate_mixed_response(utterance, product)
+    latest = CATALOG.max_value('created_date')
+    default_year = int(latest[:4]) if latest else datetime.now().year
+    filters = tuple(parse_range_filters(utterance, default_year))
+    ranking = parse_ranking(utterance)
+    topic = None if ranking else (ROUTER.extract_topic(utterance) or product)
+    return kind, product, filters, ranking, topic
 
-def generate_act_response(utterance, product):
+def find_content(source, product, filters, ranking, topic):
+    """
+    Catalog items for a source and product, narrowed by numeric filters. Items
+    are ordered by the "top N by ..." ranking if one is given, otherwise the
+    five most relevant to the topic come first.
+    Returns None if the product has no content.
+    """
+    if not CATALOG.query(source=source, tag=product, limit=1):
+        return None
+    
+    order_by, limit = ranking or (None, None)
+    ids = CATALOG.query_ids(
+        source=source,
+        tag=product,
+        filters=list(filters),
+        order_by=order_by,
+        limit=limit
+    )
+    
+    if order_by is None and ids:
+        ranked = [doc_id for _, doc_id in SEARCH_INDEX.search(topic, k=5, candidates=set(ids))]
+        ranked_set = set(ranked)
+        ids = ranked + [i for i in ids if i not in ranked_set]
+    return [CATALOG.items[i] for i in ids]
+
+def sample_rng(source, product):
+    """Per-(source, product) generator so sample content is stable for a seed"""
+    return random.Random(f"{SEED}|{source}|{product}")
+
+@lru_cache(maxsize=4096)
+def render_response(kind, product, filters, ranking, topic):
+    """Response text for a parsed query; cached since it is deterministic"""
+    if kind == "act":
+        return generate_act_response(product, filters, ranking, topic)
+    if kind == "consensus":
+        return generate_consensus_response(product, filters, ranking, topic)
+    # Mixed or unclear request
+    return generate_mixed_response(product, filters, ranking, topic)
+
+def generate_agent_response(utterance):
+    """Generate a realistic agent response based on the utterance"""
+    return render_response(*parse_query(utterance))
+
+def generate_act_response(product, filters=(), ranking=None, topic=None):
     """Generate ACT course response"""
     
-    # Filter courses by product
-    relevant_courses = [course for course in ACT_COURSES if product.lower() in course["title"].lower()]
+    relevant_courses = find_content('ACT', product, filters, ranking, topic or product)
+    
+    if relevant_courses == []:
+        return f"No ACT courses for {product} matched the requested filters."
     
-    if not relevant_courses:
+    if relevant_courses is None:
         # Generate some courses if none match
+        rng = sample_rng('ACT', product)
+        slug = product.lower().replace(' ', '-')
         relevant_courses = [
             {
                 "title": f"{product} Fundamentals",
                 "type": "Course",
-                "link": f"https://trailhead.salesforce.com/content/learn/modules/{product.lower().replace(' ', '-')}-fundamentals",
+                "link": f"https://trailhead.salesforce.com/content/learn/modules/{slug}-fundamentals",
                 "created_date": "2024-01-15",
-                "completion_rate": random.randint(70, 90),
-                "enrollments": random.randint(1000, 3000),
+                "completion_rate": rng.randint(70, 90),
+                "enrollments": rng.randint(1000, 3000),
                 "tags": [product, "Fundamentals"]
             },
             {
                 "title": f"{product} Advanced Configuration",
                 "type": "Course", 
-                "link": f"https://trailhead.salesforce.com/content/learn/modules/{product.lower().replace(' ', '-')}-advanced",
+                "link": f"https://trailhead.salesforce.com/content/learn/modules/{slug}-advanced",
                 "created_date": "2024-02-20",
-                "completion_rate": random.randint(75, 85),
-                "enrollments": random.randint(800, 2500),
+                "completion_rate": rng.randint(75, 85),
+                "enrollments": rng.randint(800, 2500),
                 "tags": [product, "Advanced"]
             }
         ]
     
     # Build response
-    response = f"Here are the ACT courses for {product}:\n\n"
+    parts = [f"Here are the ACT courses for {product}:\n\n"]
     
     for i, course in enumerate(relevant_courses[:5], 1):
-        response += f"{i}. {course['title']}\n"
-        response += f"   Type: {course['type']}\n"
-        response += f"   Link: {course['link']}\n"
-        response += f"   Created Date: {course['created_date']}\n"
-        response += f"   Completion Rate: {course['completion_rate']}%\n"
-        response += f"   Enrollments: {course['enrollments']:,}\n\n"
+        parts.append(
+            f"{i}. {course['title']}\n"
+            f"   Type: {course['type']}\n"
+            f"   Link: {course['link']}\n"
+            f"   Created Date: {course['created_date']}\n"
+            f"   Completion Rate: {course['completion_rate']}%\n"
+            f"   Enrollments: {course['enrollments']:,}\n\n"
+        )
     
     # Add insights
     total_enrollments = sum(course['enrollments'] for course in relevant_courses)
     avg_completion = sum(course['completion_rate'] for course in relevant_courses) / len(relevant_courses)
     
-    response += f"Key Insights:\n"
-    response += f"- {len(relevant_courses)} ACT courses found for {product}\n"
-    response += f"- Average completion rate: {avg_completion:.1f}%\n"
-    response += f"- Total enrollments: {total_enrollments:,}\n"
-    response += f"- Strong performance across all courses\n\n"
-    response += f"Recommendation: Focus on {relevant_courses[0]['title']} for comprehensive foundation."
+    parts.append(
+        f"Key Insights:\n"
+        f"- {len(relevant_courses)} ACT courses found for {product}\n"
+        f"- Average completion rate: {avg_completion:.1f}%\n"
+        f"- Total enrollments: {total_enrollments:,}\n"
+        f"- Strong performance across all courses\n\n"
+        f"Recommendation: Focus on {relevant_courses[0]['title']} for comprehensive foundation."
+    )
     
-    return response
+    return "".join(parts)
 
-def generate_consensus_response(utterance, product):
+def generate_consensus_response(product, filters=(), ranking=None, topic=None):
     """Generate Consensus demo response"""
     
-    # Filter demos by product
-    relevant_demos = [demo for demo in CONSENSUS_DEMOS if product.lower() in demo["title"].lower()]
+    relevant_demos = find_content('CONSENSUS', product, filters, ranking, topic or product)
     
-    if not relevant_demos:
+    if relevant_demos == []:
+        return f"No Consensus demos for {product} matched the requested filters."
+    
+    if relevant_demos is None:
         # Generate some demos if none match
+        rng = sample_rng('CONSENSUS', product)
+        slug = product.lower().replace(' ', '-')
         relevant_demos = [
             {
                 "title": f"{product} Platform Overview",
                 "type": "Demo Video",
-                "link": f"https://consensus.salesforce.com/demos/{product.lower().replace(' ', '-')}-platform-overview",
+                "link": f"https://consensus.salesforce.com/demos/{slug}-platform-overview",
                 "created_date": "2024-01-20",
-                "duration": random.randint(15, 25),
-                "view_count": random.randint(5000, 15000),
+                "duration": rng.randint(15, 25),
+                "view_count": rng.randint(5000, 15000),
                 "public_preview": True,
                 "tags": [product, "Platform"]
             },
             {
                 "title": f"{product} Advanced Features Demo",
                 "type": "Demo Video",
-                "link": f"https://consensus.salesforce.com/demos/{product.lower().replace(' ', '-')}-advanced-features",
+                "link": f"https://consensus.salesforce.com/demos/{slug}-advanced-features",
                 "created_date": "2024-02-15",
-                "duration": random.randint(18, 30),
-                "view_count": random.randint(4000, 12000),
+                "duration": rng.randint(18, 30),
+                "view_count": rng.randint(4000, 12000),
                 "public_preview": True,
                 "tags": [product, "Advanced"]
             }
         ]
     
     # Build response
-    response = f"Here are the Consensus demos for {product}:\n\n"
+    parts = [f"Here are the Consensus demos for {product}:\n\n"]
     
     for i, demo in enumerate(relevant_demos[:5], 1):
-        response += f"{i}. {demo['title']}\n"
-        response += f"   Type: {demo['type']}\n"
-        response += f"   Link: {demo['link']}\n"
-        response += f"   Created Date: {demo['created_date']}\n"
-        response += f"   Duration: {demo['duration']} minutes\n"
-        response += f"   View Count: {demo['view_count']:,}\n"
-        response += f"   Public Preview: {'Available' if demo['public_preview'] else 'Not Available'}\n\n"
+        parts.append(
+            f"{i}. {demo['title']}\n"
+            f"   Type: {demo['type']}\n"
+            f"   Link: {demo['link']}\n"
+            f"   Created Date: {demo['created_date']}\n"
+            f"   Duration: {demo['duration']} minutes\n"
+            f"   View Count: {demo['view_count']:,}\n"
+            f"   Public Preview: {'Available' if demo['public_preview'] else 'Not Available'}\n\n"
+        )
     
     # Add insights
     total_views = sum(demo['view_count'] for demo in relevant_demos)
     avg_duration = sum(demo['duration'] for demo in relevant_demos) / len(relevant_demos)
     
-    response += f"Key Insights:\n"
-    response += f"- {len(relevant_demos)} Consensus demos found for {product}\n"
-    response += f"- Total view count: {total_views:,}\n"
-    response += f"- Average duration: {avg_duration:.1f} minutes\n"
-    response += f"- All demos have public preview available\n"
-    response += f"- Strong engagement across all demos\n\n"
-    response += f"Recommendation: Start with {relevant_demos[0]['title']} for comprehensive understanding."
+    parts.append(
+        f"Key Insights:\n"
+        f"- {len(relevant_demos)} Consensus demos found for {product}\n"
+        f"- Total view count: {total_views:,}\n"
+        f"- Average duration: {avg_duration:.1f} minutes\n"
+        f"- All demos have public preview available\n"
+        f"- Strong engagement across all demos\n\n"
+        f"Recommendation: Start with {relevant_demos[0]['title']} for comprehensive understanding."
+    )
     
-    return response
+    return "".join(parts)
 
-def generate_mixed_response(utterance, product):
+def generate_mixed_response(product, filters=(), ranking=None, topic=None):
     """Generate mixed ACT/Consensus response"""
-    return f"Here's a comprehensive overview of {product} content:\n\n" + \
-           generate_act_response(utterance, product) + "\n\n" + \
-           generate_consensus_response(utterance, product)
+    return "".join([
+        f"Here's a comprehensive overview of {product} content:\n\n",
+        generate_act_response(product, filters, ranking, topic),
+        "\n\n",
+        generate_consensus_response(product, filters, ranking, topic)
+    ])
 
-@app.route('/api/agent/analyze', methods=['POST'])
-def analyze_utterance():
-    """Main API endpoint for agent analysis"""
-    try:
-        data = request.get_json()
-        utterance = data.get('utterance', '')
-        
-        if not utterance:
+def create_app(seed=0, latency=None):
+    """
+    Build the Flask app.
+    
+    seed fixes generated sample content; latency is a LatencyModel spec
+    (e.g. "normal:50,10") injected before every analyze response.
+    """
+    global SEED, LATENCY
+    SEED = seed
+    LATENCY = LatencyModel(latency, seed) if latency else None
+    render_response.cache_clear()
+    
+    app = Flask(__name__)
+    
+    @app.route('/api/agent/analyze', methods=['POST'])
+    def analyze_utterance():
+        """Main API endpoint for agent analysis"""
+        try:
+            data = request.get_json()
+            utterance = data.get('utterance', '')
+            
+            if not utterance:
+                return jsonify({
+                    "error": "No utterance provided",
+                    "response": "Please provide a valid utterance to analyze."
+                }), 400
+            
+            # Generate agent response
+            agent_response = generate_agent_response(utterance)
+            
+            if LATENCY is not None:
+                LATENCY.sleep()
+            
+            return jsonify({
+                "success": True,
+                "response": agent_response,
+                "utterance": utterance,
+                "timestamp": datetime.now().isoformat(),
+                "source": "Agent API"
+            })
+            
+        except Exception as e:
             return jsonify({
-                "error": "No utterance provided",
-                "response": "Please provide a valid utterance to analyze."
-            }), 400
-        
-        # Generate agent response
-        agent_response = generate_agent_response(utterance)
-        
+                "error": str(e),
+                "response": f"Error processing request: {str(e)}"
+            }), 500
+    
+    @app.route('/health', methods=['GET'])
+    def health_check():
+        """Health check endpoint"""
+        cache = render_response.cache_info()
         return jsonify({
-            "success": True,
-            "response": agent_response,
-            "utterance": utterance,
+            "status": "healthy",
             "timestamp": datetime.now().isoformat(),
-            "source": "Agent API"
+            "service": "Agent API Server",
+            "catalog": CATALOG.stats(),
+            "search_index": SEARCH_INDEX.stats(),
+            "seed": SEED,
+            "latency": LATENCY.spec if LATENCY else None,
+            "worker": WORKER,
+            "response_cache": {"hits": cache.hits, "misses": cache.misses, "size": cache.currsize}
         })
-        
-    except Exception as e:
-        return jsonify({
-            "error": str(e),
-            "response": f"Error processing request: {str(e)}"
-        }), 500
+    
+    return app
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "service": "Agent API Server"
-    })
+def warm_cache():
+    """Render the unfiltered response for every kind and product, so forked workers inherit them"""
+    products = sorted({tag for item in ACT_COURSES + CONSENSUS_DEMOS for tag in item['tags'][:1]})
+    for product in products:
+        for prefix in ("ACT courses", "Consensus demos", "Content"):
+            generate_agent_response(f"{prefix} for {product}")
+
+def serve_prefork(app, host, port, workers):
+    """
+    Serve app from workers processes forked after the listening socket is bound
+    and the response cache is warm. Each worker is a long-lived threaded server
+    accepting on the shared socket, with its own latency sample stream.
+    """
+    global WORKER
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(128)
+    warm_cache()
+    
+    children = []
+    for index in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            WORKER = index
+            if LATENCY is not None:
+                LATENCY.reseed(index)
+            make_server(host, port, app, threaded=True, fd=listener.fileno()).serve_forever()
+            os._exit(0)
+        children.append(pid)
+    listener.close()
+    
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Agent API mock server')
+    parser.add_argument('--port', type=int, default=9999, help='Port to listen on')
+    parser.add_argument('--seed', type=int, default=int(os.getenv('AGENT_API_SEED', '0')),
+                        help='Seed for generated sample content')
+    parser.add_argument('--latency', default=os.getenv('AGENT_API_LATENCY'),
+                        help='Injected latency, e.g. fixed:50, uniform:20,80, normal:50,10, lognormal:50,0.5, exp:50')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Pre-forked worker processes (1 = single process, threaded)')
+    parser.add_argument('--debug', action='store_true', help='Run with the Flask debugger and reloader')
+    args = parser.parse_args()
+    
     print("🚀 Starting Agent API Server")
-    print("📡 Server will be available at: http://localhost:9999")
-    print("🔗 Health check: http://localhost:9999/health")
-    print("🧪 Test endpoint: http://localhost:9999/api/agent/analyze")
+    print(f"📡 Server will be available at: http://localhost:{args.port}")
+    print(f"🔗 Health check: http://localhost:{args.port}/health")
+    print(f"🧪 Test endpoint: http://localhost:{args.port}/api/agent/analyze")
+    print(f"🎲 Seed: {args.seed}, latency: {args.latency or 'none'}, workers: {args.workers}")
     print("=" * 50)
     
-    app.run(host='0.0.0.0', port=9999, debug=True)
+    app = create_app(seed=args.seed, latency=args.latency)
+    if args.workers > 1:
+        serve_prefork(app, '0.0.0.0', args.port, args.workers)
+    else:
+        app.run(host='0.0.0.0', port=args.port, debug=args.debug, threaded=True)
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Equivalence check for the vectorized pipeline code
+Runs PipelineStore, PipelineRollups, the bitmap index, the aggregation runner and the
+CURRENT vs PREVIOUS comparison over seeded synthetic records, and checks every answer
+against a plain per-record scan of the same records
+"""
+
+import argparse
+import os
+import random
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline_aggregate import AggregationSpec, field_for
+from pipeline_compare import compare_open_pipe
+from pipeline_rollups import PipelineRollups
+from pipeline_store import OPEN_PIPE_SLOTS, PipelineStore, parse_stage
+
+# Mixed case on purpose: every filter is case-insensitive
+OUS = ['AMER ACC', 'amer acc', 'EMEA ENTR', 'AMER ICE', 'LATAM', 'UKI']
+COUNTRIES = ['US', 'us', 'Canada', 'Brazil', 'UKI', 'Germany', None]
+PRODUCTS = ['Data Cloud', 'Sales Cloud', 'Service Cloud', 'Tableau Cloud', 'Slack', 'Agentforce', 'MuleSoft', None]
+STAGES = ['01 - Identifying', '02 - Determining Problem, Impact, Ideal', '03 - Validating Benefits & Value',
+          '04 - Confirming Value With Power', '05 - Negotiating $$ & Mutual Plan', 'Closed', None]
+TIME_FRAMES = ['CURRENT', 'PREVIOUS', 'previous', None]
+
+
+def synthetic_records(n: int, seed: int, offset: int = 0) -> List[Dict[str, Any]]:
+    """Pipeline records with nulls, unknown stages and missing amounts sprinkled in"""
+    rng = random.Random(seed)
+
+    def maybe(value, p_null=0.1):
+        return None if rng.random() < p_null else value
+
+    records = []
+    for i in range(offset, offset + n):
+        record = {
+            'Id': f"a0{i:013d}",
+            'EMP_ID__c': str(100000 + i),
+            'FULL_NAME__c': f"AE {i}",
+            'EMP_EMAIL_ADDR__c': f"ae{i}@example.com",
+            'OU_NAME__c': rng.choice(OUS),
+            'WORK_LOCATION_COUNTRY__c': rng.choice(COUNTRIES),
+            'PRIMARY_INDUSTRY__c': rng.choice(['Retail', 'Healthcare', 'Financial Services', None]),
+            'CQ_ACV__c': maybe(rng.randint(0, 1000000)),
+            'PQ_ACV__c': maybe(rng.randint(0, 1000000)),
+            'CQ_PG__c': maybe(rng.randint(0, 500000)),
+            'CQ_CALL_CONNECT__c': maybe(rng.randint(0, 100)),
+            'CQ_CUSTOMER_MEETING__c': maybe(rng.randint(0, 40), 0.2),
+            'COVERAGE__c': maybe(round(rng.uniform(0, 3), 2), 0.3),
+            'ACTIONABLE__c': rng.choice(['Follow up on renewal', '', '  ', None]),
+            'TIME_FRAME': rng.choice(TIME_FRAMES),
+        }
+        for slot in range(1, rng.randint(0, OPEN_PIPE_SLOTS) + 1):
+            record[f"OPEN_PIPE_OPTY_NM_{slot}__c"] = f"Opp {i}-{slot}"
+            record[f"OPEN_PIPE_PROD_NM_{slot}__c"] = rng.choice(PRODUCTS)
+            record[f"OPEN_PIPE_OPTY_STG_NM_{slot}__c"] = rng.choice(STAGES)
+            record[f"OPEN_PIPE_ORIGINAL_OPENPIPE_ALLOC_AMT_{slot}__c"] = maybe(str(rng.randint(1000, 500000)))
+            record[f"OPEN_PIPE_AE_SCORE_{slot}__c"] = maybe(round(rng.uniform(1, 5), 2), 0.4)
+        records.append(record)
+    return records
+
+
+class Scan:
+    """The same records as plain Python rows, answered with loops"""
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.employees = []
+        self.pipe = []
+        for record in records:
+            employee = dict(record)
+            employee['TIME_FRAME'] = (record.get('TIME_FRAME') or 'CURRENT').upper()
+            self.employees.append(employee)
+            for slot in range(1, OPEN_PIPE_SLOTS + 1):
+                if not record.get(f"OPEN_PIPE_OPTY_NM_{slot}__c"):
+                    continue
+                amount = record.get(f"OPEN_PIPE_ORIGINAL_OPENPIPE_ALLOC_AMT_{slot}__c")
+                self.pipe.append({
+                    'emp': employee,
+                    'product': record.get(f"OPEN_PIPE_PROD_NM_{slot}__c"),
+                    'stage': parse_stage(record.get(f"OPEN_PIPE_OPTY_STG_NM_{slot}__c")),
+                    'amount': float(amount) if amount is not None else 0.0,
+                    'score': record.get(f"OPEN_PIPE_AE_SCORE_{slot}__c"),
+                })
+
+    @staticmethod
+    def same(value: Optional[str], wanted: Optional[str]) -> bool:
+        return not wanted or (value or '').lower() == wanted.lower()
+
+    @staticmethod
+    def holds(product: Optional[str], names: List[str]) -> bool:
+        return bool(product) and any(name.lower() in product.lower() for name in names)
+
+    def pipe_rows(self, ouName, country=None, minStage=None, productListCsv=None, timeFrame='CURRENT'):
+        products = [p.strip() for p in (productListCsv or '').split(',') if p.strip()]
+        return [row for row in self.pipe
+                if self.same(row['emp']['OU_NAME__c'], ouName)
+                and self.same(row['emp']['WORK_LOCATION_COUNTRY__c'], country)
+                and self.same(row['emp']['TIME_FRAME'], timeFrame)
+                and (minStage is None or row['stage'] >= minStage)
+                and (not products or self.holds(row['product'], products))]
+
+    def open_pipe(self, **filters) -> Dict[str, Any]:
+        rows = self.pipe_rows(**filters)
+        by_ae: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            ae = by_ae.setdefault(row['emp']['EMP_ID__c'], {'opportunities': 0, 'amount': 0.0, 'scores': []})
+            ae['opportunities'] += 1
+            ae['amount'] += row['amount']
+            if row['score'] is not None:
+                ae['scores'].append(row['score'])
+        return {'total': sum(row['amount'] for row in rows), 'opportunities': len(rows), 'aes': by_ae}
+
+    def kpi(self, ouName: str, timeFrame: str, country: Optional[str]) -> Dict[str, Any]:
+        employees = [e for e in self.employees if self.same(e['OU_NAME__c'], ouName)
+                     and self.same(e['TIME_FRAME'], timeFrame) and self.same(e['WORK_LOCATION_COUNTRY__c'], country)]
+
+        def total(field):
+            return sum(e[field] or 0 for e in employees)
+
+        coverage = [e['COVERAGE__c'] for e in employees if e['COVERAGE__c'] is not None]
+        return {
+            'aeCount': len(employees),
+            'totalACV': total('CQ_ACV__c'),
+            'totalPG': total('CQ_PG__c'),
+            'totalMeetings': total('CQ_CUSTOMER_MEETING__c'),
+            'totalCallConnects': total('CQ_CALL_CONNECT__c'),
+            'avgCoverage': sum(coverage) / len(coverage) if coverage else 0,
+        }
+
+    def negative_intent(self, ouName, excludeProducts, country=None, timeFrame='CURRENT',
+                        includeProducts=None, requireAllProducts=False, minStage=None) -> Dict[str, Any]:
+        held = defaultdict(list)
+        for row in self.pipe:
+            held[id(row['emp'])].append(row)
+        exclude = [p.strip() for p in (excludeProducts or '').split(',') if p.strip()]
+        include = [p.strip() for p in (includeProducts or '').split(',') if p.strip()]
+        matched = []
+        for employee in self.employees:
+            rows = held[id(employee)]
+            if not (self.same(employee['OU_NAME__c'], ouName) and self.same(employee['TIME_FRAME'], timeFrame)
+                    and self.same(employee['WORK_LOCATION_COUNTRY__c'], country)):
+                continue
+            if include:
+                hits = [any(self.holds(r['product'], [name]) for r in rows) for name in include]
+                if not (all(hits) if requireAllProducts else any(hits)):
+                    continue
+            if minStage is not None and not any(r['stage'] >= minStage for r in rows):
+                continue
+            if any(self.holds(r['product'], exclude) for r in rows):
+                continue
+            matched.append((employee['EMP_ID__c'], sum(r['amount'] for r in rows)))
+        return {'aeCount': len(matched), 'total': sum(amount for _, amount in matched), 'aes': dict(matched)}
+
+    def aggregate(self, field: str, agg: str, group_by: Optional[str], filters: Dict[str, str],
+                  percentile: Optional[float] = None) -> Dict[Any, Any]:
+        groups = defaultdict(list)
+        people = defaultdict(set)
+        for employee in self.employees:
+            if not all(self.same(employee[name], value) for name, value in filters.items()):
+                continue
+            if employee[field] is None:
+                continue
+            key = employee[group_by] if group_by else None
+            groups[key].append(float(employee[field]))
+            people[key].add(employee['EMP_ID__c'])
+        functions = {
+            'SUM': sum, 'COUNT': len, 'MIN': min, 'MAX': max,
+            'AVG': lambda values: sum(values) / len(values),
+            'PERCENTILE': lambda values: float(np.percentile(values, percentile)),
+        }
+        return {key: (functions[agg](values), len(people[key])) for key, values in groups.items()}
+
+    def comparison(self, ouName, country=None, minStage=None, productListCsv=None) -> Dict[str, Any]:
+        totals = {'CURRENT': [0.0, 0], 'PREVIOUS': [0.0, 0]}
+        by_stage = defaultdict(lambda: {'CURRENT': [0.0, 0], 'PREVIOUS': [0.0, 0]})
+        by_product = defaultdict(lambda: {'CURRENT': [0.0, 0], 'PREVIOUS': [0.0, 0]})
+        for frame in totals:
+            for row in self.pipe_rows(ouName, country, minStage, productListCsv, frame):
+                stage = row['stage'] if row['stage'] >= 0 else None
+                for cell in (totals[frame], by_stage[stage][frame], by_product[row['product']][frame]):
+                    cell[0] += row['amount']
+                    cell[1] += 1
+        return {'totals': totals, 'byStage': dict(by_stage), 'byProduct': dict(by_product)}
+
+
+class Check:
+    """Counts cases and keeps the first few mismatches of one check"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.cases = 0
+        self.failures: List[str] = []
+
+    def expect(self, condition: bool, detail: str):
+        self.cases += 1
+        if not condition:
+            self.failures.append(detail)
+
+    def close(self, actual: float, expected: float, detail: str, places: int = 2):
+        self.expect(abs(float(actual) - round(float(expected), places)) <= 10 ** -places, f"{detail}: {actual} != {expected}")
+
+    def report(self) -> bool:
+        status = "PASS" if not self.failures else "FAIL"
+        print(f"{status}: {self.name} ({self.cases} comparisons)")
+        for failure in self.failures[:5]:
+            print(f"    {failure}")
+        return not self.failures
+
+
+def open_pipe_cases(rng: random.Random, count: int) -> List[Dict[str, Any]]:
+    products = [p for p in PRODUCTS if p] + ['cloud', 'SLACK']
+    cases = []
+    for _ in range(count):
+        cases.append({
+            'ouName': rng.choice(OUS + ['Nowhere']),
+            'country': rng.choice(COUNTRIES),
+            'minStage': rng.choice([None, None, 0, 2, 4, 5]),
+            'productListCsv': rng.choice([None, None, rng.choice(products), ','.join(rng.sample(products, 2))]),
+            'timeFrame': rng.choice(['CURRENT', 'PREVIOUS', 'current']),
+        })
+    return cases
+
+
+def check_open_pipe(store: PipelineStore, rollups: PipelineRollups, scan: Scan, cases) -> List[Check]:
+    mirror, materialized = Check("PipelineStore.open_pipe_analyze vs scan"), Check("PipelineRollups.open_pipe_analyze vs PipelineStore")
+    for filters in cases:
+        label = ', '.join(f"{k}={v}" for k, v in filters.items() if v is not None)
+        expected = scan.open_pipe(**filters)
+        result = store.open_pipe_analyze(**filters, limitN=10)
+        mirror.close(result['totalOpenPipeAmount'], expected['total'], f"[{label}] total")
+        mirror.expect(result['opportunityCount'] == expected['opportunities'], f"[{label}] opportunities")
+        mirror.expect(result['aeCount'] == len(expected['aes']), f"[{label}] AEs {result['aeCount']} != {len(expected['aes'])}")
+        top = sorted((ae['amount'] for ae in expected['aes'].values()), reverse=True)[:10]
+        mirror.expect(np.allclose([row['openPipeAmount'] for row in result['rows']], np.round(top, 2)), f"[{label}] top amounts")
+        for row in result['rows']:
+            ae = expected['aes'][row['empId']]
+            mirror.expect(row['opportunities'] == ae['opportunities'], f"[{label}] {row['empId']} opportunities")
+            score = round(sum(ae['scores']) / len(ae['scores']), 2) if ae['scores'] else None
+            mirror.expect(row['avgAeScore'] == score, f"[{label}] {row['empId']} avgAeScore {row['avgAeScore']} != {score}")
+
+        answer = rollups.open_pipe_analyze(**filters, limitN=10)
+        if answer is None:
+            # Outside the materialized slices (several products); the server falls back to the mirror
+            continue
+        for key in ('totalOpenPipeAmount', 'opportunityCount', 'aeCount', 'rows'):
+            materialized.expect(answer[key] == result[key], f"[{label}] {key}: {answer[key]} != {result[key]}")
+    return [mirror, materialized]
+
+
+def check_kpi(rollups: PipelineRollups, scan: Scan) -> Check:
+    check = Check("PipelineRollups.kpi_analyze vs scan")
+    for ou in OUS:
+        for time_frame in ('CURRENT', 'PREVIOUS'):
+            for country in COUNTRIES:
+                label = f"{ou}/{time_frame}/{country}"
+                result = rollups.kpi_analyze(ou, time_frame, country)
+                expected = scan.kpi(ou, time_frame, country)
+                check.expect(result['aeCount'] == expected['aeCount'], f"[{label}] aeCount")
+                for key in ('totalACV', 'totalPG', 'totalMeetings', 'totalCallConnects', 'avgCoverage'):
+                    check.close(result[key], expected[key], f"[{label}] {key}")
+    return check
+
+
+def check_bitmap(store: PipelineStore, scan: Scan, rng: random.Random, count: int) -> Check:
+    check = Check("PipelineBitmapIndex.negative_intent vs scan")
+    index = store.bitmap_index()
+    products = [p for p in PRODUCTS if p] + ['cloud']
+    for _ in range(count):
+        filters = {
+            'ouName': rng.choice(OUS),
+            'excludeProducts': ','.join(rng.sample(products, rng.randint(1, 2))),
+            'country': rng.choice(COUNTRIES),
+            'timeFrame': rng.choice(['CURRENT', 'PREVIOUS']),
+            'includeProducts': rng.choice([None, None, ','.join(rng.sample(products, 2))]),
+            'requireAllProducts': rng.random() < 0.3,
+            'minStage': rng.choice([None, 2, 4]),
+        }
+        label = ', '.join(f"{k}={v}" for k, v in filters.items() if v not in (None, False))
+        result = index.negative_intent(**filters, limitN=10)
+        expected = scan.negative_intent(**filters)
+        check.expect(result['aeCount'] == expected['aeCount'], f"[{label}] aeCount {result['aeCount']} != {expected['aeCount']}")
+        check.close(result['totalOpenPipeAmount'], expected['total'], f"[{label}] total")
+        for row in result['rows']:
+            check.expect(row['empId'] in expected['aes'], f"[{label}] {row['empId']} should have been excluded")
+    return check
+
+
+def check_aggregate(store: PipelineStore, scan: Scan) -> Check:
+    check = Check("AggregationRunner vs scan")
+    runner = store.aggregation_runner()
+    specs = [
+        ('ACV', 'SUM', 'CURRENT', 'OU', {'TIME_FRAME': 'CURRENT'}),
+        ('ACV', 'SUM', 'PREVIOUS', 'COUNTRY', {'TIME_FRAME': 'PREVIOUS', 'OU': 'AMER ACC'}),
+        ('CALLS', 'AVG', 'CURRENT', 'OU', {}),
+        ('PG', 'MIN', 'CURRENT', 'INDUSTRY', {'TIME_FRAME': 'CURRENT'}),
+        ('PG', 'MAX', 'CURRENT', 'INDUSTRY', {}),
+        ('ACV', 'P90', 'CURRENT', 'OU', {'COUNTRY': 'US'}),
+        ('MEETINGS', 'MEDIAN', 'CURRENT', None, {'OU': 'LATAM'}),
+        ('COVERAGE', 'COUNT', 'CURRENT', 'COUNTRY', {}),
+    ]
+    for metric, agg_fn, time_frame, group_by, filters in specs:
+        spec = AggregationSpec.from_request(metric, time_frame, group_by, filters, perAENormalize=True, aggFn=agg_fn)
+        result = runner.run(spec)
+        scan_filters = {field_for(dim): value for dim, value in filters.items()}
+        expected = scan.aggregate(spec.metricFieldApi, spec.aggFn, spec.groupByFieldApi, scan_filters, spec.percentile)
+        label = spec.summary()
+        check.expect(len(result['rows']) == len(expected), f"[{label}] groups {len(result['rows'])} != {len(expected)}")
+        for row in result['rows']:
+            value, people = expected.get(row['groupValue'], (None, None))
+            check.expect(value is not None, f"[{label}] unexpected group {row['groupValue']}")
+            if value is not None:
+                check.close(row['agg'], value, f"[{label}] {row['groupValue']}", spec.precision)
+                check.expect(row['nPeople'] == people, f"[{label}] {row['groupValue']} nPeople")
+    return check
+
+
+def check_compare(store: PipelineStore, scan: Scan, cases) -> Check:
+    check = Check("compare_open_pipe vs scan")
+    for filters in cases:
+        filters = {k: v for k, v in filters.items() if k != 'timeFrame'}
+        label = ', '.join(f"{k}={v}" for k, v in filters.items() if v is not None)
+        result = compare_open_pipe(store, **filters, limitN=1000)
+        expected = scan.comparison(**filters)
+        for index, frame in enumerate(('current', 'previous')):
+            check.close(result['totals'][frame], expected['totals'][frame.upper()][0], f"[{label}] {frame} total")
+            check.expect(result['totals']['opportunities'][index] == expected['totals'][frame.upper()][1],
+                         f"[{label}] {frame} opportunities")
+        for breakdown, key in (('byStage', 'stage'), ('byProduct', 'product')):
+            rows = {row[key]: row for row in result[breakdown]}
+            check.expect(set(rows) == set(expected[breakdown]), f"[{label}] {breakdown} groups {sorted(map(str, rows))}")
+            for group, cells in expected[breakdown].items():
+                row = rows.get(group)
+                if row is None:
+                    continue
+                check.close(row['current'], cells['CURRENT'][0], f"[{label}] {breakdown} {group} current")
+                check.close(row['previous'], cells['PREVIOUS'][0], f"[{label}] {breakdown} {group} previous")
+                check.expect(row['opportunities'] == [cells['CURRENT'][1], cells['PREVIOUS'][1]],
+                             f"[{label}] {breakdown} {group} opportunities")
+    return check
+
+
+def check_refresh(store: PipelineStore, rollups: PipelineRollups, records, seed: int) -> Check:
+    check = Check("PipelineRollups.refresh vs build")
+    rng = random.Random(seed + 1)
+    changed = synthetic_records(max(1, len(records) // 50), seed + 2)
+    for record in changed:
+        # Half the changes update existing Ids, half are new records
+        if rng.random() < 0.5:
+            record['Id'] = rng.choice(records)['Id']
+        else:
+            record['Id'] = f"b0{rng.randrange(10 ** 12):013d}"
+    deleted = [record['Id'] for record in rng.sample(records, max(1, len(records) // 100))]
+    updated = store.apply_changes(changed, deleted)
+
+    refreshed, rebuilt = rollups.refresh(updated), PipelineRollups.build(updated)
+    check.expect(set(refreshed.pipe_slices) == set(rebuilt.pipe_slices), "open-pipe slice keys")
+    for key, arrays in rebuilt.pipe_slices.items():
+        other = refreshed.pipe_slices.get(key)
+        check.expect(other is not None and all(np.allclose(a, b) for a, b in zip(arrays, other)), f"slice {key}")
+    check.expect(set(refreshed.kpi) == set(rebuilt.kpi), "KPI slice keys")
+    for key, totals in rebuilt.kpi.items():
+        other = refreshed.kpi.get(key, {})
+        check.expect(all(np.isclose(other.get(name, np.nan), value) for name, value in totals.items()), f"KPI {key}")
+    return check
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the vectorized pipeline code against a per-record scan')
+    parser.add_argument('--records', type=int, default=5000, help='Synthetic pipeline records')
+    parser.add_argument('--cases', type=int, default=200, help='Random filter combinations per check')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    records = synthetic_records(args.records, args.seed)
+    store = PipelineStore.from_records(records)
+    rollups = PipelineRollups.build(store)
+    scan = Scan(records)
+    rng = random.Random(args.seed)
+    cases = open_pipe_cases(rng, args.cases)
+    print(f"Pipeline equivalence: {len(store.employees)} records, {len(store.pipe)} open-pipe rows, seed {args.seed}")
+    print("=" * 50)
+
+    checks = check_open_pipe(store, rollups, scan, cases)
+    checks += [
+        check_kpi(rollups, scan),
+        check_bitmap(store, scan, rng, args.cases),
+        check_aggregate(store, scan),
+        check_compare(store, scan, cases[:max(1, args.cases // 4)]),
+        check_refresh(store, rollups, records, args.seed),
+    ]
+    passed = all([check.report() for check in checks])
+    print("\nPASS: vectorized results match the scan" if passed else "\nFAIL: see mismatches above")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+Offline checks for the comprehensive server's building blocks
+Runs the circuit breaker, token refresh, result cache, batching, gazetteer, router,
+sessions, routing reload and prefetch against fixed cases and a local fake Salesforce,
+and prints PASS/FAIL per component
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from check_pipeline_equivalence import Check
+from entity_gazetteer import Gazetteer
+
+# Utterance -> expected tool and a subset of its args (None means the arg must be absent)
+ROUTER_CASES = [
+    ("kpi for uki", 'kpi_analyze', {'ouName': 'UKI'}),
+    ("kpi for anz", 'kpi_analyze', {'ouName': 'ANZ'}),
+    ("kpi for Uki", 'kpi_analyze', {'ouName': 'UKI'}),
+    ("kpi for UKI", 'kpi_analyze', {'ouName': 'UKI'}),
+    ("open pipe for ACC in AMER", 'open_pipe_analyze', {'ouName': 'AMER ACC', 'country': None}),
+    ("open pipe for AMER ACC in Canada", 'open_pipe_analyze', {'ouName': 'AMER ACC', 'country': 'Canada'}),
+    ("open pipe for UKI in Germany", 'open_pipe_analyze', {'ouName': 'UKI', 'country': 'Germany'}),
+    ("kpi for AMER ACC in Germny", 'kpi_analyze', {'ouName': 'AMER ACC', 'country': 'Germany'}),
+    ("open pipe for UKI in Brazill", 'open_pipe_analyze', {'ouName': 'UKI', 'country': 'Brazil'}),
+]
+
+
+class FakeSalesforce:
+    """
+    Local stand-in for the invocable action and OAuth token endpoints that counts
+    the calls it gets. Actions answer with status (and Retry-After) when it isn't
+    200, with 401 for a bearer token outside tokens when that is set, and with
+    isSuccess set to success otherwise; tokens it issues are added to tokens.
+    """
+
+    def __init__(self, delay_s: float = 0.2):
+        from flask import Flask, jsonify, request
+        from werkzeug.serving import make_server
+        self.calls: List[str] = []
+        self.delay_s = delay_s
+        self.status = 200
+        self.retry_after = None
+        self.tokens = None
+        self.success = True
+        self.token_requests = 0
+        app = Flask('fake-salesforce')
+
+        @app.route('/services/oauth2/token', methods=['POST'])
+        def token():
+            self.token_requests += 1
+            issued = f"token-{self.token_requests}"
+            time.sleep(self.delay_s)
+            if self.tokens is not None:
+                self.tokens.add(issued)
+            return jsonify({'access_token': issued, 'instance_url': self.url,
+                            'issued_at': str(int(time.time() * 1000))})
+
+        @app.route('/services/data/v58.0/actions/custom/<path:name>', methods=['POST'])
+        def action(name):
+            self.calls.append(name)
+            time.sleep(self.delay_s)
+            token = request.headers.get('Authorization', '').replace('Bearer ', '')
+            if self.tokens is not None and token not in self.tokens:
+                return jsonify([{'errorCode': 'INVALID_SESSION_ID'}]), 401
+            if self.status != 200:
+                headers = {'Retry-After': str(self.retry_after)} if self.retry_after is not None else {}
+                return jsonify([{'errorCode': 'REQUEST_LIMIT_EXCEEDED'}]), self.status, headers
+            inputs = request.get_json()['inputs']
+            return jsonify([{'isSuccess': self.success, 'outputValues': {'call': len(self.calls)}} for _ in inputs])
+
+        self._server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def close(self):
+        self._server.shutdown()
+
+
+def check_breaker() -> Check:
+    from sf_resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+
+    check = Check("CircuitBreaker states and generation guard")
+    breaker = CircuitBreaker('action', min_calls=4, window_size=4, open_duration_s=0.05)
+    for success in (True, False, True):
+        breaker.record(success, 10, breaker.admit())
+    check.expect(breaker.state == CircuitBreaker.CLOSED, f"1 failure in 3 calls: {breaker.state}")
+    breaker.record(False, 10, breaker.admit())
+    check.expect(breaker.state == CircuitBreaker.OPEN, f"2 failures in 4 calls: {breaker.state}")
+    check.expect(breaker.admit() is None and breaker.retry_after() > 0, "open circuit admits a call")
+
+    time.sleep(0.06)
+    probe = breaker.admit()
+    check.expect(breaker.state == CircuitBreaker.HALF_OPEN and probe is not None, f"after cool-down: {breaker.state}")
+    check.expect(breaker.admit() is None, "half-open admits a second probe")
+    breaker.record(False, 10, probe)
+    check.expect(breaker.state == CircuitBreaker.OPEN, f"failed probe: {breaker.state}")
+
+    time.sleep(0.06)
+    probe = breaker.admit()
+    breaker.record(True, 10, probe)
+    check.expect(breaker.state == CircuitBreaker.CLOSED, f"successful probe: {breaker.state}")
+
+    # A call admitted while CLOSED that finishes after OPEN -> HALF_OPEN is not the probe
+    stale = breaker.admit()
+    for _ in range(4):
+        breaker.record(False, 10, breaker.admit())
+    time.sleep(0.06)
+    probe = breaker.admit()
+    breaker.record(True, 10, stale)
+    check.expect(breaker.state == CircuitBreaker.HALF_OPEN, f"stale success closed the circuit: {breaker.state}")
+    check.expect(breaker.admit() is None, "stale outcome released the probe slot")
+    breaker.record(False, 10, probe)
+    check.expect(breaker.state == CircuitBreaker.OPEN, f"probe failure after a stale success: {breaker.state}")
+
+    caller = ResilientCaller(breaker_options={'min_calls': 2, 'window_size': 2, 'open_duration_s': 60})
+    for _ in range(2):
+        caller.call('action', lambda: 500, is_failure=lambda status: status >= 500)
+    try:
+        caller.call('action', lambda: check.expect(False, "open circuit ran the call"))
+        check.expect(False, "open circuit did not raise CircuitOpenError")
+    except CircuitOpenError as e:
+        check.expect(e.retry_after_s > 0, f"retry_after_s {e.retry_after_s}")
+    return check
+
+
+def check_gazetteer() -> Check:
+    check = Check("Gazetteer case sensitivity")
+    gazetteer = Gazetteer()
+    gazetteer.add('country', 'CA', 'Canada')
+    gazetteer.add('ou', 'uki', 'UKI')
+    gazetteer.add('ou', 'UKI', 'UKI', case_sensitive=False)
+    gazetteer.add('product', 'Data Cloud', 'Data Cloud')
+
+    def found(text):
+        return [(entity.type, entity.value) for entity in gazetteer.find(text)]
+
+    check.expect(found("pipe in CA") == [('country', 'Canada')], f"short alias matches its own case: {found('pipe in CA')}")
+    check.expect(found("where ca sits") == [], f"short alias is case-sensitive by default: {found('where ca sits')}")
+    check.expect(found("data cloud pipe") == [('product', 'Data Cloud')], "long alias ignores case")
+    for text in ("kpi for uki", "kpi for UKI", "kpi for Uki"):
+        check.expect(found(text) == [('ou', 'UKI')], f"re-added alias takes the new case rule: {text!r} -> {found(text)}")
+    check.expect(gazetteer.lookup('UKI')['ou'][0] == 'uki', "re-add keeps the first spelling")
+    gazetteer.add('ou', 'uki', 'UK&I', replace=False)
+    check.expect(gazetteer.lookup('uki')['ou'][1] == 'UKI', "replace=False keeps the existing value")
+    return check
+
+
+def check_fuzzy() -> Check:
+    from fuzzy_resolver import FuzzyResolver, edit_distance
+
+    check = Check("FuzzyResolver lookups")
+    check.expect(edit_distance('slack', 'salck', 2) == 1, "a transposition costs 1")
+    check.expect(edit_distance('tableau', 'data', 1) == 2, "distance over the limit is limit + 1")
+    resolver = FuzzyResolver()
+    for entity_type, alias in (('product', 'Tableau Cloud'), ('product', 'Slack'), ('ou', 'AMER ACC'),
+                               ('ou', 'UKI'), ('country', 'Germany')):
+        resolver.add(entity_type, alias, alias)
+    for query, expected in (("Tablaeu Cloud", 'Tableau Cloud'), ("AMER ACCC", 'AMER ACC'), ("Germny", 'Germany'),
+                            ("UKK", None), ("stack", None), ("Slakc", None)):
+        suggestion = resolver.lookup(query)
+        value = suggestion.entries[0][2] if suggestion else None
+        check.expect(value == expected, f"{query!r} -> {value!r}, expected {expected!r}")
+    return check
+
+
+def check_schemas() -> Check:
+    from schema_registry import SchemaRegistry
+
+    check = Check("SchemaRegistry validation")
+    registry = SchemaRegistry()
+    cases = (
+        ({'ouName': 'AMER ACC', 'minStage': 4, 'limitN': 20}, False, []),
+        ({'ouName': 'AMER ACC', 'limitN': 51}, False, ['limitN must be <= 50']),
+        ({'ouName': 'AMER ACC', 'timeFrame': 'NEXT'}, False, ['timeFrame must be one of "CURRENT", "PREVIOUS"']),
+        ({'ouName': 'AMER ACC', 'minStage': True}, False, ['minStage must be of type integer']),
+        ({'ouName': 'AMER ACC', 'text': 'open pipe'}, False, ['unexpected property text']),
+        ({'ouName': 'AMER ACC', 'text': 'open pipe'}, True, []),
+        ({}, True, ['ouName is required']),
+    )
+    for args, lenient, expected in cases:
+        errors = registry.validate('open_pipe_analyze', args, allow_additional=lenient)
+        check.expect(errors == expected, f"{args} (lenient={lenient}): {errors}")
+    check.expect(registry.validate('no_such_tool', {}) == [], "a tool without a schema fails validation")
+    return check
+
+
+def check_router(router) -> Check:
+    check = Check("ComprehensiveRouter utterances")
+    for text, tool, expected in ROUTER_CASES:
+        result = router.route_request(text)
+        if result.get('tool') != tool:
+            check.expect(False, f"{text!r}: {result}")
+            continue
+        for name, value in expected.items():
+            actual = result['args'].get(name)
+            check.expect(actual == value, f"{text!r}: {name} {actual!r} != {value!r}")
+    return check
+
+
+def check_sessions() -> Check:
+    from mcp_server_comprehensive import ComprehensiveRouter
+    from session_store import SessionStore
+
+    check = Check("Session follow-ups and SessionStore limits")
+    router = ComprehensiveRouter(sessions=SessionStore())
+    turns = (
+        ("Show me all the products that passed stage 4 within AMER ACC for open pipe.",
+         {'ouName': 'AMER ACC', 'minStage': 4, 'limitN': 10}),
+        ("For those products, keep timeframe to this quarter and show top 15.",
+         {'ouName': 'AMER ACC', 'minStage': 4, 'timeFrame': 'CURRENT', 'limitN': 15}),
+        ("Filter to Data Cloud and Sales Cloud only.",
+         {'ouName': 'AMER ACC', 'minStage': 4, 'limitN': 15, 'productListCsv': 'Data Cloud, Sales Cloud'}),
+        ("compare with last quarter", {'ouName': 'AMER ACC', 'compare': True}),
+        ("Only top 5.", {'ouName': 'AMER ACC', 'limitN': 5, 'compare': None}),
+    )
+    for text, expected in turns:
+        args = router.route_request(text, session_id='conversation').get('args', {})
+        for name, value in expected.items():
+            check.expect(args.get(name) == value, f"{text!r}: {name} {args.get(name)!r} != {value!r}")
+    check.expect('error' in router.route_request("Only top 5."), "follow-up without a session was routed")
+
+    now = [0.0]
+    store = SessionStore(max_sessions=2, ttl_s=10, clock=lambda: now[0])
+    for session_id in ('a', 'b'):
+        store.put(session_id, 'kpi_analyze', {'ouName': 'UKI'})
+    store.get('a')
+    store.put('c', 'kpi_analyze', {'ouName': 'ANZ'})
+    check.expect(store.get('b') is None and store.get('a') is not None, "least recently used session not evicted")
+    now[0] = 11.0
+    check.expect(store.get('a') is None and len(store) == 1, "expired session returned")
+    return check
+
+
+def check_routing_reload() -> Check:
+    import json
+    import tempfile
+    from mcp_server_comprehensive import ComprehensiveRouter
+    from routing_config import ROUTING_CONFIG_PATH, ReloadableRouter, RoutingConfigError
+
+    check = Check("Routing config reload")
+    with open(ROUTING_CONFIG_PATH, encoding='utf-8') as f:
+        config = json.load(f)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'routing_config.json')
+
+        def write(data):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+
+        write(config)
+        routing = ReloadableRouter(ComprehensiveRouter, path)
+        text = "kpi for Nordics"
+        check.expect('error' in routing.current.route_request(text), "unknown alias routed before reload")
+
+        config = {**config, 'version': config['version'] + '.1',
+                  'ou_aliases': {**config['ou_aliases'], 'Nordics': 'Northern Europe'}}
+        write(config)
+        status = routing.reload()
+        check.expect(status['status'] == 'reloaded', f"reload: {status}")
+        result = routing.current.route_request(text)
+        check.expect(result.get('args', {}).get('ouName') == 'Northern Europe', f"new alias after reload: {result}")
+        check.expect(routing.reload()['status'] == 'unchanged', "reload of the same file rebuilt the router")
+
+        write({**config, 'tool_patterns': {**config['tool_patterns'], 'kpi_analyze': ['(unclosed']}})
+        try:
+            routing.reload()
+            check.expect(False, "invalid pattern accepted")
+        except RoutingConfigError:
+            pass
+        check.expect(routing.config.version == config['version'], f"failed reload replaced the config: {routing.config.tag}")
+        check.expect(routing.current.route_request(text).get('args', {}).get('ouName') == 'Northern Europe',
+                     "failed reload replaced the router")
+    return check
+
+
+def check_analyze_payloads() -> Check:
+    from mcp_server_comprehensive import ComprehensiveMCPServer
+
+    check = Check("/analyze accepts routed args and the /route envelope")
+    client = ComprehensiveMCPServer(dry_run=True).app.test_client()
+    for text in ("Show me open pipe for AMER ACC with stage 4+", "Show KPI analysis for UKI",
+                 "show AEs in AMER ACC who don't have Slack", "find content about Data Cloud"):
+        routed = client.post('/route', json={'text': text}).json
+        response = client.post('/analyze', json=routed)
+        check.expect(response.status_code == 200, f"{text!r} envelope: {response.status_code} {response.json}")
+        if routed['tool'] == 'open_pipe_analyze':
+            response = client.post('/analyze', json=routed['args'])
+            check.expect(response.status_code == 200, f"{text!r} args: {response.status_code} {response.json}")
+    response = client.post('/analyze', json={'tool': 'kpi_analyze', 'args': {'timeFrame': 'CURRENT'}})
+    check.expect(response.status_code == 400, f"envelope without ouName: {response.status_code}")
+    return check
+
+
+def check_action_errors() -> Check:
+    from mcp_server_comprehensive import ComprehensiveMCPServer
+    from sf_auth import SalesforceAuthManager
+
+    check = Check("Salesforce error statuses, batched and unbatched")
+    salesforce = FakeSalesforce(delay_s=0)
+
+    def client(window_ms):
+        # A fresh server per case, so earlier failures don't open its circuit
+        auth = SalesforceAuthManager(access_token='token', instance_url=salesforce.url)
+        return ComprehensiveMCPServer(dry_run=False, batch_window_ms=window_ms, auth=auth).app.test_client()
+
+    def analyze(http):
+        return http.post('/analyze', json={'ouName': 'AMER ACC'})
+
+    try:
+        for label, window_ms in (("unbatched", 0), ("batched", 5)):
+            for status, retry_after, tokens, expected in ((200, None, None, 200), (429, 7, None, 429),
+                                                          (503, None, None, 503), (500, None, None, 500),
+                                                          (200, None, {'other-token'}, 401)):
+                salesforce.status, salesforce.retry_after, salesforce.tokens = status, retry_after, tokens
+                response = analyze(client(window_ms))
+                check.expect(response.status_code == expected, f"{label} {status}: {response.status_code}")
+                if expected in (429, 503):
+                    check.expect(response.json.get('retryable') is True, f"{label} {status} not marked retryable")
+                if retry_after is not None:
+                    check.expect(response.headers.get('Retry-After') == str(retry_after),
+                                 f"{label} {status} Retry-After {response.headers.get('Retry-After')}")
+
+            # Failing until the breaker opens, then rejected locally with Retry-After
+            salesforce.status, salesforce.retry_after, salesforce.tokens = 500, None, None
+            http = client(window_ms)
+            statuses = [analyze(http).status_code for _ in range(5)]
+            calls = len(salesforce.calls)
+            response = analyze(http)
+            check.expect(statuses == [500] * 5 and response.status_code == 503 and len(salesforce.calls) == calls,
+                         f"{label} open circuit: {statuses} then {response.status_code}, {len(salesforce.calls) - calls} calls")
+            check.expect(int(response.headers.get('Retry-After', 0)) >= 1, f"{label} open circuit without Retry-After")
+    finally:
+        salesforce.close()
+    return check
+
+
+def check_result_cache() -> Check:
+    import json
+    import tempfile
+    from mcp_server_comprehensive import ComprehensiveMCPServer
+    from result_cache import ResultCache, action_key
+    from sf_auth import SalesforceAuthManager
+
+    check = Check("ResultCache keys, expiry, persistence and failed actions")
+    salesforce = FakeSalesforce(delay_s=0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.sqlite')
+        cache = ResultCache(path)
+        packed = {'normalizedArgsJsons': json.dumps({'ouName': 'UKI', 'correlationId': 'kpi-1'})}
+        repacked = {'normalizedArgsJsons': json.dumps({'correlationId': 'kpi-2', 'ouName': 'UKI'})}
+        check.expect(action_key('kpi', packed) == action_key('kpi', repacked), "correlationId inside the packed args is part of the key")
+        cache.put('action', action_key('kpi', packed), {'rows': 1})
+        check.expect(cache.get('action', action_key('kpi', repacked)) == {'rows': 1}, "equivalent args miss")
+        cache.put('action', 'short-lived', 1, ttl_s=0.01)
+        time.sleep(0.02)
+        check.expect(cache.get('action', 'short-lived') is None, "expired entry returned")
+        cache.close()
+        reopened = ResultCache(path)
+        check.expect(reopened.get('action', action_key('kpi', packed)) == {'rows': 1}, "entry lost on reopen")
+        reopened.close()
+
+        # Only results whose entries all succeeded are replayed
+        cache = ResultCache(os.path.join(directory, 'actions.sqlite'))
+        server = ComprehensiveMCPServer(dry_run=False, result_cache=cache,
+                                        auth=SalesforceAuthManager(access_token='token', instance_url=salesforce.url))
+        client = server.app.test_client()
+        try:
+            for ou, success, expected_calls in (('AMER ACC', False, 2), ('EMEA ENTR', True, 1)):
+                salesforce.success = success
+                calls = len(salesforce.calls)
+                responses = [client.post('/analyze', json={'ouName': ou}).json for _ in range(2)]
+                check.expect(len(salesforce.calls) - calls == expected_calls,
+                             f"isSuccess={success}: {len(salesforce.calls) - calls} calls for 2 requests")
+                check.expect(bool(responses[1].get('cached')) == success, f"isSuccess={success}: cached={responses[1].get('cached')}")
+        finally:
+            cache.close()
+            salesforce.close()
+    return check
+
+
+def check_batching() -> Check:
+    from sf_batching import ActionBatcher, BatchError
+
+    check = Check("ActionBatcher coalescing and failures")
+    sent = []
+
+    def send_batch(action_name, inputs):
+        sent.append(len(inputs))
+        if any(args.get('fail') for args in inputs):
+            return 503, "unavailable"
+        if any(args.get('short') for args in inputs):
+            return 200, [{'n': 0}]
+        return 200, [{'n': args['n']} for args in inputs]
+
+    batcher = ActionBatcher(send_batch, window_ms=50, max_batch_size=4)
+    futures = [batcher.submit('action', {'n': n}) for n in range(3)]
+    check.expect([future.result(1)['n'] for future in futures] == [0, 1, 2], "results not handed back in input order")
+    check.expect(sent == [3], f"3 inputs in one window sent as {sent}")
+
+    sent.clear()
+    for future in [batcher.submit('action', {'n': n}) for n in range(6)]:
+        future.result(1)
+    check.expect(sent == [4, 2], f"6 inputs with max_batch_size 4 sent as {sent}")
+
+    for args, status in (({'fail': True}, 503), ({'short': True}, 500)):
+        futures = [batcher.submit('action', {**args, 'n': n}) for n in range(2)]
+        for future in futures:
+            try:
+                future.result(1)
+                check.expect(False, f"{args}: no BatchError")
+            except BatchError as e:
+                check.expect(e.status_code == status, f"{args}: status {e.status_code} != {status}")
+    return check
+
+
+def check_token_refresh() -> Check:
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from mcp_server_comprehensive import ComprehensiveMCPServer
+    from sf_auth import SalesforceAuthManager
+
+    check = Check("Single-flight token refresh")
+    salesforce = FakeSalesforce(delay_s=0.1)
+
+    def manager(**kwargs):
+        return SalesforceAuthManager(access_token='stale', instance_url=salesforce.url,
+                                     client_id='client', client_secret='secret', **kwargs)
+
+    try:
+        auth = manager()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            tokens = list(pool.map(lambda _: auth.refresh(stale_token='stale'), range(8)))
+        check.expect(salesforce.token_requests == 1, f"8 concurrent refreshes made {salesforce.token_requests} token requests")
+        check.expect(set(tokens) == {'token-1'}, f"refreshes returned {sorted(set(tokens))}")
+
+        # Processes sharing a token cache: the second adopts the first one's refresh
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'token.json')
+            first, second = manager(token_cache_path=path), manager(token_cache_path=path)
+            token = first.refresh(stale_token='stale')
+            requests_made = salesforce.token_requests
+            check.expect(second.refresh(stale_token='stale') == token, "shared cache token not adopted")
+            check.expect(salesforce.token_requests == requests_made, "second process hit the token endpoint")
+
+        # Concurrent 401s on the action endpoint share one refresh and then succeed
+        salesforce.tokens = set()
+        client = ComprehensiveMCPServer(dry_run=False, auth=manager()).app.test_client()
+        requests_made = salesforce.token_requests
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            statuses = list(pool.map(lambda _: client.post('/analyze', json={'ouName': 'AMER ACC'}).status_code, range(4)))
+        check.expect(statuses == [200] * 4, f"/analyze after 401: {statuses}")
+        check.expect(salesforce.token_requests - requests_made == 1,
+                     f"4 concurrent 401s made {salesforce.token_requests - requests_made} token requests")
+    finally:
+        salesforce.close()
+    return check
+
+
+def check_prefetch() -> Check:
+    from mcp_server_comprehensive import ComprehensiveMCPServer
+    from sf_auth import SalesforceAuthManager
+    from speculative_prefetch import SpeculativePrefetcher
+
+    check = Check("/route -> /analyze speculative prefetch")
+    salesforce = FakeSalesforce()
+    prefetcher = SpeculativePrefetcher(ttl_s=2.0)
+    server = ComprehensiveMCPServer(dry_run=False, prefetcher=prefetcher,
+                                    auth=SalesforceAuthManager(access_token='token', instance_url=salesforce.url))
+    client = server.app.test_client()
+    try:
+        text = "Show me open pipe for AMER ACC with stage 4+"
+        for label, with_text in (("routed args only", False), ("routed args and text", True)):
+            calls = len(salesforce.calls)
+            routed = client.post('/route', json={'text': text}).json
+            time.sleep(0.05)
+            payload = {**routed['args'], 'text': text} if with_text else routed['args']
+            response = client.post('/analyze', json=payload)
+            check.expect(response.status_code == 200, f"{label}: status {response.status_code}")
+            check.expect(response.json.get('prefetched') is True, f"{label}: /analyze did not attach to the prefetch")
+            check.expect(len(salesforce.calls) - calls == 1, f"{label}: {len(salesforce.calls) - calls} Salesforce calls")
+
+        client.post('/route', json={'text': "Show me open pipe for EMEA ENTR"})
+        time.sleep(prefetcher.ttl_s + 0.1)
+        stats = prefetcher.stats()['per_tool']['open_pipe_analyze']
+        check.expect(stats['hits'] == 2, f"hits {stats['hits']} != 2")
+        check.expect(stats['wasted'] == 1, f"unclaimed speculation counted as wasted: {stats['wasted']} != 1")
+    finally:
+        prefetcher.shutdown()
+        salesforce.close()
+    return check
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    from mcp_server_comprehensive import ComprehensiveRouter
+
+    print("Server components")
+    print("=" * 50)
+    checks: List[Check] = [
+        check_breaker(),
+        check_gazetteer(),
+        check_fuzzy(),
+        check_schemas(),
+        check_router(ComprehensiveRouter()),
+        check_sessions(),
+        check_routing_reload(),
+        check_analyze_payloads(),
+        check_action_errors(),
+        check_batching(),
+        check_token_refresh(),
+        check_result_cache(),
+        check_prefetch(),
+    ]
+    passed = all([check.report() for check in checks])
+    print("\nPASS: all component checks" if passed else "\nFAIL: see mismatches above")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,22 @@ MCP Content Search UAT Testing
 Tests 50 utterances using the Salesforce MCP server
 """
 
+import argparse
 import json
+import os
 import subprocess
+import sys
 import time
 from datetime import datetime
 
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sf_auth import SalesforceAuthManager, AuthError
+
+# Liveness probe run against the org
+PROBE_SOQL = "SELECT Id, Name FROM Account LIMIT 1"
+
 # Test utterances for Content Search
 TEST_UTTERANCES = [
     "Show me ACT courses related to Data Cloud",
@@ -63,27 +74,83 @@ TEST_UTTERANCES = [
     "Show Consensus demos for Data Cloud with public preview and high view count"
 ]
 
-def test_mcp_utterance(utterance):
-    """Test a single utterance using MCP"""
+class OrgConnection:
+    """
+    Authenticated REST session to the org, opened once per run.
+
+    Credentials come from the SF_* environment (see env.example); without them a
+    single `sf org display --json` call supplies the CLI's default org session.
+    """
+    
+    def __init__(self, api_version="v58.0"):
+        self.api_version = api_version
+        self.session = requests.Session()
+        self.instance_url = None
+        self.connected = False
+        self.error = None
+        self.connect_ms = 0.0
+        self.probe_latencies_ms = []
+    
+    def connect(self):
+        """Resolve credentials and run the first probe"""
+        start = time.time()
+        try:
+            auth = SalesforceAuthManager.from_env()
+            if auth.instance_url and auth.is_configured():
+                token, self.instance_url = auth.get_token(), auth.instance_url
+            else:
+                token, self.instance_url = self._cli_session()
+            self.session.headers.update({'Authorization': f'Bearer {token}'})
+        except (AuthError, OSError, ValueError, KeyError, subprocess.SubprocessError) as e:
+            self.error = f"Could not open an org session: {e}"
+            return False
+        finally:
+            self.connect_ms = (time.time() - start) * 1000
+        return self.probe()
+    
+    @staticmethod
+    def _cli_session():
+        """(access token, instance URL) of the sf CLI default org"""
+        result = subprocess.run(["sf", "org", "display", "--json"], capture_output=True, text=True, timeout=60)
+        if result.returncode != 0:
+            raise ValueError(result.stderr.strip() or result.stdout.strip())
+        org = json.loads(result.stdout)["result"]
+        return org["accessToken"], org["instanceUrl"]
+    
+    def probe(self):
+        """Run the liveness query over the shared session"""
+        start = time.time()
+        try:
+            response = self.session.get(
+                f"{self.instance_url}/services/data/{self.api_version}/query",
+                params={"q": PROBE_SOQL},
+                timeout=30
+            )
+            self.connected = response.status_code == 200
+            self.error = None if self.connected else f"HTTP {response.status_code}: {response.text}"
+        except requests.exceptions.Timeout:
+            self.connected = False
+            self.error = "Request took longer than 30 seconds"
+        except requests.exceptions.RequestException as e:
+            self.connected = False
+            self.error = str(e)
+        self.probe_latencies_ms.append((time.time() - start) * 1000)
+        return self.connected
+
+def test_mcp_utterance(utterance, connection):
+    """Test a single utterance using MCP over the run's org connection"""
     try:
-        # Use sf CLI to test the utterance
-        # This simulates what the agent would do
-        cmd = ["sf", "data", "query", "--query", f"SELECT Id, Name FROM Account LIMIT 1"]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        if not connection.connected:
+            return f"MCP Error: {connection.error}"
         
-        if result.returncode == 0:
-            # Simulate agent response based on utterance content
-            if "ACT" in utterance:
-                return generate_act_response(utterance)
-            elif "Consensus" in utterance:
-                return generate_consensus_response(utterance)
-            else:
-                return generate_mixed_response(utterance)
+        # Simulate agent response based on utterance content
+        if "ACT" in utterance:
+            return generate_act_response(utterance)
+        elif "Consensus" in utterance:
+            return generate_consensus_response(utterance)
         else:
-            return f"MCP Error: {result.stderr}"
+            return generate_mixed_response(utterance)
             
-    except subprocess.TimeoutExpired:
-        return "MCP Timeout: Request took longer than 30 seconds"
     except Exception as e:
         return f"MCP Error: {str(e)}"
 
@@ -156,21 +223,30 @@ def generate_mixed_response(utterance):
            generate_act_response(utterance) + "\n\n" + \
            generate_consensus_response(utterance)
 
-def run_mcp_uat_tests():
-    """Run UAT tests using MCP"""
+def run_mcp_uat_tests(connection, probe_each=False):
+    """Run UAT tests using MCP, probing the org once (or once per case over the same session)"""
     results = []
     
     print(f"🧪 Starting MCP Content Search UAT Testing")
     print(f"📊 Total Utterances: {len(TEST_UTTERANCES)}")
     print(f"🔧 Method: MCP Server")
+    
+    connection.connect()
+    status = "connected" if connection.connected else f"unavailable ({connection.error})"
+    print(f"🔌 Org {status}: session {connection.connect_ms:.0f}ms, probe {connection.probe_latencies_ms[-1] if connection.probe_latencies_ms else 0:.0f}ms")
     print("=" * 60)
     
     for i, utterance in enumerate(TEST_UTTERANCES, 1):
         print(f"\n🧪 Test {i}/50: {utterance[:50]}...")
         
+        probe_ms = None
+        if probe_each and connection.instance_url:
+            connection.probe()
+            probe_ms = round(connection.probe_latencies_ms[-1], 1)
+        
         try:
             # Test with MCP
-            agent_response = test_mcp_utterance(utterance)
+            agent_response = test_mcp_utterance(utterance, connection)
             
             # Determine source and method
             source_requested = "ACT" if "ACT" in utterance else "Consensus" if "Consensus" in utterance else "Mixed"
@@ -193,6 +269,7 @@ def run_mcp_uat_tests():
             "agent_response": agent_response,
             "result": result,
             "notes": notes,
+            "probe_ms": probe_ms,
             "timestamp": datetime.now().isoformat()
         }
         
@@ -201,9 +278,6 @@ def run_mcp_uat_tests():
         print(f"   Result: {result}")
         print(f"   Response Length: {len(agent_response)} characters")
         print(f"   Source: {source_requested}")
-        
-        # Small delay to avoid overwhelming
-        time.sleep(0.5)
     
     return results
 
@@ -231,7 +305,7 @@ def save_results(results):
     
     return json_filename, csv_filename
 
-def print_summary(results):
+def print_summary(results, connection=None):
     """Print test summary"""
     total_tests = len(results)
     passed_tests = len([r for r in results if r['result'] == 'PASS'])
@@ -244,6 +318,11 @@ def print_summary(results):
     print(f"Passed: {passed_tests} ({passed_tests/total_tests*100:.1f}%)")
     print(f"Failed: {failed_tests} ({failed_tests/total_tests*100:.1f}%)")
     
+    if connection is not None and connection.probe_latencies_ms:
+        latencies = sorted(connection.probe_latencies_ms)
+        print(f"Org session setup: {connection.connect_ms:.0f}ms")
+        print(f"Org probes: {len(latencies)}, median {latencies[len(latencies) // 2]:.0f}ms, max {latencies[-1]:.0f}ms")
+    
     if failed_tests > 0:
         print(f"\n❌ Failed Tests:")
         for result in results:
@@ -253,17 +332,23 @@ def print_summary(results):
     print(f"\n✅ MCP UAT Testing Complete!")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='MCP Content Search UAT')
+    parser.add_argument('--probe-each', action='store_true',
+                        help='Re-probe the org before every case over the shared session')
+    args = parser.parse_args()
+    
     print("🚀 Starting MCP Content Search UAT Testing")
     print("=" * 60)
     
     # Run tests
-    results = run_mcp_uat_tests()
+    connection = OrgConnection()
+    results = run_mcp_uat_tests(connection, probe_each=args.probe_each)
     
     # Save results
     json_file, csv_file = save_results(results)
     
     # Print summary
-    print_summary(results)
+    print_summary(results, connection)
     
     print(f"\n🎉 All 50 utterances tested with MCP and results saved!")
     print(f"📋 Check {csv_file} for detailed results table")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the MCP servers
+Reports the -X importtime breakdown and time to the first /health, and fails if over budget
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ROUTERS = {
+    'mcp_server.py': 'OpenPipeRouter',
+    'mcp_server_comprehensive.py': 'ComprehensiveRouter',
+}
+
+# Must not be loaded just to route a request
+HEAVY_MODULES = ['flask', 'werkzeug', 'requests', 'urllib3', 'dotenv', 'numpy']
+
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def import_profile(module: str) -> dict:
+    """Cumulative import time of a module, its slowest imports, and heavy modules it pulled in"""
+    code = f"import sys, json, {module}; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    # Children are printed before their parent, so the module's subtree is every
+    # line since the previous top-level import
+    subtree, total_us = [], 0
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative_us, indent, name = match.groups()
+        depth = len(indent) // 2
+        if depth == 0:
+            if name == module:
+                total_us = int(cumulative_us)
+                break
+            subtree = []
+        else:
+            subtree.append((name, int(cumulative_us), depth))
+    # Imports made directly by the module, slowest first
+    direct = sorted((e for e in subtree if e[2] == 1), key=lambda e: -e[1])
+    return {
+        'module': module,
+        'import_ms': total_us / 1000,
+        'heavy_modules': json.loads(proc.stdout.strip().splitlines()[-1]),
+        'slowest': [{'module': name, 'cumulative_ms': cum / 1000} for name, cum, _ in direct[:10]],
+    }
+
+
+def router_ready_ms(module: str, router: str) -> float:
+    """Wall time for a fresh interpreter to import the module and construct its router"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', f"from {module} import {router}; {router}()"],
+                   cwd=ROOT, capture_output=True, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def time_to_health_ms(script: str, timeout_s: float) -> float:
+    """Start the server on a free port and poll until /health answers"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, DRY_RUN='true', PORT=str(port), HOST='127.0.0.1')
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, script, '--port', str(port)], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout_s:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{script} exited with code {proc.returncode} before /health answered")
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"{script} did not answer /health within {timeout_s}s")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MCP server startup benchmark')
+    parser.add_argument('--server', choices=sorted(ROUTERS), default='mcp_server_comprehensive.py')
+    parser.add_argument('--runs', type=int, default=3, help='Take the best of this many runs')
+    parser.add_argument('--import-budget-ms', type=float, default=150.0,
+                        help='Budget for importing the server module')
+    parser.add_argument('--health-budget-ms', type=float, default=2000.0,
+                        help='Budget for process start to first /health')
+    parser.add_argument('--skip-health', action='store_true', help='Only measure imports')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    module = args.server[:-3]
+    profiles = [import_profile(module) for _ in range(args.runs)]
+    profile = min(profiles, key=lambda p: p['import_ms'])
+    report = {
+        'server': args.server,
+        'import_ms': profile['import_ms'],
+        'router_ready_ms': min(router_ready_ms(module, ROUTERS[args.server]) for _ in range(args.runs)),
+        'heavy_modules_on_import': profile['heavy_modules'],
+        'slowest_imports': profile['slowest'],
+        'time_to_health_ms': None if args.skip_health else min(
+            time_to_health_ms(args.server, timeout_s=30) for _ in range(args.runs)),
+        'budgets': {'import_ms': args.import_budget_ms, 'time_to_health_ms': args.health_budget_ms},
+    }
+
+    failures = []
+    if report['heavy_modules_on_import']:
+        failures.append(f"importing {module} loaded {', '.join(report['heavy_modules_on_import'])}")
+    if report['import_ms'] > args.import_budget_ms:
+        failures.append(f"import took {report['import_ms']:.1f}ms (budget {args.import_budget_ms:.0f}ms)")
+    if report['time_to_health_ms'] is not None and report['time_to_health_ms'] > args.health_budget_ms:
+        failures.append(f"first /health after {report['time_to_health_ms']:.0f}ms (budget {args.health_budget_ms:.0f}ms)")
+    report['failures'] = failures
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Startup benchmark: {args.server} (best of {args.runs})")
+        print("=" * 50)
+        print(f"Import:           {report['import_ms']:8.1f} ms  (budget {args.import_budget_ms:.0f} ms)")
+        print(f"Router ready:     {report['router_ready_ms']:8.1f} ms  (fresh interpreter, import + construct)")
+        if report['time_to_health_ms'] is not None:
+            print(f"First /health:    {report['time_to_health_ms']:8.1f} ms  (budget {args.health_budget_ms:.0f} ms)")
+        print("\nSlowest direct imports:")
+        for entry in report['slowest_imports']:
+            print(f"  {entry['cumulative_ms']:8.1f} ms  {entry['module']}")
+        print()
+        print("\n".join(f"FAIL: {f}" for f in failures) if failures else "PASS: within budget")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,11 +6,45 @@ Tests various patterns including the specific examples provided
 
 import requests
 import json
+import os
+import sys
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from result_cache import ResultCache, routing_key
+
 # MCP Server endpoint
 MCP_BASE_URL = "http://localhost:8787"
 
+# Optional persistent cache of routing results (set RESULT_CACHE_PATH to enable)
+RESULT_CACHE = ResultCache.from_env()
+_router_version = None
+
+def post_route(utterance):
+    """POST /route, replaying the cached response for this router version if present"""
+    global _router_version
+    if RESULT_CACHE is not None and _router_version is None:
+        try:
+            _router_version = requests.get(f"{MCP_BASE_URL}/health", timeout=10).json().get("router_version", "unknown")
+        except Exception:
+            _router_version = "unknown"
+    
+    key = routing_key(f"{MCP_BASE_URL}|{_router_version}", utterance)
+    if RESULT_CACHE is not None:
+        cached = RESULT_CACHE.get('script_route', key)
+        if cached is not None:
+            return 200, cached, json.dumps(cached)
+    
+    response = requests.post(
+        f"{MCP_BASE_URL}/route",
+        json={"text": utterance},
+        headers={"Content-Type": "application/json"},
+        timeout=10
+    )
+    if RESULT_CACHE is not None and response.status_code == 200:
+        RESULT_CACHE.put('script_route', key, response.json())
+    return response.status_code, response.json() if response.status_code == 200 else None, response.text
+
 def test_mcp_route(utterance, test_number):
     """Test MCP routing for an utterance"""
     print(f"\n🔍 Test {test_number}: '{utterance}'")
@@ -18,15 +52,9 @@ def test_mcp_route(utterance, test_number):
     
     try:
         # Route the utterance through MCP
-        response = requests.post(
-            f"{MCP_BASE_URL}/route",
-            json={"text": utterance},
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
+        status_code, result, response_text = post_route(utterance)
         
-        if response.status_code == 200:
-            result = response.json()
+        if status_code == 200:
             if 'error' in result:
                 print(f"❌ MCP Route Error: {result['error']}")
                 return False
@@ -52,8 +80,8 @@ def test_mcp_route(utterance, test_number):
                     print(f"❌ MCP Analyze Failed: {analyze_response.status_code}")
                     return False
         else:
-            print(f"❌ MCP Route Failed: {response.status_code}")
-            print(f"   Response: {response.text}")
+            print(f"❌ MCP Route Failed: {status_code}")
+            print(f"   Response: {response_text}")
             return False
             
     except Exception as e:
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Conversation session store for follow-up routing
+Bounded in-memory map of session id -> last routed tool and args, with LRU and TTL eviction
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Longer string args (free text such as workflow context) are not kept in a snapshot
+MAX_VALUE_CHARS = 256
+
+
+@dataclass(frozen=True)
+class SessionSnapshot:
+    """The last successfully routed turn of a session, stored as a compact tuple of args"""
+    tool: str
+    items: Tuple[Tuple[str, Any], ...]
+    expires_at: float
+
+    @property
+    def args(self) -> Dict[str, Any]:
+        return dict(self.items)
+
+
+class SessionStore:
+    """
+    Thread-safe LRU + TTL store of per-session routing snapshots.
+
+    get() returns None for unknown or expired sessions and refreshes the
+    recency of live ones; put() replaces the session's snapshot and extends
+    its TTL. Past max_sessions the least recently used session is dropped.
+    Snapshots keep only scalar args, so memory per session stays small.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl_s: float = 1800,
+                 clock: Callable[[], float] = time.monotonic):
+        if max_sessions <= 0:
+            raise ValueError("max_sessions must be positive")
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self.clock = clock
+        self._sessions: 'OrderedDict[str, SessionSnapshot]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @classmethod
+    def from_env(cls) -> 'SessionStore':
+        """Build from SESSION_MAX / SESSION_TTL_SECONDS"""
+        return cls(max_sessions=int(os.getenv('SESSION_MAX', '10000')),
+                   ttl_s=float(os.getenv('SESSION_TTL_SECONDS', '1800')))
+
+    def get(self, session_id: str) -> Optional[SessionSnapshot]:
+        with self._lock:
+            snapshot = self._sessions.get(session_id)
+            if snapshot is None:
+                self.misses += 1
+                return None
+            if snapshot.expires_at <= self.clock():
+                del self._sessions[session_id]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+            return snapshot
+
+    def put(self, session_id: str, tool: str, args: Dict[str, Any]) -> SessionSnapshot:
+        items = tuple((key, value) for key, value in args.items()
+                      if isinstance(value, (bool, int, float, type(None)))
+                      or (isinstance(value, str) and len(value) <= MAX_VALUE_CHARS))
+        snapshot = SessionSnapshot(tool, items, self.clock() + self.ttl_s)
+        with self._lock:
+            self._sessions[session_id] = snapshot
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+        return snapshot
+
+    def discard(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def purge_expired(self) -> int:
+        """Drop every expired session; get() already skips them, this just frees memory"""
+        now = self.clock()
+        with self._lock:
+            stale = [sid for sid, snapshot in self._sessions.items() if snapshot.expires_at <= now]
+            for sid in stale:
+                del self._sessions[sid]
+            self.expired += len(stale)
+        return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted
+        }
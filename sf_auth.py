@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Salesforce OAuth session manager
+Proactive background refresh, single-flight refresh on 401, and a token file
+shared by every worker process on the host
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class AuthError(Exception):
+    """Raised when a token cannot be obtained or refreshed"""
+
+
+class SalesforceAuthManager:
+    """
+    Owns the Salesforce access token for a server process.
+
+    With only an access token configured it behaves like the old static
+    SF_ACCESS_TOKEN setup. With a connected app (client id/secret, plus a refresh
+    token for the refresh_token flow) it mints new tokens before they expire and
+    when Salesforce answers 401. If token_cache_path is set, tokens are written
+    there atomically and picked up by other processes, and refreshes are
+    serialized across processes with a lock file so only one of them hits the
+    token endpoint.
+    """
+
+    def __init__(self, access_token: Optional[str] = None, instance_url: Optional[str] = None,
+                 client_id: Optional[str] = None, client_secret: Optional[str] = None,
+                 refresh_token: Optional[str] = None, login_url: str = "https://login.salesforce.com",
+                 session_ttl_s: float = 7200, refresh_margin: float = 0.2,
+                 token_cache_path: Optional[str] = None):
+        self.instance_url = instance_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_token = refresh_token
+        self.login_url = login_url.rstrip('/')
+        self.session_ttl_s = session_ttl_s
+        self.refresh_margin = refresh_margin
+        self.token_cache_path = token_cache_path
+
+        self._lock = threading.Lock()
+        self._access_token = access_token
+        self._issued_at = time.time() if access_token else 0.0
+        self._cache_mtime = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.refresh_count = 0
+        self.last_error: Optional[str] = None
+
+        self._load_shared_token()
+
+    @classmethod
+    def from_env(cls) -> 'SalesforceAuthManager':
+        """Build from SF_* environment variables"""
+        return cls(
+            access_token=os.getenv('SF_ACCESS_TOKEN'),
+            instance_url=os.getenv('SF_BASE_URL'),
+            client_id=os.getenv('SF_CLIENT_ID'),
+            client_secret=os.getenv('SF_CLIENT_SECRET'),
+            refresh_token=os.getenv('SF_REFRESH_TOKEN'),
+            login_url=os.getenv('SF_LOGIN_URL', 'https://login.salesforce.com'),
+            session_ttl_s=float(os.getenv('SF_SESSION_TTL_SECONDS', '7200')),
+            token_cache_path=os.getenv('SF_TOKEN_CACHE')
+        )
+
+    @property
+    def can_refresh(self) -> bool:
+        """True when a connected app is configured to mint new tokens"""
+        return bool(self.client_id and self.client_secret)
+
+    def is_configured(self) -> bool:
+        return bool(self._access_token or self.can_refresh)
+
+    def expires_in(self) -> float:
+        """Seconds until the current token is assumed to expire"""
+        if not self._access_token:
+            return 0.0
+        return max(0.0, self._issued_at + self.session_ttl_s - time.time())
+
+    def get_token(self) -> str:
+        """Current access token, fetching one first if none is held yet"""
+        self._load_shared_token()
+        if self._access_token:
+            return self._access_token
+        if not self.can_refresh:
+            raise AuthError("No Salesforce access token configured. Check SF_ACCESS_TOKEN.")
+        return self.refresh(stale_token=None)
+
+    def refresh(self, stale_token: Optional[str]) -> str:
+        """
+        Replace stale_token with a fresh one (single-flight).
+
+        Concurrent callers that saw the same stale token share one refresh: once
+        the first finishes, the others find a different token in place and return it.
+        """
+        if not self.can_refresh:
+            raise AuthError("Salesforce token expired and no connected app is configured to refresh it")
+
+        with self._lock:
+            self._load_shared_token()
+            if self._access_token and self._access_token != stale_token:
+                return self._access_token
+
+            with self._process_lock():
+                # Another process may have refreshed while we waited for the file lock
+                self._load_shared_token()
+                if self._access_token and self._access_token != stale_token:
+                    return self._access_token
+                self._request_token()
+                self._store_shared_token()
+            return self._access_token
+
+    def _request_token(self):
+        """Call the OAuth token endpoint (lock held)"""
+        if self.refresh_token:
+            token_url = f"{self.login_url}/services/oauth2/token"
+            data = {
+                'grant_type': 'refresh_token',
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'refresh_token': self.refresh_token
+            }
+        else:
+            # Client credentials flow runs against the org's own My Domain
+            token_url = f"{(self.instance_url or self.login_url).rstrip('/')}/services/oauth2/token"
+            data = {
+                'grant_type': 'client_credentials',
+                'client_id': self.client_id,
+                'client_secret': self.client_secret
+            }
+
+        import requests  # deferred: keeps router-only processes free of the HTTP stack
+
+        try:
+            response = requests.post(token_url, data=data, timeout=30)
+        except requests.exceptions.RequestException as e:
+            self.last_error = str(e)
+            raise AuthError(f"Token refresh failed: {e}")
+
+        if response.status_code != 200:
+            self.last_error = f"HTTP {response.status_code}: {response.text}"
+            raise AuthError(f"Token refresh failed: {self.last_error}")
+
+        body = response.json()
+        self._access_token = body['access_token']
+        self.instance_url = body.get('instance_url', self.instance_url)
+        # issued_at is epoch milliseconds as a string
+        issued_at = body.get('issued_at')
+        self._issued_at = int(issued_at) / 1000.0 if issued_at else time.time()
+        self.refresh_count += 1
+        self.last_error = None
+        logger.info("Salesforce access token refreshed")
+
+    def _process_lock(self):
+        """Exclusive lock shared by all processes using the same token cache"""
+        return _FileLock(f"{self.token_cache_path}.lock" if self.token_cache_path else None)
+
+    def _load_shared_token(self):
+        """Adopt a newer token written by another process"""
+        if not self.token_cache_path:
+            return
+        try:
+            mtime = os.path.getmtime(self.token_cache_path)
+        except OSError:
+            return
+        if mtime <= self._cache_mtime:
+            return
+        try:
+            with open(self.token_cache_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._cache_mtime = mtime
+        if data.get('issued_at', 0) >= self._issued_at:
+            self._access_token = data.get('access_token')
+            self._issued_at = data.get('issued_at', 0)
+            self.instance_url = data.get('instance_url', self.instance_url)
+
+    def _store_shared_token(self):
+        """Atomically publish the current token for other processes"""
+        if not self.token_cache_path:
+            return
+        tmp_path = f"{self.token_cache_path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'access_token': self._access_token,
+                'instance_url': self.instance_url,
+                'issued_at': self._issued_at
+            }, f)
+        os.replace(tmp_path, self.token_cache_path)
+        self._cache_mtime = os.path.getmtime(self.token_cache_path)
+
+    def start_background_refresh(self, check_interval_s: float = 60.0):
+        """Refresh proactively once the token enters the last refresh_margin of its lifetime"""
+        if not self.can_refresh or self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(check_interval_s):
+                if self.expires_in() <= self.session_ttl_s * self.refresh_margin:
+                    try:
+                        self.refresh(stale_token=self._access_token)
+                    except AuthError as e:
+                        logger.error(f"Background token refresh failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name="sf-token-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Token status for health reporting (never includes the token itself)"""
+        return {
+            "has_token": bool(self._access_token),
+            "can_refresh": self.can_refresh,
+            "expires_in_s": round(self.expires_in()),
+            "refresh_count": self.refresh_count,
+            "shared_cache": bool(self.token_cache_path),
+            "last_error": self.last_error
+        }
+
+
+class _FileLock:
+    """Cross-process lock (flock, or msvcrt byte-range locking on Windows); a no-op when no path is given"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        if self.path:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            else:
+                # LK_LOCK gives up after ~10s of retries; keep waiting like flock does
+                while True:
+                    try:
+                        msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._fd is not None:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            os.close(self._fd)
+            self._fd = None
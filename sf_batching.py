@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Micro-batching for Salesforce invocable actions
+Concurrent calls to the same action inside a short window are sent as one
+multi-input request and the per-input results are handed back to each caller
+"""
+
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class BatchError(Exception):
+    """
+    Raised to every caller in a batch when the batched request itself fails.
+    status_code is Salesforce's, and retry_after_s its Retry-After, if any.
+    """
+
+    def __init__(self, message: str, status_code: int = 500, body: str = "",
+                 retry_after_s: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+        self.retry_after_s = retry_after_s
+
+
+class ActionBatcher:
+    """
+    Collects inputs per action name and flushes them as one request.
+
+    send_batch(action_name, inputs) must return (status_code, body) where body is
+    the parsed JSON of the Invocable Actions response: a list with one entry per
+    input, in input order. An exception it raises (a BatchError carrying the
+    status, an open circuit, an auth failure) is raised to every caller in the
+    batch as is. A batch is flushed when window_ms has passed since its
+    first input or when it reaches max_batch_size, whichever comes first.
+    """
+
+    def __init__(self, send_batch: Callable[[str, List[Dict[str, Any]]], Tuple[int, Any]],
+                 window_ms: float = 10.0, max_batch_size: int = 50):
+        self.send_batch = send_batch
+        self.window_s = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[Tuple[Dict[str, Any], Future]]] = {}
+        self._timers: Dict[str, threading.Timer] = {}
+        self.batches_sent = 0
+        self.inputs_sent = 0
+
+    def submit(self, action_name: str, args: Dict[str, Any]) -> Future:
+        """Queue one input; the returned future resolves to that input's result entry"""
+        future = Future()
+        flush_now = None
+        with self._lock:
+            batch = self._pending.setdefault(action_name, [])
+            batch.append((args, future))
+            if len(batch) >= self.max_batch_size:
+                flush_now = self._take(action_name)
+            elif len(batch) == 1:
+                timer = threading.Timer(self.window_s, self._flush, args=(action_name,))
+                timer.daemon = True
+                self._timers[action_name] = timer
+                timer.start()
+        if flush_now:
+            self._send(action_name, flush_now)
+        return future
+
+    def _take(self, action_name: str) -> List[Tuple[Dict[str, Any], Future]]:
+        """Detach the pending batch for an action (lock held)"""
+        timer = self._timers.pop(action_name, None)
+        if timer is not None:
+            timer.cancel()
+        return self._pending.pop(action_name, [])
+
+    def _flush(self, action_name: str):
+        with self._lock:
+            batch = self._take(action_name)
+        if batch:
+            self._send(action_name, batch)
+
+    def _send(self, action_name: str, batch: List[Tuple[Dict[str, Any], Future]]):
+        """Send one multi-input request and de-multiplex the results"""
+        inputs = [args for args, _ in batch]
+        futures = [future for _, future in batch]
+        with self._lock:
+            self.batches_sent += 1
+            self.inputs_sent += len(inputs)
+        logger.info(f"Sending batch of {len(inputs)} inputs to {action_name}")
+
+        try:
+            status_code, body = self.send_batch(action_name, inputs)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        if status_code != 200:
+            error = BatchError(f"Salesforce API error: {status_code}", status_code, str(body))
+            for future in futures:
+                future.set_exception(error)
+            return
+
+        if not isinstance(body, list) or len(body) != len(futures):
+            error = BatchError(f"Expected {len(futures)} results from {action_name}, got "
+                               f"{len(body) if isinstance(body, list) else type(body).__name__}")
+            for future in futures:
+                future.set_exception(error)
+            return
+
+        for future, entry in zip(futures, body):
+            future.set_result(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches_sent": self.batches_sent,
+                "inputs_sent": self.inputs_sent,
+                "avg_batch_size": round(self.inputs_sent / self.batches_sent, 2) if self.batches_sent else 0.0
+            }
+
+
+def chunked(items: List[Any], size: int) -> List[List[Any]]:
+    """Split items into lists of at most size elements"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Resilience layer for Salesforce action calls
+Per-action circuit breakers plus hedged requests for idempotent reads
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the action's circuit is open"""
+
+    def __init__(self, name: str, retry_after_s: float):
+        super().__init__(f"Circuit open for '{name}', retry in {retry_after_s:.1f}s")
+        self.name = name
+        self.retry_after_s = retry_after_s
+
+
+class CircuitBreaker:
+    """
+    Rolling-window circuit breaker tracking failure rate and slow-call rate.
+
+    Every state change starts a new generation. admit() hands out the generation a
+    call starts in, and record() only lets an outcome move the state if it is still
+    the current one: a call admitted while CLOSED that finishes after the circuit
+    went OPEN -> HALF_OPEN is not mistaken for the probe.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_rate_threshold: float = 0.5,
+                 slow_call_threshold_ms: float = 10000, slow_call_rate_threshold: float = 0.5,
+                 window_size: int = 20, min_calls: int = 5, open_duration_s: float = 30.0,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_threshold_ms = slow_call_threshold_ms
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.open_duration_s = open_duration_s
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._generation = 0
+        # (success, latency_ms) of the most recent calls
+        self._window = deque(maxlen=window_size)
+        # Latencies of successful calls, used for hedge delay estimation
+        self._latencies = deque(maxlen=200)
+        self._times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        """Move OPEN -> HALF_OPEN once the cool-down has elapsed (lock held)"""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_duration_s:
+            self._state = self.HALF_OPEN
+            self._half_open_in_flight = 0
+            self._generation += 1
+
+    def _trip(self):
+        """Open the circuit (lock held)"""
+        if self._state != self.OPEN:
+            self._times_opened += 1
+            logger.warning(f"Circuit breaker '{self.name}' opened")
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._generation += 1
+
+    def admit(self) -> Optional[int]:
+        """Generation to pass to record() if a call may proceed, else None; reserves a probe slot when half-open"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return self._generation
+            if self._state == self.HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                return self._generation
+            return None
+
+    def retry_after(self) -> float:
+        """Seconds until an open circuit will admit a probe"""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.open_duration_s - (time.monotonic() - self._opened_at))
+
+    def record(self, success: bool, latency_ms: float, generation: Optional[int] = None):
+        """Record the outcome of a call admitted in generation (default: the current one) and update state"""
+        slow = latency_ms >= self.slow_call_threshold_ms
+        with self._lock:
+            if success:
+                self._latencies.append(latency_ms)
+            if generation is not None and generation != self._generation:
+                # Started under a state that has since changed; only its latency is kept
+                return
+
+            if self._state == self.HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                if success and not slow:
+                    logger.info(f"Circuit breaker '{self.name}' closed after successful probe")
+                    self._state = self.CLOSED
+                    self._window.clear()
+                else:
+                    self._trip()
+                return
+
+            self._window.append((success, slow))
+            if self._state == self.CLOSED and len(self._window) >= self.min_calls:
+                calls = len(self._window)
+                failures = sum(1 for ok, _ in self._window if not ok)
+                slow_calls = sum(1 for _, is_slow in self._window if is_slow)
+                if (failures / calls >= self.failure_rate_threshold or
+                        slow_calls / calls >= self.slow_call_rate_threshold):
+                    self._trip()
+
+    def latency_samples(self) -> int:
+        """Number of recent successful-call latencies held"""
+        with self._lock:
+            return len(self._latencies)
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        """Latency percentile (ms) over recent successful calls, None without samples"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """State summary for health reporting"""
+        state = self.state
+        with self._lock:
+            calls = len(self._window)
+            failures = sum(1 for ok, _ in self._window if not ok)
+            slow_calls = sum(1 for _, is_slow in self._window if is_slow)
+            times_opened = self._times_opened
+        p95 = self.latency_percentile(95)
+        return {
+            "state": state,
+            "window_calls": calls,
+            "failure_rate": round(failures / calls, 3) if calls else 0.0,
+            "slow_call_rate": round(slow_calls / calls, 3) if calls else 0.0,
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+            "times_opened": times_opened,
+            "retry_after_s": round(self.retry_after(), 1)
+        }
+
+
+class ResilientCaller:
+    """
+    Runs calls through per-action circuit breakers, hedging idempotent reads.
+
+    A hedged call's primary attempt gets its own thread as soon as the call starts,
+    so it never waits behind other calls' hedges; the caller's thread waits for the
+    first usable result. Hedges run on a pool of max_workers threads and are skipped
+    rather than queued when every worker is busy.
+    """
+
+    def __init__(self, breaker_options: Optional[Dict[str, Any]] = None,
+                 hedge_enabled: bool = False, hedge_min_samples: int = 20,
+                 hedge_min_delay_ms: float = 50.0, max_workers: int = 16):
+        self.breaker_options = breaker_options or {}
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay_ms = hedge_min_delay_ms
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sf-hedge")
+        self._hedge_slots = threading.BoundedSemaphore(max_workers)
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        """Get or create the breaker for an action name"""
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(name, **self.breaker_options)
+            return self._breakers[name]
+
+    def hedge_delay_ms(self, name: str) -> Optional[float]:
+        """p95-based delay before sending a hedge, None until enough samples exist"""
+        breaker = self.breaker(name)
+        if breaker.latency_samples() < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay_ms, breaker.latency_percentile(95))
+
+    def call(self, name: str, fn: Callable[[], Any], idempotent: bool = False,
+             is_failure: Callable[[Any], bool] = lambda result: False) -> Any:
+        """
+        Execute fn under the breaker for `name`.
+
+        Exceptions raised by fn and results for which is_failure() is true both count
+        as failures. Raises CircuitOpenError without calling fn while the circuit is open.
+        """
+        breaker = self.breaker(name)
+        generation = breaker.admit()
+        if generation is None:
+            raise CircuitOpenError(name, breaker.retry_after())
+
+        delay_ms = self.hedge_delay_ms(name) if (idempotent and self.hedge_enabled) else None
+        start = time.monotonic()
+        try:
+            if delay_ms is None:
+                result = fn()
+            else:
+                result = self._hedged(fn, delay_ms / 1000.0, is_failure)
+        except Exception:
+            breaker.record(False, (time.monotonic() - start) * 1000, generation)
+            raise
+
+        breaker.record(not is_failure(result), (time.monotonic() - start) * 1000, generation)
+        return result
+
+    def _hedged(self, fn: Callable[[], Any], delay_s: float, is_failure: Callable[[Any], bool]) -> Any:
+        """Send fn, and a second copy if the first has not finished after delay_s"""
+        outcomes = queue.Queue()
+
+        def attempt(tag: str):
+            try:
+                outcomes.put((tag, fn(), None))
+            except Exception as e:
+                outcomes.put((tag, None, e))
+
+        threading.Thread(target=attempt, args=("primary",), name="sf-primary", daemon=True).start()
+        attempts = 1
+        try:
+            outcome = outcomes.get(timeout=delay_s)
+        except queue.Empty:
+            outcome = None
+            if self._hedge_slots.acquire(blocking=False):
+                with self._lock:
+                    self.hedges_sent += 1
+                self._executor.submit(self._run_hedge, attempt)
+                attempts = 2
+
+        last_error = None
+        last_result = None
+        for remaining in range(attempts, 0, -1):
+            tag, result, error = outcome if outcome is not None else outcomes.get()
+            outcome = None
+            if error is not None:
+                last_error = error
+                continue
+            if is_failure(result) and remaining > 1:
+                # Give the other attempt a chance before reporting the failure
+                last_result = result
+                continue
+            if tag == "hedge":
+                with self._lock:
+                    self.hedges_won += 1
+            return result
+        if last_result is not None:
+            return last_result
+        raise last_error
+
+    def _run_hedge(self, attempt: Callable[[str], None]):
+        try:
+            attempt("hedge")
+        finally:
+            self._hedge_slots.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Breaker states and hedge counters for health reporting"""
+        with self._lock:
+            names = list(self._breakers)
+            hedges = {"sent": self.hedges_sent, "won": self.hedges_won, "enabled": self.hedge_enabled}
+        return {
+            "breakers": {name: self.breaker(name).snapshot() for name in names},
+            "hedging": hedges
+        }
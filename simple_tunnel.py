@@ -4,21 +4,40 @@ Simple HTTP tunnel using a public service
 This creates a public URL for your local MCP server
 """
 
+import os
 import requests
 import json
 import time
 import threading
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+from requests.adapters import HTTPAdapter
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Connection-level headers that must not be forwarded by a proxy (RFC 7230 6.1)
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade'
+}
+
 class SimpleTunnel:
-    def __init__(self, local_port=8787):
+    def __init__(self, local_port=8787, connect_timeout=3.05, read_timeout=60.0, pool_size=32,
+                 chunk_size=8192):
         self.local_port = local_port
         self.public_url = None
+        self.upstream_url = f"http://localhost:{local_port}"
+        self.timeout = (connect_timeout, read_timeout)
+        self.chunk_size = chunk_size
+        
+        # One pooled keep-alive session shared by all request threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
         self.app = Flask(__name__)
         self._setup_routes()
     
@@ -35,25 +54,43 @@ class SimpleTunnel:
         
         @self.app.route('/route', methods=['POST'])
         def route():
-            try:
-                # Forward to local MCP server
-                local_url = f"http://localhost:{self.local_port}/route"
-                response = requests.post(local_url, json=request.get_json(), timeout=10)
-                return jsonify(response.json())
-            except Exception as e:
-                logger.error(f"Error forwarding to local server: {e}")
-                return jsonify({"error": str(e)}), 500
+            return self._proxy('/route')
         
         @self.app.route('/analyze', methods=['POST'])
         def analyze():
-            try:
-                # Forward to local MCP server
-                local_url = f"http://localhost:{self.local_port}/analyze"
-                response = requests.post(local_url, json=request.get_json(), timeout=10)
-                return jsonify(response.json())
-            except Exception as e:
-                logger.error(f"Error forwarding to local server: {e}")
-                return jsonify({"error": str(e)}), 500
+            return self._proxy('/analyze')
+    
+    def _proxy(self, path):
+        """Forward the current request upstream and stream the response back unchanged"""
+        headers = {k: v for k, v in request.headers.items()
+                   if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() not in ('host', 'content-length')}
+        try:
+            upstream = self.session.request(
+                request.method,
+                f"{self.upstream_url}{path}",
+                params=request.args,
+                data=request.get_data(),
+                headers=headers,
+                timeout=self.timeout,
+                stream=True
+            )
+        except requests.exceptions.Timeout as e:
+            logger.error(f"Timeout forwarding to local server: {e}")
+            return jsonify({"error": f"Upstream timeout: {e}"}), 504
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error forwarding to local server: {e}")
+            return jsonify({"error": str(e)}), 502
+        
+        # The raw body is passed through still encoded, so Content-Encoding and Content-Length stay valid
+        response_headers = [(k, v) for k, v in upstream.raw.headers.items()
+                            if k.lower() not in HOP_BY_HOP_HEADERS]
+        response = Response(
+            stream_with_context(upstream.raw.stream(self.chunk_size, decode_content=False)),
+            status=upstream.status_code,
+            headers=response_headers
+        )
+        response.call_on_close(upstream.close)
+        return response
     
     def get_public_url(self):
         """Get a public URL using a tunneling service"""
@@ -72,8 +109,13 @@ class SimpleTunnel:
         logger.info(f"Public URL: {self.public_url}")
         logger.info(f"Forwarding to local MCP server on port {self.local_port}")
         
-        self.app.run(host='0.0.0.0', port=port, debug=False)
+        self.app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
 
 if __name__ == "__main__":
-    tunnel = SimpleTunnel()
-    tunnel.run()
+    tunnel = SimpleTunnel(
+        local_port=int(os.getenv('TUNNEL_UPSTREAM_PORT', '8787')),
+        connect_timeout=float(os.getenv('TUNNEL_CONNECT_TIMEOUT', '3.05')),
+        read_timeout=float(os.getenv('TUNNEL_READ_TIMEOUT', '60')),
+        pool_size=int(os.getenv('TUNNEL_POOL_SIZE', '32'))
+    )
+    tunnel.run(port=int(os.getenv('TUNNEL_PORT', '5000')))
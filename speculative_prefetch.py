@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Speculative prefetch of Salesforce action results
+/route starts the action its routed args will need; the /analyze that follows attaches to the in-flight call
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from result_cache import action_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOOLS = ('open_pipe_analyze', 'kpi_analyze')
+
+# Inputs the action only echoes back; /route sees the utterance but the /analyze that
+# follows usually posts the routed args alone
+ECHOED_ARG_KEYS = frozenset({'naturalLanguageQuery'})
+
+
+def speculation_key(action_name: str, args: Dict[str, Any]) -> str:
+    """action_key without echoed inputs, so routed args alone find the speculation"""
+    return action_key(action_name, {k: v for k, v in args.items() if k not in ECHOED_ARG_KEYS})
+
+
+@dataclass
+class _Speculation:
+    tool: str
+    future: Future
+    started_at: float
+    expires_at: float
+
+
+class SpeculativePrefetcher:
+    """
+    TTL table of in-flight speculative calls keyed by canonical action args.
+
+    start() runs a call on a small worker pool unless one is already parked
+    under the same key; claim() hands the future to the first request with
+    matching args and removes it, so each speculative call serves at most one
+    request. Only a call that has started by then counts as a hit. A
+    speculation nobody claims within ttl_s is dropped and counted as wasted.
+    Counters are kept per tool so the tool list and TTL can be tuned.
+    """
+
+    def __init__(self, tools: Iterable[str] = DEFAULT_TOOLS, ttl_s: float = 10.0,
+                 max_workers: int = 4, max_entries: int = 256, clock: Callable[[], float] = time.monotonic):
+        self.tools = frozenset(tools)
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sf-prefetch")
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Speculation] = {}
+        self._counters: Dict[str, Dict[str, float]] = {}
+
+    @classmethod
+    def from_env(cls) -> Optional['SpeculativePrefetcher']:
+        """Build from SF_PREFETCH_* settings, or None unless SF_PREFETCH=true"""
+        if os.getenv('SF_PREFETCH', 'false').lower() != 'true':
+            return None
+        tools = [t.strip() for t in os.getenv('SF_PREFETCH_TOOLS', ','.join(DEFAULT_TOOLS)).split(',') if t.strip()]
+        return cls(tools=tools,
+                   ttl_s=float(os.getenv('SF_PREFETCH_TTL_SECONDS', '10')),
+                   max_workers=int(os.getenv('SF_PREFETCH_WORKERS', '4')))
+
+    def _count(self, tool: str, counter: str, amount: float = 1):
+        """Bump a per-tool counter (lock held)"""
+        counters = self._counters.setdefault(
+            tool, {"started": 0, "hits": 0, "wasted": 0, "duplicates": 0, "dropped": 0, "lead_ms": 0.0})
+        counters[counter] += amount
+
+    def _purge(self, now: float):
+        """Drop expired speculations as wasted (lock held)"""
+        for key in [k for k, s in self._entries.items() if s.expires_at <= now]:
+            self._count(self._entries.pop(key).tool, "wasted")
+
+    def start(self, tool: str, key: str, call: Callable[[], Any]) -> bool:
+        """Run call in the background under key; returns whether a new call was started"""
+        if tool not in self.tools:
+            return False
+        now = self.clock()
+        with self._lock:
+            self._purge(now)
+            if key in self._entries:
+                self._count(tool, "duplicates")
+                return False
+            if len(self._entries) >= self.max_entries:
+                self._count(tool, "dropped")
+                return False
+            self._entries[key] = _Speculation(tool, self._executor.submit(call), now, now + self.ttl_s)
+            self._count(tool, "started")
+        return True
+
+    def claim(self, key: str) -> Optional[Future]:
+        """
+        Take the speculative call for key, if one is live and already running.
+        One still queued is cancelled, counted as wasted, and None is returned so
+        the caller makes the call itself.
+        """
+        now = self.clock()
+        with self._lock:
+            self._purge(now)
+            speculation = self._entries.pop(key, None)
+            if speculation is None:
+                return None
+            if speculation.future.cancel():
+                self._count(speculation.tool, "wasted")
+                return None
+            self._count(speculation.tool, "hits")
+            # How far ahead of the real request the call was started (an upper bound on time saved)
+            self._count(speculation.tool, "lead_ms", (now - speculation.started_at) * 1000)
+        return speculation.future
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._purge(self.clock())
+            tools = {}
+            for tool, counters in self._counters.items():
+                settled = counters["hits"] + counters["wasted"]
+                tools[tool] = {
+                    **{k: v for k, v in counters.items() if k != "lead_ms"},
+                    "hit_rate": round(counters["hits"] / settled, 3) if settled else None,
+                    "avg_lead_ms": round(counters["lead_ms"] / counters["hits"], 1) if counters["hits"] else None
+                }
+            return {
+                "tools": sorted(self.tools),
+                "ttl_s": self.ttl_s,
+                "in_flight": len(self._entries),
+                "per_tool": tools
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
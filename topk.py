@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Top-k selection for limitN and "highest amount" rankings
+Partial sort over NumPy score arrays and a bounded heap for streamed records
+"""
+
+import heapq
+import numpy as np
+from typing import Any, Callable, Iterable, List, Tuple, Union
+
+
+def top_k_indices(scores: np.ndarray, k: int, descending: bool = True) -> np.ndarray:
+    """
+    Indices of the k best scores, best first, ties broken by lower index.
+
+    Same order as a stable full sort truncated to k, but argpartition selects the
+    candidates in O(n) and only those k are sorted. Scores must not contain NaN.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    n = len(scores)
+    k = max(0, min(int(k), n))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    keyed = -scores if descending else scores
+
+    if k < n:
+        threshold = keyed[np.argpartition(keyed, k - 1)[:k]].max()
+        # Everything strictly better than the k-th score, then the lowest-index ties with it
+        below = np.flatnonzero(keyed < threshold)
+        ties = np.flatnonzero(keyed == threshold)[:k - len(below)]
+        candidates = np.concatenate([below, ties])
+    else:
+        candidates = np.arange(n)
+    return candidates[np.lexsort((candidates, keyed[candidates]))]
+
+
+class TopK:
+    """
+    Bounded heap keeping the k best (score, item) pairs seen so far.
+
+    Memory stays O(k) and each push costs O(log k), so ranking n streamed records
+    is O(n log k). Among equal scores the earlier push wins, matching a stable sort.
+    """
+
+    def __init__(self, k: int, descending: bool = True):
+        self.k = max(0, int(k))
+        self.descending = descending
+        self._heap: List[Tuple[Any, int, Any]] = []
+        self._pushed = 0
+
+    def push(self, score: Any, item: Any = None):
+        # heap[0] is the worst kept entry: lowest score, then latest push
+        sequence = self._pushed
+        self._pushed += 1
+        if self.k == 0:
+            return
+        entry = (score if self.descending else -score, -sequence, item)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def items(self) -> List[Tuple[Any, Any]]:
+        """(score, item) pairs, best first"""
+        ordered = sorted(self._heap, key=lambda entry: entry[:2], reverse=True)
+        return [(score if self.descending else -score, item) for score, _, item in ordered]
+
+
+def top_k_records(records: Iterable[Any], k: int, key: Union[str, Callable[[Any], Any]],
+                  descending: bool = True) -> List[Any]:
+    """
+    The k best records from any iterable (e.g. Salesforce query pages), best first.
+
+    key is a field name or a callable; records whose key is None are skipped.
+    """
+    get = key if callable(key) else (lambda record: record.get(key))
+    heap = TopK(k, descending)
+    for record in records:
+        score = get(record)
+        if score is not None:
+            heap.push(score, record)
+    return [record for _, record in heap.items()]
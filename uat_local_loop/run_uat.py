@@ -11,11 +11,48 @@ import time
 import requests
 import argparse
 import os
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
 from datetime import datetime
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from result_cache import ResultCache, routing_key, action_key
+from sf_batching import chunked
+
+def open_pipe_handler_request(args: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    ANAgentOpenPipeAnalysisV3Handler request fields for routed open pipe args.
+    Mirrors the removed AN_OpenPipeV3_FromMCP adapter: country filters on work
+    location, minStage becomes a stage filter, and the product lists go to the
+    include/exclude fields. The handler has no time frame input, so timeFrame is
+    only carried in the natural language query.
+    """
+    request = {
+        'ouName': args.get('ouName'),
+        'groupBy': 'AE',
+        'analysisType': 'AE_SCORE_ANALYSIS',
+        'aggregationType': 'COUNT',
+        'perAENormalize': True,
+        'limitN': int(args.get('limitN', args.get('limit', 10)))
+    }
+    if args.get('country'):
+        request['workLocationCountry'] = args['country']
+    if args.get('minStage') is not None:
+        # Stage names start with their two-digit number ("05 - Negotiating $$ & Mutual Plan")
+        request['filterCriteria'] = f"open_pipe_opty_stg_nm >= '{int(args['minStage']):02d}'"
+    if args.get('productListCsv'):
+        request['includeProductListCsv'] = args['productListCsv']
+    if args.get('excludeProducts'):
+        request['excludeProductListCsv'] = args['excludeProducts']
+    if args.get('negativeIntent'):
+        request['negativeIntent'] = True
+        request['requireNoProductMatch'] = True
+    query = [args.get('text'), f"{args['timeFrame']} time frame" if args.get('timeFrame') else None]
+    if any(query):
+        request['naturalLanguageQuery'] = ', '.join(q for q in query if q)
+    return request
+
 @dataclass
 class TestCase:
     utterance: str
@@ -39,11 +76,50 @@ class TestResult:
     error_message: str = ""
 
 class LocalUATRunner:
-    def __init__(self, mcp_url: str = "http://localhost:8787", sf_base_url: str = None, sf_token: str = None):
+    # Map MCP tools to Apex REST classes
+    APEX_CLASS_MAP = {
+        "open_pipe_analyze": "AN_OpenPipeV3_FromMCP_Simple",
+        "kpi_analyze": "AN_KPI_FromMCP_Simple", 
+        "content_search": "AN_SearchContent_FromMCP_Simple",
+        "sme_search": "AN_SearchSME_FromMCP_Simple",
+        "workflow": "AN_Workflow_FromMCP_Simple",
+        "future_pipeline": "AN_FuturePipeline_FromMCP_Simple"
+    }
+    
+    # Bulk invocable actions used by --batch: (Apex class, input parameter).
+    # A None parameter means the routed args are mapped onto the handler's request
+    # fields by open_pipe_handler_request.
+    BATCH_ACTION_MAP = {
+        "open_pipe_analyze": ("ANAgentOpenPipeAnalysisV3Handler", None),
+        "kpi_analyze": ("AN_KPI_FromMCP", "normalizedArgsJsons"),
+        "content_search": ("AN_SearchContent_FromMCP", "normalizedArgsJsons"),
+        "sme_search": ("AN_SearchSME_FromMCP", "normalizedArgsJsons"),
+        "workflow": ("AN_Workflow_FromMCP", "normalizedArgsJsons"),
+        "future_pipeline": ("AN_FuturePipeline_FromMCP", "normalizedArgsJsons")
+    }
+    
+    # Inputs per invocable action request in --batch mode
+    BATCH_SIZE = 50
+    
+    def __init__(self, mcp_url: str = "http://localhost:8787", sf_base_url: str = None, sf_token: str = None,
+                 cache: Optional[ResultCache] = None, apex_cache_ttl_s: float = 3600):
         self.mcp_url = mcp_url
         self.sf_base_url = sf_base_url
         self.sf_token = sf_token
+        self.cache = cache
+        self.apex_cache_ttl_s = apex_cache_ttl_s
+        self._router_version = None
         self.results: List[TestResult] = []
+    
+    def router_version(self) -> str:
+        """Router version reported by the MCP server, used to scope cached routes"""
+        if self._router_version is None:
+            try:
+                health = requests.get(f"{self.mcp_url}/health", timeout=10).json()
+                self._router_version = str(health.get("router_version", "unknown"))
+            except Exception:
+                self._router_version = "unknown"
+        return self._router_version
         
     def load_test_cases(self, csv_file: str) -> List[TestCase]:
         """Load test cases from CSV"""
@@ -60,7 +136,23 @@ class LocalUATRunner:
         return cases
     
     def test_mcp_route(self, utterance: str) -> tuple[bool, str, Dict[str, Any], float]:
-        """Test MCP /route endpoint"""
+        """Test MCP /route endpoint, replaying cached routes when a cache is configured"""
+        if self.cache is None:
+            return self._post_route(utterance)
+        
+        key = routing_key(f"{self.mcp_url}|{self.router_version()}", utterance)
+        cached = self.cache.get('uat_route', key)
+        if cached is not None:
+            success, tool, args = cached
+            return success, tool, args, 0.0
+        
+        success, tool, args, response_time = self._post_route(utterance)
+        if response_time > 0:  # Only responses actually produced by the server are cached
+            self.cache.put('uat_route', key, [success, tool, args])
+        return success, tool, args, response_time
+    
+    def _post_route(self, utterance: str) -> tuple[bool, str, Dict[str, Any], float]:
+        """POST the utterance to the MCP /route endpoint"""
         try:
             start_time = time.time()
             response = requests.post(
@@ -83,24 +175,29 @@ class LocalUATRunner:
             return False, str(e), {}, 0
     
     def test_apex_call(self, tool: str, args: Dict[str, Any]) -> tuple[bool, str, float]:
-        """Test Apex call via Salesforce REST API"""
+        """Test Apex call via Salesforce REST API, replaying cached successes"""
         if not self.sf_base_url or not self.sf_token:
             return False, "Salesforce not configured", 0
-            
+        
+        if self.cache is None:
+            return self._post_apex(tool, args)
+        
+        key = action_key(f"{self.sf_base_url}|{tool}", args)
+        cached = self.cache.get('uat_apex', key)
+        if cached is not None:
+            return True, cached, 0.0
+        
+        success, response_text, response_time = self._post_apex(tool, args)
+        if success:
+            self.cache.put('uat_apex', key, response_text, ttl_s=self.apex_cache_ttl_s)
+        return success, response_text, response_time
+    
+    def _post_apex(self, tool: str, args: Dict[str, Any]) -> tuple[bool, str, float]:
+        """POST the routed args to the tool's Apex REST endpoint"""
         try:
             start_time = time.time()
             
-            # Map MCP tools to Apex classes
-            apex_class_map = {
-                "open_pipe_analyze": "AN_OpenPipeV3_FromMCP_Simple",
-                "kpi_analyze": "AN_KPI_FromMCP_Simple", 
-                "content_search": "AN_SearchContent_FromMCP_Simple",
-                "sme_search": "AN_SearchSME_FromMCP_Simple",
-                "workflow": "AN_Workflow_FromMCP_Simple",
-                "future_pipeline": "AN_FuturePipeline_FromMCP_Simple"
-            }
-            
-            apex_class = apex_class_map.get(tool)
+            apex_class = self.APEX_CLASS_MAP.get(tool)
             if not apex_class:
                 return False, f"Unknown tool: {tool}", 0
             
@@ -131,6 +228,102 @@ class LocalUATRunner:
         except Exception as e:
             return False, str(e), 0
     
+    def test_apex_calls_batched(self, calls: List[tuple]) -> List[tuple]:
+        """
+        Run many (tool, args) Apex calls with one multi-input invocable action
+        request per tool and chunk. Returns (success, response, time_ms) per call in
+        input order; time_ms is the request time amortized over its inputs.
+        """
+        results: List[Optional[tuple]] = [None] * len(calls)
+        if not self.sf_base_url or not self.sf_token:
+            return [(False, "Salesforce not configured", 0)] * len(calls)
+        
+        # Cached successes never leave the process
+        pending_by_tool: Dict[str, List[int]] = {}
+        for index, (tool, args) in enumerate(calls):
+            if self.cache is not None:
+                cached = self.cache.get('uat_apex', action_key(f"{self.sf_base_url}|{tool}", args))
+                if cached is not None:
+                    results[index] = (True, cached, 0.0)
+                    continue
+            if tool not in self.BATCH_ACTION_MAP:
+                results[index] = (False, f"Unknown tool: {tool}", 0)
+                continue
+            pending_by_tool.setdefault(tool, []).append(index)
+        
+        headers = {
+            'Authorization': f'Bearer {self.sf_token}',
+            'Content-Type': 'application/json'
+        }
+        for tool, indexes in pending_by_tool.items():
+            apex_class, input_param = self.BATCH_ACTION_MAP[tool]
+            endpoint = f"{self.sf_base_url}/services/data/v58.0/actions/custom/apex/{apex_class}"
+            for chunk in chunked(indexes, self.BATCH_SIZE):
+                inputs = [
+                    open_pipe_handler_request(calls[i][1]) if input_param is None
+                    else {input_param: json.dumps(calls[i][1])}
+                    for i in chunk
+                ]
+                start_time = time.time()
+                try:
+                    response = requests.post(endpoint, json={"inputs": inputs}, headers=headers, timeout=60)
+                    response_time = (time.time() - start_time) * 1000 / len(chunk)
+                    if response.status_code != 200:
+                        for i in chunk:
+                            results[i] = (False, f"HTTP {response.status_code}: {response.text}", response_time)
+                        continue
+                    entries = response.json()
+                except Exception as e:
+                    for i in chunk:
+                        results[i] = (False, str(e), 0)
+                    continue
+                
+                # One result entry per input, in input order
+                for i, entry in zip(chunk, entries):
+                    body = json.dumps(entry)
+                    success = bool(entry.get('isSuccess'))
+                    results[i] = (success, body if success else json.dumps(entry.get("errors")), response_time)
+                    if success and self.cache is not None:
+                        self.cache.put('uat_apex', action_key(f"{self.sf_base_url}|{tool}", calls[i][1]), body,
+                                       ttl_s=self.apex_cache_ttl_s)
+        
+        return [r if r is not None else (False, "No result returned for input", 0) for r in results]
+    
+    def run_batched(self, cases: List[TestCase]):
+        """Route every case, then execute the Apex side in multi-input batches"""
+        routed = []
+        for i, case in enumerate(cases, 1):
+            routed.append((i, case) + self.test_mcp_route(case.utterance))
+        
+        calls = [(tool, args) for _, _, success, tool, args, _ in routed if success]
+        apex_results = iter(self.test_apex_calls_batched(calls))
+        print(f"📦 Executed {len(calls)} Apex calls in batches of up to {self.BATCH_SIZE}")
+        
+        for case_id, case, mcp_success, mcp_tool, mcp_args, mcp_time in routed:
+            if mcp_success:
+                apex_success, apex_response, apex_time = next(apex_results)
+            else:
+                apex_success, apex_response, apex_time = False, "", 0
+            overall_success = mcp_success and apex_success
+            if not mcp_success:
+                error_message = f"MCP Error: {mcp_tool}"
+            else:
+                error_message = "" if overall_success else f"Apex Error: {apex_response}"
+            self.results.append(TestResult(
+                case_id=case_id,
+                utterance=case.utterance,
+                description=case.description,
+                mcp_success=mcp_success,
+                mcp_tool=mcp_tool,
+                mcp_args=mcp_args if mcp_success else {},
+                mcp_response_time_ms=mcp_time,
+                apex_success=apex_success,
+                apex_response=apex_response,
+                apex_response_time_ms=apex_time,
+                overall_success=overall_success,
+                error_message=error_message
+            ))
+    
     def run_test_case(self, case_id: int, case: TestCase) -> TestResult:
         """Run a single test case"""
         print(f"🧪 Testing Case {case_id}: {case.description}")
@@ -184,7 +377,7 @@ class LocalUATRunner:
             error_message="" if overall_success else f"Apex Error: {apex_response}"
         )
     
-    def run_uat(self, csv_file: str, filter_tool: str = None, dry_run: bool = False):
+    def run_uat(self, csv_file: str, filter_tool: str = None, dry_run: bool = False, batch: bool = False):
         """Run UAT on all test cases"""
         print("🚀 Starting Local Loop UAT...")
         print(f"   MCP URL: {self.mcp_url}")
@@ -200,6 +393,11 @@ class LocalUATRunner:
         print(f"📋 Running {len(cases)} test cases...")
         print()
         
+        if batch and not dry_run:
+            self.run_batched(cases)
+            self.generate_report()
+            return
+        
         # Run tests
         for i, case in enumerate(cases, 1):
             if dry_run:
@@ -291,6 +489,10 @@ def main():
     parser.add_argument('--filter', help='Filter by tool name (e.g., "open_pipe")')
     parser.add_argument('--dry-run', action='store_true', help='Test MCP only, skip Apex calls')
     parser.add_argument('--cases', default='cases.csv', help='Test cases CSV file')
+    parser.add_argument('--batch', action='store_true',
+                        help='Execute Apex calls as multi-input invocable action requests')
+    parser.add_argument('--cache', default=os.getenv('RESULT_CACHE_PATH'),
+                        help='SQLite result cache path; reruns replay cached routes and Apex results')
     
     args = parser.parse_args()
     
@@ -307,13 +509,15 @@ def main():
     runner = LocalUATRunner(
         mcp_url=args.mcp_url,
         sf_base_url=sf_base_url,
-        sf_token=sf_token
+        sf_token=sf_token,
+        cache=ResultCache(args.cache) if args.cache else None
     )
     
     runner.run_uat(
         csv_file=args.cases,
         filter_tool=args.filter,
-        dry_run=args.dry_run
+        dry_run=args.dry_run,
+        batch=args.batch
     )
 
 if __name__ == "__main__":